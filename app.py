@@ -1,70 +1,185 @@
 import streamlit as st
 import time
 import os
-from google import genai
-import json
 import dotenv
-import joblib
-import pandas as pd
+import hashlib
+import hmac
+import io
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import audit
+import caching
+import chat_context
+import chat_schema
+import inference
+import llm_gateway
+import local_extractor
+import reporting
+import sessions
+import telemetry
+
+# pandas, sleep_model (sklearn / xgboost) et google.genai ne sont importés qu'à la première
+# utilisation ou en arrière-plan : la page de choix du mode s'affiche sans les attendre
+
+dotenv.load_dotenv()
+
+# durée de chaque rerun du script (terminée aussi juste avant st.rerun / st.stop)
+rerun_span = telemetry.span("app.rerun")
+
+
+def rerun():
+    rerun_span.end()
+    st.rerun()
+
+
+def stop():
+    rerun_span.end()
+    st.stop()
+
+
+SPLASH_MAX_WAIT = float(os.environ.get("SLEEPY_SPLASH_MAX_WAIT", "0.5"))
 
 
 @st.cache_resource
-def load_brain():
-    try:
-        return joblib.load('sleep_model_artifacts.pkl')
-    except FileNotFoundError:
-        return None
+def get_warmup_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="sleepy-warmup")
 
 
-artifacts = load_brain()
+@st.cache_resource
+def get_brain_loader():
+    # modèle chargé en arrière-plan dès le premier affichage, une seule fois pour tout le serveur
+    return get_warmup_executor().submit(inference.load_brain)
 
 
-def predict_sleep_disorder(user_data):
-    if artifacts is None:
-        return "Modèle introuvable (fichier .pkl manquant)"
+@st.cache_resource
+def get_client_loader():
+    return get_warmup_executor().submit(reporting.make_client)
+
+
+brain_loader = get_brain_loader()
+client_loader = get_client_loader()
+
+
+def get_brain():
+    if not brain_loader.done():
+        with st.spinner("chargement du modèle..."):
+            return brain_loader.result()
+    return brain_loader.result()
+
+
+def gemini_client():
+    # sans appel Streamlit : utilisable depuis les threads de génération de rapport
+    return client_loader.result()
+
+
+@st.cache_resource
+def get_llm_gateway():
+    # une seule passerelle pour tout le serveur : la limite d'appels simultanés vaut pour toutes les sessions
+    return llm_gateway.LLMGateway(gemini_client)
+
+
+gateway = get_llm_gateway()
+
+
+@st.cache_resource
+def get_prediction_cache():
+    # partagé entre toutes les sessions : même profil -> simple lecture de dictionnaire
+    return caching.LRUCache(maxsize=4096, ttl=24 * 3600)
+
+
+prediction_cache = get_prediction_cache()
+
+
+@st.cache_resource
+def get_predictor():
+    # partagé aussi : l'explicateur (importance globale, contributions) n'est construit qu'une fois
+    return inference.Predictor(get_brain, prediction_cache)
 
-    try:
-        bp = user_data.get('Blood Pressure', '120/80')
-        if '/' in bp:
-            systolic, diastolic = map(int, bp.split('/'))
-        else:
-            systolic, diastolic = 120, 80
-
-        # Préparation du DataFrame pour la prédiction
-        df_input = pd.DataFrame({
-            'Age': [int(user_data.get('Age', 30))],
-            'Gender': [user_data.get('Gender', 'Male')],
-            'Occupation': [user_data.get('Occupation', 'Engineer')],
-            'Sleep Duration': [float(user_data.get('Sleep Duration', 7.0))],
-            'Quality of Sleep': [int(user_data.get('Quality of Sleep', 7))],
-            'Physical Activity Level': [int(user_data.get('Physical Activity Level', 40))],
-            'Stress Level': [int(user_data.get('Stress Level', 5))],
-            'BMI Category': [user_data.get('BMI Category', 'Normal')],
-            'Heart Rate': [int(user_data.get('Heart Rate', 70))],
-            'Daily Steps': [int(user_data.get('Daily Steps', 5000))],
-            'Systolic': [systolic],
-            'Diastolic': [diastolic]
-        })
-
-        pipeline = artifacts['model']
-        le = artifacts['label_encoder']
-
-        pred_code = pipeline.predict(df_input)
-        pred_label = le.inverse_transform(pred_code)[0]
-
-        return pred_label
 
+predictor = get_predictor()
+
+
+def warm_explainer():
+    brain_loader.result()
+    return predictor.explainer()
+
+
+@st.cache_resource
+def get_explainer_loader():
+    # l'explicateur importe xgboost (environ 1 s) : préparé en arrière-plan, prêt avant le premier rapport
+    return get_warmup_executor().submit(warm_explainer)
+
+
+get_explainer_loader()
+
+
+@st.cache_resource
+def get_audit_log():
+    # journal d'audit (audit.py) partagé par les sessions : un seul thread d'écriture ; None si désactivé
+    return audit.from_env()
+
+
+audit_log = get_audit_log()
+
+
+def predict_sleep_disorder(user_data, source=None):
+    # source : diagnostic demandé par l'utilisateur ("form", "chat"), journalisé ; None pour un appel spéculatif
+    start = time.perf_counter()
+    try:
+        prediction = predictor.predict(user_data, observe=source is not None)
+    except inference.ModelMissing as e:
+        return str(e)
     except Exception as e:
         return f"Erreur technique : {str(e)}"
+    if source is not None and audit_log is not None:
+        audit_log.log("prediction", source=source, session=chat_session.id, inputs=user_data, label=prediction,
+                      probabilities=prediction_probabilities(user_data), model_version=predictor.version(),
+                      timings={"predict_ms": (time.perf_counter() - start) * 1000})
+    return prediction
 
 
-dotenv.load_dotenv()
+def prediction_probabilities(user_data):
+    # {classe: probabilité calibrée} ; vide si le modèle n'a pas pu prédire
+    try:
+        return predictor.predict_proba(user_data)
+    except Exception:
+        return {}
+
 
-if "GEMINI_API_KEY" in os.environ:
-    client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
-else:
+def warm_profiles():
+    # profils de population, index des profils similaires (import de scipy) et référence du suivi de la dérive :
+    # chargés en arrière-plan
+    predictor.cohorts()
+    predictor.drift()
+    return predictor.neighbors()
+
+
+@st.cache_resource
+def get_profiles_loader():
+    return get_warmup_executor().submit(warm_profiles)
+
+
+get_profiles_loader()
+
+
+def prediction_similar(user_data):
+    # diagnostics des profils les plus proches du dataset ; None si l'index n'est pas prêt ou absent
+    try:
+        return predictor.similar(user_data, wait=False)
+    except Exception:
+        return None
+
+
+def prediction_cohort(user_data):
+    # profil de population le plus proche ; None si les profils n'ont pas été calculés
+    try:
+        return predictor.cohort(user_data)
+    except Exception:
+        return None
+
+
+if "GEMINI_API_KEY" not in os.environ:
     st.error("La clé API GEMINI_API_KEY n'est pas configurée dans les variables d'environnement.")
-    client = None
 
 st.set_page_config(
     layout="wide",
@@ -279,34 +394,19 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-MODEL_TO_USE = "gemini-flash-latest"
-
-analysis_prompt = """
-Commence IMPÉRATIVEMENT ta réponse par la phrase exacte suivante : 'Bonjour ! Je suis l'assistant Sleepy, et voici le rapport détaillé de votre analyse.'
-
-Agis comme un assistant virtuel expert en hygiène de sommeil. Ta mission est de générer un rapport concis, structuré en exactement trois paragraphes, sans aucune liste à puces, en t'appuyant sur les données patient et le diagnostic prédictif fourni.
-
-**RÈGLE DE TON ET VOCABULAIRE :** Utilise un langage simple, accessible et non-médical. Si tu dois utiliser un mot technique ou complexe (ex: "apnée", "hygiène", "comorbidité"), **tu dois impérativement l'expliquer immédiatement entre parenthèses ( )**.
+MODEL_TO_USE = reporting.MODEL_TO_USE
 
-STRICTE STRUCTURE DE RÉPONSE (3 PARAGRAPHES OBLIGATOIRES) :
+# rapport affiché au fil de la génération ; SLEEPY_STREAM_REPORT=0 pour revenir à l'appel bloquant
+STREAM_REPORT = os.environ.get("SLEEPY_STREAM_REPORT", "1") != "0"
 
-1. PARAGRAPHE D'ANALYSE (Diagnostic et Liens Factuels) :
-    - Confirme clairement le diagnostic ('Healthy', 'Insomnia', 'Sleep Apnea').
-    - Analyse et explique ce résultat en te basant **uniquement** sur les données du patient (Stress Level, Sleep Duration, BMI Category, etc.). Cite explicitement les données clés qui justifient la conclusion. (Ex: "Le diagnostic d'Insomnia est cohérent avec votre niveau de stress élevé (X/10) et votre courte durée de sommeil (Y heures).")
+# rapport lancé en avance dès que la conversation n'a plus de champ manquant
+PREWARM_REPORT = os.environ.get("SLEEPY_PREWARM_REPORT", "1") != "0"
 
-2. PARAGRAPHE DE CONTEXTUALISATION ET D'IMPACT (Signification et Risques) :
-    - Décris brièvement ce que signifie le diagnostic pour la santé quotidienne de l'utilisateur.
-    - Pour 'Insomnia' ou 'Sleep Apnea', indique clairement les risques potentiels associés ou la nécessité de consultation médicale (surtout pour l'Apnée du Sommeil).
+# extraction locale (regex) des messages simples avant tout appel à Gemini ; SLEEPY_LOCAL_EXTRACTION=0 pour désactiver
+LOCAL_EXTRACTION = os.environ.get("SLEEPY_LOCAL_EXTRACTION", "1") != "0"
 
-3. PARAGRAPHE DE RECOMMANDATIONS (Trois Actions Clés) :
-    - Fournis **exactement trois** recommandations concrètes et spécifiques, adaptées au profil du patient et à son diagnostic. Chaque recommandation doit être courte et directement actionable. (Ex: "Augmenter l'activité physique à [X minutes] par jour.")
-
-Adopte un ton professionnel, concis et serviable. Le rapport final doit contenir l'ouverture, les trois paragraphes, et se terminer IMPÉRATIVEMENT par la phrase exacte suivante : 'En espérant que cela puisse vous aider et à vous revoir d'ici peu pour retester !'
-
-Les paragraphes seront de petite taille.
-
-NE JAMAIS inclure la liste des champs ou des exemples dans la réponse finale. Le corps de la réponse ne doit être que du texte formaté selon ces règles.
-"""
+# nombre d'échanges récents renvoyés à Gemini, les plus anciens sont résumés par l'état collecté
+CHAT_MAX_TURNS = int(os.environ.get("SLEEPY_CHAT_TURNS", chat_context.DEFAULT_MAX_TURNS))
 
 chat_prompt = """
 Tu es un assistant IA spécialisé dans la collecte et la structuration de données médicales pour l'analyse du sommeil. **Ton rôle est celui d'un clinicien ou d'un chercheur expert, visant à rendre le processus de collecte d'informations sur le sommeil aussi agréable et rapide que possible.** Ton objectif est de dialoguer avec l'utilisateur pour extraire des informations spécifiques correspondant aux colonnes d'un dataset cible (Sleep_Data_Sampled.csv).
@@ -370,11 +470,25 @@ Règles de comportement avancées :
 Commence l'analyse dès le premier message de l'utilisateur.
 """
 
-if "messages" not in st.session_state:
-    st.session_state["messages"] = []
 
-if "chat_history" not in st.session_state:
-    st.session_state["chat_history"] = []
+@st.cache_resource
+def get_session_store():
+    # transcripts et rapports de toutes les sessions, avec un budget mémoire par session
+    return sessions.SessionStore(
+        os.environ.get("SLEEPY_SESSION_DIR", sessions.SESSIONS_DIR),
+        budget=int(os.environ.get("SLEEPY_SESSION_BUDGET", sessions.DEFAULT_BUDGET)),
+        resident_turns=max(2 * CHAT_MAX_TURNS, sessions.DEFAULT_RESIDENT_TURNS),
+        idle_timeout=float(os.environ.get("SLEEPY_SESSION_IDLE_TIMEOUT", sessions.DEFAULT_IDLE_TIMEOUT)))
+
+
+session_store = get_session_store()
+
+# st.session_state ne garde que l'identifiant : la conversation (messages, historique envoyé à Gemini,
+# tokens consommés, issue de la lecture de chaque réponse) et le rapport sont dans session_store
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = session_store.new_id()
+
+chat_session = session_store.get(st.session_state["session_id"])
 
 if "extracted_data" not in st.session_state:
     st.session_state["extracted_data"] = None
@@ -391,14 +505,37 @@ if "selected_mode" not in st.session_state:
 if "show_report" not in st.session_state:
     st.session_state["show_report"] = False
 
-if "report_content" not in st.session_state:
-    st.session_state["report_content"] = ""
-
 if "prediction_result" not in st.session_state:
     st.session_state["prediction_result"] = ""
 
+if "prediction_probabilities" not in st.session_state:
+    st.session_state["prediction_probabilities"] = {}
+
+if "prediction_cohort" not in st.session_state:
+    st.session_state["prediction_cohort"] = None
+
+if "prediction_similar" not in st.session_state:
+    st.session_state["prediction_similar"] = None
+
+# rapport à générer en streaming dans la modale : (user_data, prédiction)
+if "pending_report" not in st.session_state:
+    st.session_state["pending_report"] = None
+
+# rapport lancé en arrière-plan (Future), récupéré à l'ouverture de la modale
+if "report_future" not in st.session_state:
+    st.session_state["report_future"] = None
 
-def call_gemini_chat(user_message: str) -> dict:
+if "report_timings" not in st.session_state:
+    st.session_state["report_timings"] = {}
+
+if "scored_csv" not in st.session_state:
+    # dernier fichier CSV analysé : (empreinte du fichier et version du modèle, lignes, erreurs, CSV produit)
+    st.session_state["scored_csv"] = None
+
+
+def call_gemini_chat(user_turn, hints=None) -> dict:
+    user_message = user_turn.text
+    client = gemini_client()
     if client is None:
         return {
             "user_interaction": {"message_to_user": "La fonction est désactivée car la clé API est manquante.",
@@ -409,49 +546,43 @@ def call_gemini_chat(user_message: str) -> dict:
         }
 
     try:
-        gemini_messages = []
-
-        for msg in st.session_state["chat_history"]:
-            gemini_messages.append({
-                "role": msg["role"],
-                "parts": [{"text": msg["content"]}]
-            })
-
-        gemini_messages.append({
-            "role": "user",
-            "parts": [{"text": user_message}]
-        })
-
-        response = client.models.generate_content(
-            model=MODEL_TO_USE,
-            contents=gemini_messages,
-            config={
-                "temperature": 0.2,
-                "response_mime_type": "application/json",
-                "system_instruction": chat_prompt
-            }
-        )
-
-        response_text = response.text
-        data = json.loads(response_text)
-
-        st.session_state["chat_history"].append({
-            "role": "user",
-            "content": user_message
-        })
-        st.session_state["chat_history"].append({
-            "role": "model",
-            "content": response_text
-        })
-
-        if "data_extraction" in data:
-            st.session_state["extracted_data"] = data["data_extraction"]
+        # prompt système + état fusionné + derniers échanges seulement : la taille reste stable
+        gemini_messages, system_instruction = chat_context.build_chat_request(
+            chat_prompt, chat_session.chat_history(), st.session_state["extracted_data"], user_message,
+            local_extractor.FIELDS, max_turns=CHAT_MAX_TURNS, archived_messages=chat_session.archived_history,
+            hints=hints)
+
+        with telemetry.span("chat.gemini"):
+            response = gateway.generate(
+                model=MODEL_TO_USE,
+                contents=gemini_messages,
+                config={
+                    "temperature": 0.2,
+                    "response_mime_type": "application/json",
+                    "system_instruction": system_instruction
+                }
+            )
+
+        # bloc ```json, texte parasite ou JSON tronqué sont réparés ; les valeurs invalides sont
+        # retirées et redemandées seules, sans nouvel appel
+        with telemetry.span("chat.parse"):
+            data, parse_status = chat_schema.parse_chat_response(response.text, st.session_state["extracted_data"])
+
+        # issue de la lecture : ok, repaired, invalid_fields, unparseable
+        user_turn.usage = {**chat_context.token_usage(response, gemini_messages, system_instruction),
+                           "parse_status": parse_status}
+        telemetry.record_tokens("chat", user_turn.usage["prompt_tokens"], user_turn.usage["response_tokens"])
+        telemetry.count("chat_turns_total", source="gemini", parse_status=parse_status)
+        # l'échange entre dans l'historique renvoyé à Gemini (la réponse est ajoutée par l'appelant)
+        user_turn.in_history = True
 
         return data
 
     except Exception as e:
         print(e)
-        st.error(f"Erreur lors de l'appel à Gemini: {str(e)}")
+        # Gemini saturé ou indisponible : message courtois, sans afficher l'erreur brute
+        if not isinstance(e, llm_gateway.LLMError):
+            st.error(f"Erreur lors de l'appel à Gemini: {str(e)}")
         return {
             "user_interaction": {
                 "message_to_user": "Désolé, une erreur s'est produite. Pouvez-vous reformuler votre message ?",
@@ -466,36 +597,120 @@ def call_gemini_chat(user_message: str) -> dict:
         }
 
 
-def call_gemini_analysis(user_data, ai_prediction=None):
-    if client is None:
-        return "La fonction est désactivée car la clé API est manquante."
+def local_chat_turn(user_turn, new_fields: dict) -> dict:
+    # tour de conversation traité sans Gemini ; l'historique reste cohérent pour les appels suivants
+    data = local_extractor.local_reply(st.session_state["extracted_data"], new_fields)
+    user_turn.in_history = True
+    telemetry.count("chat_turns_total", source="local")
+    return data
 
-    try:
-        prediction_text = f"Le modèle prédictif (XGBoost) a diagnostiqué : {ai_prediction}" if ai_prediction else "Le modèle prédictif n'a pas été exécuté."
 
-        data_text = f"""
-Données du patient : {user_data}
+@st.cache_resource
+def get_report_cache():
+    # rapports déjà générés, persistés sur disque et partagés entre les sessions
+    return caching.ReportCache(os.environ.get("SLEEPY_REPORT_CACHE", ".cache/reports.sqlite"))
 
-{prediction_text}
 
-Consigne :
-1. Respecte STRICTEMENT la structure de 3 paragraphes définie dans la System Instruction.
-2. Explique le résultat en te basant sur les données (Stress, IMC, Tension...).
-3. Donne 3 recommandations concrètes.
-"""
-        response = client.models.generate_content(
-            model=MODEL_TO_USE,
-            contents=[{"role": "user", "parts": [{"text": data_text}]}],
-            config={
-                "temperature": 0.2,
-                "system_instruction": analysis_prompt
-            }
-        )
-        return response.text
+report_cache = get_report_cache()
+
+
+def explain_if_ready(user_data, ai_prediction):
+    # rapport sans facteurs plutôt qu'une attente si l'explicateur est encore en préparation
+    return predictor.explain(user_data, ai_prediction, wait=False)
+
+
+reporter = reporting.ReportGenerator(gateway, report_cache, explain=explain_if_ready,
+                                     probabilities=predictor.predict_proba, similar=prediction_similar)
+call_gemini_analysis = reporter.call_gemini_analysis
+stream_gemini_analysis = reporter.stream_gemini_analysis
+
+
+@st.cache_resource
+def get_report_executor():
+    # pool partagé : les rapports tournent pendant que Streamlit continue d'afficher la page
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="sleepy-report")
+
+
+report_executor = get_report_executor()
 
-    except Exception as e:
-        return f"Erreur lors de l'analyse : {str(e)}"
 
+def audit_report(source, session_id, user_data, ai_prediction, report, timings):
+    # sans appel Streamlit : utilisable depuis les threads de génération de rapport
+    if audit_log is not None:
+        audit_log.log("report", source=source, session=session_id, inputs=user_data, label=ai_prediction,
+                      report=report, model_version=predictor.version(), timings=timings)
+
+
+def generate_report(user_data, ai_prediction, source, session_id):
+    start = time.perf_counter()
+    report = call_gemini_analysis(user_data, ai_prediction)
+    if source is not None:
+        audit_report(source, session_id, user_data, ai_prediction, report,
+                     {"total_ms": (time.perf_counter() - start) * 1000})
+    return report
+
+
+def start_report(user_data, ai_prediction=None, source=None):
+    # copie des données : la session peut continuer à modifier son dictionnaire ;
+    # source : rapport demandé par l'utilisateur, journalisé (None pour une requête spéculative)
+    return report_executor.submit(generate_report, dict(user_data), ai_prediction, source, chat_session.id)
+
+
+def prewarm_report(user_data):
+    # requête spéculative : le vrai appel retrouvera le rapport en cache ou en cours (single-flight)
+    if gemini_client() is None or any(user_data.get(field) is None for field in local_extractor.FIELDS):
+        return None
+    return start_report(user_data, predict_sleep_disorder(user_data))
+
+
+@st.cache_resource
+def get_metrics():
+    # jauges lues à chaque export : taux de réussite des caches, passerelle Gemini, mémoire des sessions
+    telemetry.register("prediction_cache", prediction_cache.stats)
+    telemetry.register("report_cache", report_cache.stats)
+    telemetry.register("llm_gateway", gateway.stats)
+    telemetry.register("reports", reporter.stats)
+    telemetry.register("sessions", session_store.stats)
+    telemetry.register("drift", predictor.drift_stats)
+    if audit_log is not None:
+        telemetry.register("audit", audit_log.stats)
+    # /metrics au format Prometheus sur un port à part (Streamlit n'expose pas de route HTTP)
+    port = os.environ.get("SLEEPY_METRICS_PORT")
+    return telemetry.serve(int(port)) if port else None
+
+
+get_metrics()
+
+ADMIN_TOKEN = os.environ.get("SLEEPY_ADMIN_TOKEN")
+
+# page d'administration cachée : ?admin=<SLEEPY_ADMIN_TOKEN>, désactivée sans jeton
+if ADMIN_TOKEN and hmac.compare_digest(st.query_params.get("admin", ""), ADMIN_TOKEN):
+    st.markdown('<p class="extra-bold" style="font-size: 2rem;">MESURES</p>', unsafe_allow_html=True)
+    if st.toggle("mesures détaillées (durée des phases, tokens)", value=telemetry.enabled()) != telemetry.enabled():
+        telemetry.enable(not telemetry.enabled())
+        rerun()
+    if st.button("remettre à zéro"):
+        telemetry.reset()
+
+    snapshot = telemetry.snapshot()
+    st.markdown("### Durée des phases")
+    st.dataframe([{"phase": phase, **values} for phase, values in snapshot["phases"].items()],
+                 use_container_width=True)
+    st.markdown("### Compteurs")
+    st.json(snapshot["counters"])
+    drift_monitor = predictor.drift(wait=False)
+    if drift_monitor is not None:
+        drift_scores = drift_monitor.scores()
+        st.markdown(f"### Dérive des entrées ({drift_scores['samples']} profils, {drift_scores['status']})")
+        st.dataframe([{"feature": feature, **{key: value for key, value in values.items() if key != "unknown"}}
+                      for feature, values in drift_scores["features"].items()], use_container_width=True)
+        st.json({feature: values["unknown"] for feature, values in drift_scores["features"].items()
+                 if values.get("unknown")}, expanded=False)
+    st.markdown("### Caches, passerelle et sessions")
+    st.json(snapshot["gauges"], expanded=False)
+    st.download_button("télécharger au format Prometheus", telemetry.render(), file_name="metrics.txt",
+                       mime="text/plain")
+    stop()
 
 # Page de chargement
 if not st.session_state["app_loaded"]:
@@ -537,9 +752,11 @@ if not st.session_state["app_loaded"]:
         </style>
         """, unsafe_allow_html=True)
 
-    time.sleep(1)
+    # plus d'attente fixe : on laisse au chargement en arrière-plan au plus SPLASH_MAX_WAIT secondes,
+    # la page de choix du mode n'a de toute façon pas besoin du modèle
+    wait([brain_loader, client_loader], timeout=SPLASH_MAX_WAIT)
     st.session_state["app_loaded"] = True
-    st.rerun()
+    rerun()
 
 # Page de sélection du mode
 if not st.session_state["mode_selected"]:
@@ -571,7 +788,7 @@ if not st.session_state["mode_selected"]:
                      help="Conversation guidée"):
             st.session_state["mode_selected"] = True
             st.session_state["selected_mode"] = "conversation"
-            st.rerun()
+            rerun()
 
     with col2:
         st.markdown("""
@@ -589,9 +806,9 @@ if not st.session_state["mode_selected"]:
         if st.button(" Aller à la saisie manuelle ", key="form_mode", use_container_width=True, help="Saisie manuelle"):
             st.session_state["mode_selected"] = True
             st.session_state["selected_mode"] = "formulaire"
-            st.rerun()
+            rerun()
 
-    st.stop()
+    stop()
 
 col_logo, col_back = st.columns([5, 1])
 
@@ -623,7 +840,7 @@ with col_back:
     if st.button("← Changer de mode", use_container_width=True):
         st.session_state["mode_selected"] = False
         st.session_state["selected_mode"] = None
-        st.rerun()
+        rerun()
 
 
 # Modal pour le rapport
@@ -638,8 +855,40 @@ def show_report_modal():
     elif st.session_state['prediction_result'] == "Sleep Apnea":
         st.error("Attention : consultation médicale recommandée")
 
+    probabilities = st.session_state["prediction_probabilities"]
+    if st.session_state['prediction_result'] in probabilities:
+        st.caption("confiance du modèle : " + reporting.format_probabilities(probabilities))
+        if reporting.triage(st.session_state['prediction_result'], probabilities) == 'uncertain':
+            st.info("Le modèle hésite entre plusieurs diagnostics : à confirmer avec un professionnel de santé.")
+    if st.session_state["prediction_similar"] is not None:
+        st.caption(reporting.format_similar(st.session_state["prediction_similar"]))
+    if st.session_state["prediction_cohort"] is not None:
+        st.caption(reporting.format_cohort(st.session_state["prediction_cohort"]))
+
     st.divider()
-    st.markdown(st.session_state["report_content"])
+
+    if st.session_state["pending_report"] is not None:
+        user_data, prediction = st.session_state["pending_report"]
+        timings = {}
+        chat_session.set_report(st.write_stream(stream_gemini_analysis(user_data, prediction, timings)))
+        audit_report("form", chat_session.id, user_data, prediction, chat_session.report(),
+                     {"first_token_ms": timings.get("time_to_first_token", 0) * 1000,
+                      "total_ms": timings.get("total_time", 0) * 1000} if timings else {})
+        session_store.compact(chat_session)
+        st.session_state["report_timings"] = timings
+        st.session_state["pending_report"] = None
+    else:
+        if st.session_state["report_future"] is not None:
+            with st.spinner("génération du rapport détaillé..."):
+                chat_session.set_report(st.session_state["report_future"].result())
+            session_store.compact(chat_session)
+            st.session_state["report_future"] = None
+        st.markdown(chat_session.report())
+
+    timings = st.session_state["report_timings"]
+    if "time_to_first_token" in timings and "total_time" in timings:
+        st.caption(f"premiers mots après {timings['time_to_first_token']:.1f} s, "
+                   f"rapport complet en {timings['total_time']:.1f} s")
 
 
 if st.session_state.get("show_report", False):
@@ -689,14 +938,48 @@ if st.session_state["selected_mode"] == "formulaire":
             "Heart Rate": heart_rate, "Daily Steps": daily_steps
         }
 
-        with st.spinner("analyse en cours..."):
-            pred_ia = predict_sleep_disorder(user_data)
-            report = call_gemini_analysis(user_data, pred_ia)
-
+        pred_ia = predict_sleep_disorder(user_data, source="form")
         st.session_state["prediction_result"] = pred_ia
-        st.session_state["report_content"] = report
+        st.session_state["prediction_probabilities"] = prediction_probabilities(user_data)
+        st.session_state["prediction_cohort"] = prediction_cohort(user_data)
+        st.session_state["prediction_similar"] = prediction_similar(user_data)
+        st.session_state["report_timings"] = {}
+
+        chat_session.set_report("")
+        if STREAM_REPORT:
+            # la modale s'ouvre tout de suite avec le diagnostic, le rapport arrive au fil de l'eau
+            st.session_state["pending_report"] = (user_data, pred_ia)
+        else:
+            # le rapport se génère pendant le rerun et l'ouverture de la modale
+            st.session_state["report_future"] = start_report(user_data, pred_ia, source="form")
+
         st.session_state["show_report"] = True
-        st.rerun()
+        rerun()
+
+    with st.expander("analyser un fichier CSV complet"):
+        st.caption("mêmes colonnes que Sleep_Data_Sampled.csv, une ligne par patient")
+        uploaded_csv = st.file_uploader("fichier CSV", type="csv")
+
+        artifacts = get_brain()[0] if uploaded_csv is not None else None
+
+        if artifacts is not None:
+            import sleep_model
+
+            # chaque interaction relance le script : le fichier n'est analysé qu'une fois
+            key = (hashlib.sha256(uploaded_csv.getvalue()).hexdigest(), artifacts.get("version"))
+            if st.session_state["scored_csv"] is None or st.session_state["scored_csv"][0] != key:
+                with st.spinner("prédiction du fichier en cours..."):
+                    scored_csv = io.StringIO()
+                    n_rows, n_errors = sleep_model.score_csv(uploaded_csv, scored_csv, artifacts)
+                st.session_state["scored_csv"] = (key, n_rows, n_errors, scored_csv.getvalue())
+            _, n_rows, n_errors, scored_text = st.session_state["scored_csv"]
+
+            st.success(f"{n_rows - n_errors} lignes analysées")
+            if n_errors:
+                st.warning(f"{n_errors} ligne(s) illisible(s), sans prédiction : "
+                           f"voir la colonne '{sleep_model.ERROR_COLUMN}' du fichier")
+            st.download_button("télécharger les prédictions", scored_text,
+                               file_name="predictions.csv", mime="text/csv")
 
 elif st.session_state["selected_mode"] == "conversation":
     st.markdown('<p class="extra-bold" style="font-size: 2rem;">CONVERSATION AVEC L\'ASSISTANT</p>',
@@ -706,7 +989,13 @@ elif st.session_state["selected_mode"] == "conversation":
     chat_container = st.container(height=380, border=True)
 
     with chat_container:
-        for message in st.session_state["messages"]:
+        if chat_session.archived_turns:
+            # anciens messages déchargés sur disque : relus seulement si l'utilisateur les demande
+            if st.toggle(f"afficher les {chat_session.archived_turns} messages plus anciens", key="show_archived"):
+                for turn in chat_session.archived():
+                    with st.chat_message(turn.role):
+                        st.markdown(turn.text)
+        for message in chat_session.messages():
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
@@ -714,57 +1003,70 @@ elif st.session_state["selected_mode"] == "conversation":
                                key="user_message_chat")
 
     if user_input:
-        st.session_state["messages"].append({"role": "user", "content": user_input})
+        user_turn = chat_session.append("user", user_input)
         with chat_container:
             with st.chat_message("user"):
                 st.markdown(user_input)
 
-        with st.spinner("l'assistant réfléchit..."):
-            response_data = call_gemini_chat(user_input)
+        if st.session_state["extracted_data"] is None:
+            st.session_state["extracted_data"] = {}
+
+        local_fields, fully_parsed = local_extractor.extract(user_input) if LOCAL_EXTRACTION else ({}, False)
+        if fully_parsed:
+            st.session_state["extracted_data"].update(local_fields)
+            response_data = local_chat_turn(user_turn, local_fields)
+        else:
+            # message compris en partie : les champs repérés ne sont que des indices pour Gemini
+            with st.spinner("l'assistant réfléchit..."):
+                response_data = call_gemini_chat(user_turn, hints=local_fields)
 
         assistant_message = response_data.get("user_interaction", {}).get("message_to_user", "je n'ai pas compris")
         new_extracted_data = response_data.get("data_extraction", {})
 
-        if st.session_state["extracted_data"] is None:
-            st.session_state["extracted_data"] = {}
-
         for key, value in new_extracted_data.items():
             if value is not None:
                 st.session_state["extracted_data"][key] = value
 
-        st.session_state["messages"].append({"role": "assistant", "content": assistant_message})
+        ready_for_analysis = response_data.get("metadata", {}).get("ready_for_analysis", False)
+        missing_fields = response_data.get("user_interaction", {}).get("missing_fields")
+
+        # réponse gardée une seule fois : affichée telle quelle, recompactée pour l'historique de Gemini
+        chat_session.append("assistant", assistant_message, missing_fields or [], in_history=user_turn.in_history)
+        session_store.compact(chat_session)
+
+        if PREWARM_REPORT and missing_fields == [] and not ready_for_analysis:
+            prewarm_report(st.session_state["extracted_data"])
 
         with chat_container:
             with st.chat_message("assistant"):
                 st.markdown(assistant_message)
 
-        if response_data.get("metadata", {}).get("ready_for_analysis", False):
+        if ready_for_analysis:
             st.success("toutes les données sont collectées ! lancement du diagnostic...")
 
             final_data = st.session_state["extracted_data"]
 
             with st.status("analyse du modèle neuronal...", expanded=True) as status:
                 st.write("préparation des données...")
-                time.sleep(0.5)
 
-                prediction_ia = predict_sleep_disorder(final_data)
+                prediction_ia = predict_sleep_disorder(final_data, source="chat")
+                # le rapport démarre dès que la prédiction est connue et tourne pendant l'affichage
+                st.session_state["report_future"] = start_report(final_data, prediction_ia, source="chat")
 
                 st.write(f"**diagnostic : {prediction_ia}**")
                 status.update(label="diagnostic terminé", state="complete", expanded=False)
 
-            with st.spinner("génération du rapport détaillé..."):
-                analysis_report = call_gemini_analysis(final_data, prediction_ia)
-
             st.session_state["prediction_result"] = prediction_ia
-            st.session_state["report_content"] = analysis_report
+            st.session_state["prediction_probabilities"] = prediction_probabilities(final_data)
+            st.session_state["prediction_cohort"] = prediction_cohort(final_data)
+            st.session_state["prediction_similar"] = prediction_similar(final_data)
+            chat_session.set_report("")
             st.session_state["show_report"] = True
 
             final_response_text = f"le diagnostic est prêt ! cliquez sur le bouton ci-dessous pour consulter le rapport complet"
 
-            st.session_state["messages"].append({
-                "role": "assistant",
-                "content": final_response_text
-            })
+            chat_session.append("assistant", final_response_text)
+            session_store.compact(chat_session)
 
             with chat_container:
                 with st.chat_message("assistant"):
@@ -772,7 +1074,9 @@ elif st.session_state["selected_mode"] == "conversation":
 
             if st.button("voir le rapport complet", use_container_width=True, type="primary"):
                 st.session_state["show_report"] = True
-                st.rerun()
+                rerun()
 
             with st.expander("voir les données utilisées"):
                 st.json(final_data)
+
+rerun_span.end()
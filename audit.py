@@ -0,0 +1,313 @@
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+# journal d'audit des prédictions et des rapports (entrées, diagnostic, version du modèle, durées), pour le suivi
+# et le réentraînement. log() ne fait que déposer l'événement dans une file bornée : un thread l'écrit en JSON
+# Lines, par lots (une écriture et un flush par lot, fsync au plus toutes les FSYNC_INTERVAL secondes), change de
+# fichier au-delà de MAX_BYTES et peut compresser les anciens fichiers en gzip.
+#
+# File pleine : 'drop' (défaut) perd l'événement et le compte, la requête n'attend jamais ; 'block' attend
+# au plus BLOCK_TIMEOUT secondes qu'une place se libère.
+#
+#   python audit.py summary                  # événements par type, source, diagnostic et version du modèle
+#   python audit.py export -o audit.parquet
+
+AUDIT_PATH = 'logs/requests.jsonl'
+MAX_QUEUE = 10_000
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.5
+FSYNC_INTERVAL = 5.0
+MAX_BYTES = 64 * 1024 * 1024
+BLOCK_TIMEOUT = 1.0
+POLICIES = ('drop', 'block')
+
+
+class _Flush:
+    # marqueur déposé dans la file : le thread le signale une fois tout ce qui le précède écrit et synchronisé
+
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_CLOSE = object()
+
+
+class AuditLog:
+
+    def __init__(self, path=AUDIT_PATH, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 fsync_interval=FSYNC_INTERVAL, max_bytes=MAX_BYTES, compress=False, policy='drop',
+                 block_timeout=BLOCK_TIMEOUT):
+        if policy not in POLICIES:
+            raise ValueError(f"politique '{policy}' inconnue ({', '.join(POLICIES)})")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(max_queue)
+        self._file = None
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self.logged = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='sleepy-audit', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, event, **fields):
+        # appelé dans le chemin de la requête : pas d'écriture ni de sérialisation ici ; les dictionnaires sont
+        # copiés, l'appelant peut les modifier ensuite (st.session_state)
+        record = {'ts': time.time(), 'event': event}
+        for key, value in fields.items():
+            record[key] = dict(value) if isinstance(value, dict) else value
+        try:
+            if self.policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.logged += 1
+        return True
+
+    def flush(self, timeout=None) -> bool:
+        # attend que les événements déjà déposés soient écrits et synchronisés sur disque
+        if not self._thread.is_alive():
+            return False
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # rien de neuf : fsync des dernières lignes une fois l'intervalle écoulé
+                self._sync(force=False)
+                continue
+            batch, markers, closing = [], [], False
+            while True:
+                if item is _CLOSE:
+                    closing = True
+                elif isinstance(item, _Flush):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if closing or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            if markers or closing:
+                self._sync(force=True)
+            for marker in markers:
+                marker.done.set()
+            if closing:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, batch):
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            # une seule écriture pour tout le lot (group commit)
+            self._file.write(''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n'
+                                     for record in batch))
+            self._file.flush()
+            self._unsynced = True
+            self.written += len(batch)
+            self.batches += 1
+            self._sync(force=False)
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception as e:
+            # le journal ne doit jamais faire tomber l'application : lot perdu, compté
+            self.errors += 1
+            print(f"journal d'audit : {len(batch)} événements perdus ({e})")
+
+    def _sync(self, force):
+        if not self._unsynced or self._file is None:
+            return
+        if force or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+            self._last_fsync = time.monotonic()
+            self.fsyncs += 1
+
+    def _rotate(self):
+        self._sync(force=True)
+        self._file.close()
+        self._file = None
+        base, extension = os.path.splitext(self.path)
+        stamp, n = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()), 0
+        # numéro : plusieurs rotations dans la même seconde, ou redémarrage juste après une rotation
+        rotated = f'{base}.{stamp}.{n}{extension}'
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            n += 1
+            rotated = f'{base}.{stamp}.{n}{extension}'
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(rotated + '.gz.tmp', rotated + '.gz')
+            os.remove(rotated)
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'logged': self.logged,
+            'dropped': self.dropped,
+            'written': self.written,
+            'batches': self.batches,
+            'fsyncs': self.fsyncs,
+            'rotations': self.rotations,
+            'errors': self.errors,
+        }
+
+
+def from_env(per_process=False):
+    # SLEEPY_AUDIT_LOG : chemin du journal, vide ou '0' pour le désactiver ; per_process : un fichier par
+    # processus (workers uvicorn), pour que deux processus n'écrivent ni ne changent jamais le même fichier
+    path = os.environ.get('SLEEPY_AUDIT_LOG', AUDIT_PATH)
+    if path in ('', '0'):
+        return None
+    if per_process:
+        base, extension = os.path.splitext(path)
+        path = f'{base}.{os.getpid()}{extension}'
+    return AuditLog(path, max_bytes=int(os.environ.get('SLEEPY_AUDIT_MAX_BYTES', MAX_BYTES)),
+                    compress=os.environ.get('SLEEPY_AUDIT_COMPRESS', '0') == '1',
+                    policy=os.environ.get('SLEEPY_AUDIT_POLICY', 'drop'))
+
+
+def log_files(path=AUDIT_PATH) -> list:
+    # fichier courant, fichiers par processus et anciens fichiers (compressés ou non), du plus ancien au plus récent
+    directory, name = os.path.split(path)
+    stem = os.path.splitext(name)[0]
+    directory = directory or '.'
+    if not os.path.isdir(directory):
+        return []
+    files = [os.path.join(directory, file) for file in os.listdir(directory)
+             if (file == name or file.startswith(stem + '.')) and file.endswith(('.jsonl', '.jsonl.gz'))]
+    return sorted(files, key=os.path.getmtime)
+
+
+def iter_records(path=AUDIT_PATH):
+    for file in log_files(path):
+        opener = gzip.open if file.endswith('.gz') else open
+        with opener(file, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # dernière ligne en cours d'écriture, ou fichier tronqué par un arrêt brutal
+                    continue
+
+
+def iter_frames(path=AUDIT_PATH, event=None, chunk_size=100_000):
+    # DataFrames successifs de chunk_size événements au plus ; les dictionnaires (entrées, probabilités, durées)
+    # sont aplatis en colonnes "inputs.Age", "timings.predict_ms"...
+    import pandas as pd
+
+    def frame(records):
+        df = pd.json_normalize(records)
+        df['ts'] = pd.to_datetime(df['ts'], unit='s', utc=True)
+        return df
+
+    records = []
+    for record in iter_records(path):
+        if event is not None and record.get('event') != event:
+            continue
+        records.append(record)
+        if len(records) >= chunk_size:
+            yield frame(records)
+            records = []
+    if records:
+        yield frame(records)
+
+
+def read(path=AUDIT_PATH, event=None):
+    import pandas as pd
+
+    frames = list(iter_frames(path, event))
+    if not frames:
+        return pd.DataFrame(columns=['ts', 'event'])
+    return pd.concat(frames, ignore_index=True).sort_values('ts', kind='stable', ignore_index=True)
+
+
+def summary(df) -> dict:
+    result = {'events': len(df)}
+    if not len(df):
+        return result
+    result['first'] = str(df['ts'].min())
+    result['last'] = str(df['ts'].max())
+    for column in ('event', 'source', 'label', 'model_version'):
+        if column in df.columns:
+            result[column] = {str(key): int(n) for key, n in df[column].value_counts(dropna=False).items()}
+    for column in sorted(column for column in df.columns if column.startswith('timings.')):
+        values = df[column].dropna()
+        if len(values):
+            result[column] = {'p50': float(values.quantile(0.5)), 'p90': float(values.quantile(0.9)),
+                              'max': float(values.max())}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Journal d'audit des prédictions et des rapports")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summary_parser = subparsers.add_parser('summary', help="événements par type, source, diagnostic et version")
+    export_parser = subparsers.add_parser('export', help="tout le journal dans un fichier CSV ou Parquet")
+    export_parser.add_argument('-o', '--output', required=True)
+    for subparser in (summary_parser, export_parser):
+        subparser.add_argument('--log', default=os.environ.get('SLEEPY_AUDIT_LOG') or AUDIT_PATH)
+        subparser.add_argument('--event', default=None, help="'prediction', 'prediction_batch' ou 'report'")
+
+    args = parser.parse_args(argv)
+    df = read(args.log, args.event)
+    if args.command == 'summary':
+        print(json.dumps(summary(df), indent=2, ensure_ascii=False))
+        return 0
+
+    if args.output.endswith(('.parquet', '.pq')):
+        # colonnes mêlant nombres et texte (entrées extraites par le chat) : en texte pour Parquet
+        df.astype({column: str for column in df.columns if df[column].dtype == object}).to_parquet(args.output)
+    else:
+        df.to_csv(args.output, index=False)
+    print(f"{len(df)} événements -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
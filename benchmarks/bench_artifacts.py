@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# même profil utilisateur que le formulaire par défaut
+USER_DATA = {
+    'Gender': 'Male', 'Age': 30, 'Occupation': 'Engineer', 'Sleep Duration': 7.0, 'Quality of Sleep': 7,
+    'Physical Activity Level': 40, 'Stress Level': 5, 'BMI Category': 'Normal', 'Blood Pressure': '120/80',
+    'Heart Rate': 70, 'Daily Steps': 5000,
+}
+
+
+def rss_mb():
+    import resource
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def child(kind):
+    # exécuté dans un processus neuf, comme un nouveau worker
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    start = time.perf_counter()
+    import sleep_model
+    import_time = time.perf_counter() - start
+    rss_after_import = rss_mb()
+
+    start = time.perf_counter()
+    if kind == 'pickle':
+        artifacts = sleep_model.load_artifacts(sleep_model.ARTIFACTS_PATH)
+    else:
+        artifacts = sleep_model.load_compact(sleep_model.COMPACT_PATH)
+    predictor = sleep_model.FastPredictor.from_artifacts(artifacts)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prediction = predictor.predict(USER_DATA)
+    first_prediction = time.perf_counter() - start
+
+    print(json.dumps({
+        'import_s': import_time,
+        'load_s': load_time,
+        'first_prediction_s': first_prediction,
+        'rss_after_import_mb': rss_after_import,
+        'peak_rss_mb': rss_mb(),
+        'prediction': prediction,
+        'xgboost_imported': 'xgboost' in sys.modules,
+        'sklearn_imported': 'sklearn' in sys.modules,
+    }))
+
+
+def artifact_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du chargement des artefacts : pickle vs format compact")
+    parser.add_argument('--child', choices=['pickle', 'compact'], help=argparse.SUPPRESS)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child)
+        return
+
+    sys.path.insert(0, ROOT)
+    import sleep_model
+
+    results = {}
+    for kind, path in [('pickle', sleep_model.ARTIFACTS_PATH), ('compact', sleep_model.COMPACT_PATH)]:
+        runs = []
+        for _ in range(args.runs):
+            process = subprocess.run([sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--child', kind],
+                                     cwd=ROOT, capture_output=True, text=True, check=True)
+            runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+
+        median = {
+            key: sorted(run[key] for run in runs)[len(runs) // 2]
+            for key in ('load_s', 'first_prediction_s', 'rss_after_import_mb', 'peak_rss_mb')
+        }
+        median['artifact_kb'] = artifact_size(os.path.join(ROOT, path)) / 1024
+        median['rss_for_model_mb'] = median['peak_rss_mb'] - median['rss_after_import_mb']
+        results[kind] = {'median': median, 'runs': runs}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_schema  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chat_responses_corpus.jsonl')
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def strict_parse(text):
+    # comportement d'origine : json.loads sur toute la réponse, l'utilisateur doit renvoyer son message sinon
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def timed(function, argument, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def run(corpus, repeat=200):
+    strict_failures = Counter()
+    tolerant_failures = Counter()
+    wrong = []
+    invalid_caught = 0
+    invalid_expected = 0
+    parse_times = []
+    validate_times = []
+
+    for row in corpus:
+        if strict_parse(row['text']) is None:
+            strict_failures[row['kind']] += 1
+
+        data, parse_time = timed(chat_schema.extract_json, row['text'], repeat)
+        parse_times.append(parse_time)
+        if data is None:
+            tolerant_failures[row['kind']] += 1
+
+        (clean, errors), validate_time = timed(chat_schema.validate_extraction, (data or {}).get('data_extraction'),
+                                               repeat)
+        validate_times.append(validate_time)
+
+        invalid_expected += len(row['invalid'])
+        invalid_caught += len(set(errors) & set(row['invalid']))
+        if (data is not None) != row['parseable'] or clean != row['expected'] or sorted(errors) != sorted(row['invalid']):
+            wrong.append({'kind': row['kind'], 'expected': row['expected'], 'got': clean, 'errors': errors})
+
+    n = len(corpus)
+    # un message à renvoyer par l'utilisateur = un aller-retour Gemini de plus
+    strict_retries = sum(strict_failures.values())
+    tolerant_retries = sum(tolerant_failures.values())
+    return {
+        'responses': n,
+        'by_kind': dict(Counter(row['kind'] for row in corpus)),
+        'parse_failures_before': strict_retries,
+        'parse_failures_before_by_kind': dict(strict_failures),
+        'parse_failures_after': tolerant_retries,
+        'parse_failures_after_by_kind': dict(tolerant_failures),
+        'parse_retry_rate_before': strict_retries / n,
+        'parse_retry_rate_after': tolerant_retries / n,
+        'invalid_values_caught': f"{invalid_caught}/{invalid_expected}",
+        'wrong_results': wrong,
+        'extract_mean_us': sum(parse_times) / n * 1e6,
+        'validate_mean_us': sum(validate_times) / n * 1e6,
+        'validate_max_us': max(validate_times) * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la lecture et de la validation des réponses du chat")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run(load_corpus(args.corpus)), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
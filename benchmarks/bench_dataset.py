@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# chargement du dataset : pd.read_csv (texte, tension redécoupée par chaque consommateur) contre
+# le CSV lu avec les types compacts et contre le magasin Parquet de dataset.py
+
+
+def rss_mb():
+    import resource
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def load(kind, path):
+    import pandas as pd
+
+    import dataset
+    import sleep_model
+
+    if kind == 'read_csv':
+        df = pd.read_csv(path)
+        return df.join(sleep_model.split_blood_pressure(df['Blood Pressure']))
+    return dataset.load(path, store=(kind == 'store'))
+
+
+def child(kind, path, repeat):
+    # exécuté dans un processus neuf : premier chargement d'une analyse ou d'un réentraînement
+    sys.path.insert(0, ROOT)
+    import dataset  # noqa: F401
+    import sleep_model  # noqa: F401
+    rss_after_import = rss_mb()
+
+    start = time.perf_counter()
+    df = load(kind, path)
+    first_load = time.perf_counter() - start
+    peak_rss = rss_mb()
+
+    warm = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load(kind, path)
+        warm.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        'first_load_s': first_load,
+        'warm_load_s': sorted(warm)[len(warm) // 2],
+        'rows': len(df),
+        'frame_mb': df.memory_usage(deep=True).sum() / 1e6,
+        'rss_for_load_mb': peak_rss - rss_after_import,
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du chargement du dataset : CSV contre magasin Parquet")
+    parser.add_argument('--child', choices=['read_csv', 'typed_csv', 'store'], help=argparse.SUPPRESS)
+    parser.add_argument('--data', default=None, help="CSV à charger (par défaut : Sleep_Data_Sampled.csv)")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5, help="chargements répétés dans le même processus")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT)
+    import dataset
+
+    path = os.path.abspath(args.data or os.path.join(ROOT, dataset.DATASET_PATH))
+    if args.child:
+        child(args.child, path, args.repeat)
+        return
+
+    results = {'csv_kb': os.path.getsize(path) / 1024}
+    if not dataset.is_fresh(path):
+        start = time.perf_counter()
+        dataset.ingest(path)
+        results['ingest_s'] = time.perf_counter() - start
+    results['store_kb'] = os.path.getsize(dataset.store_path(path)) / 1024
+
+    for kind in ('read_csv', 'typed_csv', 'store'):
+        runs = []
+        for _ in range(args.runs):
+            process = subprocess.run([sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--child', kind,
+                                      '--data', path, '--repeat', str(args.repeat)],
+                                     cwd=ROOT, capture_output=True, text=True, check=True)
+            runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+        results[kind] = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import caching  # noqa: E402
+import dataset  # noqa: E402
+import drift  # noqa: E402
+import inference  # noqa: E402
+import sleep_model  # noqa: E402
+
+# suivi de la dérive : surcoût sur Predictor.predict (profils déjà en cache, le cas le plus rapide), coût d'un
+# ajout aux histogrammes, et scores sur des profils tirés du dataset (pas de dérive attendue) puis déformés
+# comme le seraient des saisies du chat (âges hors plage, nuits très courtes, professions inconnues)
+
+
+def predict_latency(predictor, rows, repeat):
+    latencies = []
+    for i in range(repeat):
+        user_data = rows[i % len(rows)]
+        start = time.perf_counter()
+        predictor.predict(user_data)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {f'p{p}_us': latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e6 for p in (50, 90)}
+
+
+def shifted(rows, rng):
+    # un profil sur trois déformé
+    rows = [dict(row) for row in rows]
+    for row in rows[::3]:
+        row['Age'] = int(rng.integers(60, 90))
+        row['Sleep Duration'] = float(rng.choice([0.5, 2.0, 3.5, 11.0]))
+        row['Occupation'] = str(rng.choice(['Chef', 'Student', 'Retired', 'Developer', 'Pilot']))
+    return rows
+
+
+def scores(reference, rows):
+    monitor = drift.DriftMonitor(reference)
+    for row in rows:
+        monitor.observe(sleep_model.canonical_features(row))
+    result = monitor.scores()
+    return {'samples': result['samples'], 'max_psi': result['max_psi'], 'status': result['status'],
+            'psi': {column: round(values['psi'], 4) for column, values in result['features'].items()},
+            'unknown_rate': {column: values['unknown_rate'] for column, values in result['features'].items()
+                             if 'unknown_rate' in values}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du suivi de la dérive des entrées")
+    parser.add_argument('--artifacts', default=None)
+    parser.add_argument('--data', default=dataset.DATASET_PATH)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    artifacts = sleep_model.load_artifacts(args.artifacts)
+    if artifacts is None:
+        print("ERREUR : modèle introuvable.", file=sys.stderr)
+        return 1
+    brain = (artifacts, sleep_model.FastPredictor.from_artifacts(artifacts))
+    # tirage au hasard : le CSV est trié, ses premières lignes ne sont pas représentatives
+    rows = dataset.load(args.data).sample(args.rows, random_state=0).to_dict(orient='records')
+
+    start = time.perf_counter()
+    reference = drift.reference(args.data)
+    results = {'reference_s': time.perf_counter() - start}
+
+    predictor = inference.Predictor(lambda: brain, caching.LRUCache())
+    predict_latency(predictor, rows, len(rows))
+    results['predict_without_monitor'] = predict_latency(predictor, rows, args.repeat)
+    predictor._optional['drift'] = drift.DriftMonitor(reference)
+    results['predict_with_monitor'] = predict_latency(predictor, rows, args.repeat)
+
+    monitor = drift.DriftMonitor(reference)
+    features = [sleep_model.canonical_features(row) for row in rows]
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        monitor.observe(features[i % len(features)])
+    monitor.fold()
+    results['observe_us'] = (time.perf_counter() - start) / args.repeat * 1e6
+
+    results['same_distribution'] = scores(reference, rows)
+    results['shifted'] = scores(reference, shifted(rows, np.random.default_rng(0)))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sleep_model  # noqa: E402
+
+# coût des explications (contributions XGBoost regroupées sur les 12 features) :
+# TreeSHAP exact contre approximation de Saabas, unitaire et par lot, et vérification que
+# les contributions + le biais redonnent bien la marge du modèle
+
+USER_DATA = {
+    'Gender': 'Male', 'Age': 30, 'Occupation': 'Engineer', 'Sleep Duration': 7.0, 'Quality of Sleep': 7,
+    'Physical Activity Level': 40, 'Stress Level': 5, 'BMI Category': 'Normal', 'Blood Pressure': '120/80',
+    'Heart Rate': 70, 'Daily Steps': 5000,
+}
+
+
+def percentiles(values):
+    values = sorted(values)
+    return {f'p{p}_ms': values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 for p in (50, 90, 99)}
+
+
+def single_row(explainer, rows, repeat):
+    latencies = []
+    for i in range(repeat):
+        user_data = rows[i % len(rows)]
+        start = time.perf_counter()
+        explainer.explain(user_data)
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def batch(explainer, df):
+    start = time.perf_counter()
+    explanations = explainer.explain_frame(df)
+    elapsed = time.perf_counter() - start
+    return {'rows': len(df), 'rows_per_s': len(df) / elapsed, 'ms_per_row': elapsed / len(df) * 1000}, explanations
+
+
+def additivity_error(explainer, df):
+    # la somme des contributions (biais compris) doit redonner la marge de chaque classe
+    x = explainer.predictor.encode_frame(df)
+    raw = explainer.raw_contributions(x)
+    margin = explainer.predictor.booster.predict(xgboost.DMatrix(x), output_margin=True)
+    return float(np.abs(raw.sum(axis=-1) - margin).max())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark des explications de prédiction")
+    parser.add_argument('--artifacts', default=None)
+    parser.add_argument('--csv', default=sleep_model.DATASET_PATH)
+    parser.add_argument('--rows', type=int, default=2000, help="lignes du CSV utilisées pour le lot")
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    artifacts = sleep_model.load_artifacts(args.artifacts)
+    predictor = sleep_model.FastPredictor.from_artifacts(artifacts)
+    df = pd.read_csv(args.csv, nrows=args.rows)
+    rows = df.to_dict(orient='records')
+    expected = sleep_model.predict_batch(df, artifacts).to_numpy()
+
+    start = time.perf_counter()
+    explainer = sleep_model.Explainer(predictor)
+    build_time = time.perf_counter() - start
+
+    results = {'build_s': build_time, 'global_importance': explainer.global_importance,
+               'example': explainer.explain(USER_DATA)}
+    for name, approximate in [('exact', False), ('approximate', True)]:
+        explainer.approximate = approximate
+        batch_result, explanations = batch(explainer, df)
+        results[name] = {
+            'single_row': single_row(explainer, rows, args.repeat),
+            'batch': batch_result,
+            'additivity_max_error': additivity_error(explainer, df),
+            'prediction_mismatches': int((explanations[sleep_model.PREDICTION_COLUMN].to_numpy() != expected).sum()),
+        }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import caching  # noqa: E402
+import llm_gateway  # noqa: E402
+import reporting  # noqa: E402
+
+# appels Gemini simulés sous charge : appels directs (comportement d'origine) contre passerelle.
+# le faux client reproduit un service saturé : latence variable, 429 / 503 aléatoires,
+# quelques appels qui restent bloqués, et une limite de requêtes simultanées côté serveur.
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} erreur simulée")
+        self.code = code
+
+
+class FakeModels:
+    def __init__(self, latency, error_rate, hang_rate, hang_time, capacity, outage=False):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+        self.capacity = capacity
+        self.outage = outage
+        self.active = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config):
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            overloaded = self.active > self.capacity
+        try:
+            if self.outage:
+                time.sleep(self.latency / 10)
+                raise FakeAPIError(503)
+            if overloaded:
+                # au-delà de sa capacité, le serveur répond 429 immédiatement
+                raise FakeAPIError(429)
+            draw = random.random()
+            if draw < self.hang_rate:
+                time.sleep(self.hang_time)
+            else:
+                time.sleep(random.lognormvariate(0, 0.4) * self.latency)
+            if random.random() < self.error_rate:
+                raise FakeAPIError(random.choice([429, 500, 503]))
+            return SimpleNamespace(text="Bonjour ! Rapport simulé.")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {f'p{p}_s': values[min(len(values) - 1, int(len(values) * p / 100))] for p in (50, 90, 99)}
+
+
+def run(call, n_calls, concurrency):
+    latencies = []
+    outcomes = {'ok': 0, 'fallback': 0, 'error': 0}
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        outcome = call(i)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            outcomes[outcome] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n_calls)))
+    return {'wall_s': time.perf_counter() - start, **outcomes, **percentiles(latencies)}
+
+
+def scenario(args, outage=False):
+    def fake_client():
+        return SimpleNamespace(models=FakeModels(args.latency, args.error_rate, args.hang_rate, args.hang_time,
+                                                 args.capacity, outage))
+
+    request = reporting.analysis_request("Données du patient : {}")
+
+    # avant : appel bloquant direct, sans échéance ni nouvelle tentative
+    direct_client = fake_client()
+
+    def direct(i):
+        try:
+            direct_client.models.generate_content(**request)
+            return 'ok'
+        except Exception:
+            return 'error'
+
+    # après : passerelle partagée + rapport de secours
+    gateway_client = fake_client()
+    gateway = llm_gateway.LLMGateway(lambda: gateway_client, max_in_flight=args.max_in_flight,
+                                     deadline=args.deadline, attempt_timeout=args.attempt_timeout,
+                                     backoff=args.backoff)
+    reporter = reporting.ReportGenerator(gateway, caching.LRUCache(maxsize=1))
+    reporter.cache.single_flight = caching.SingleFlight()
+
+    def through_gateway(i):
+        report = reporter.call_gemini_analysis({'Age': i}, 'Healthy')
+        return 'fallback' if report == reporting.fallback_report({'Age': i}, 'Healthy') else 'ok'
+
+    return {
+        'direct': {**run(direct, args.calls, args.concurrency), 'upstream_requests': direct_client.models.requests},
+        'gateway': {**run(through_gateway, args.calls, args.concurrency),
+                    'upstream_requests': gateway_client.models.requests, **gateway.stats()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la passerelle Gemini avec un faux client")
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=64, help="sessions simultanées")
+    parser.add_argument('--latency', type=float, default=0.2, help="latence médiane simulée (s)")
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--hang-rate', type=float, default=0.02, help="part d'appels qui restent bloqués")
+    parser.add_argument('--hang-time', type=float, default=20.0)
+    parser.add_argument('--capacity', type=int, default=32, help="requêtes simultanées acceptées par le faux serveur")
+    parser.add_argument('--max-in-flight', type=int, default=24)
+    parser.add_argument('--deadline', type=float, default=10.0)
+    parser.add_argument('--attempt-timeout', type=float, default=1.5)
+    parser.add_argument('--backoff', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    print(json.dumps({
+        'degraded': scenario(args),
+        'outage': scenario(args, outage=True),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
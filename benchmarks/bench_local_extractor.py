@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import local_extractor  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extractor_corpus.jsonl')
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(corpus, llm_latency, repeat=200):
+    handled_locally = 0
+    wrong_local = 0
+    fields_expected = 0
+    fields_found = 0
+    extraction_times = []
+    turn_times = []
+    failures = []
+
+    for row in corpus:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fields, fully_parsed = local_extractor.extract(row['text'])
+        extraction_time = (time.perf_counter() - start) / repeat
+        extraction_times.append(extraction_time)
+
+        fields_expected += len(row['fields'])
+        fields_found += sum(fields.get(key) == value for key, value in row['fields'].items())
+
+        if fully_parsed:
+            handled_locally += 1
+            turn_times.append(extraction_time)
+            if fields != row['fields']:
+                wrong_local += 1
+                failures.append({'text': row['text'], 'expected': row['fields'], 'got': fields})
+        else:
+            # message transmis à Gemini : extraction locale + aller-retour LLM
+            turn_times.append(extraction_time + llm_latency)
+
+    n = len(corpus)
+    return {
+        'messages': n,
+        'llm_calls_avoided': handled_locally,
+        'llm_calls_avoided_rate': handled_locally / n,
+        'wrong_local_answers': wrong_local,
+        'field_recall': fields_found / fields_expected if fields_expected else 1.0,
+        'extraction_mean_us': sum(extraction_times) / n * 1e6,
+        'extraction_max_us': max(extraction_times) * 1e6,
+        'simulated_llm_latency_s': llm_latency,
+        'turn_latency_before_s': llm_latency,
+        'turn_latency_after_s': sum(turn_times) / n,
+        'failures': failures,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de l'extracteur local de la conversation")
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--llm-latency', type=float, default=1.5, help="latence simulée d'un appel Gemini (s)")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run(load_corpus(args.corpus), args.llm_latency), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
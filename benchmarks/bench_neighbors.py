@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset  # noqa: E402
+import neighbors  # noqa: E402
+import sleep_model  # noqa: E402
+
+# profils similaires : arbre k-d (neighbors.py) contre un parcours complet des lignes à chaque requête,
+# construction de l'index, latence par requête et identité des résultats
+
+
+def percentiles(values):
+    values = sorted(values)
+    return {f'p{p}_ms': values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 for p in (50, 90, 99)}
+
+
+def brute_force(index, x, k):
+    distances = np.sqrt(((index.points - x) ** 2).sum(axis=1))
+    nearest = np.argpartition(distances, k - 1)[:k]
+    return distances[nearest], index.labels[nearest]
+
+
+def timed_queries(query, points):
+    latencies, results = [], []
+    for x in points:
+        start = time.perf_counter()
+        results.append(query(x))
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies), results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de l'index des profils similaires")
+    parser.add_argument('--data', default=sleep_model.DATASET_PATH)
+    parser.add_argument('--artifacts', default=None)
+    parser.add_argument('--k', type=int, default=neighbors.DEFAULT_K)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--added', type=int, default=1000, help="lignes ajoutées au tampon pour la mesure 'add'")
+    args = parser.parse_args(argv)
+
+    predictor = sleep_model.FastPredictor.from_artifacts(sleep_model.load_artifacts(args.artifacts))
+    encoding = predictor.encoding()
+
+    start = time.perf_counter()
+    index = neighbors.build(encoding, args.data)
+    results = {'rows': len(index), 'build_s': time.perf_counter() - start}
+
+    rows = dataset.load(sleep_model.DATASET_PATH).sample(args.queries, random_state=0)
+    points = [encoding.encode(sleep_model.canonical_features(row)) for row in rows.to_dict('records')]
+
+    results['tree'], tree_results = timed_queries(lambda x: index.query(x, args.k), points)
+    results['brute_force'], brute_results = timed_queries(lambda x: brute_force(index, x, args.k), points)
+    # mêmes distances (les étiquettes peuvent différer entre voisins à égalité de distance)
+    results['max_distance_error'] = max(float(abs(np.sort(a[0]) - np.sort(b[0])).max())
+                                        for a, b in zip(tree_results, brute_results))
+
+    start = time.perf_counter()
+    index.add(rows.head(args.added))
+    results['add'] = {'rows': min(args.added, len(rows)), 'duration_s': time.perf_counter() - start,
+                      'pending': int(len(index.pending_labels))}
+    results['tree_with_pending'], _ = timed_queries(lambda x: index.query(x, args.k), points)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_context  # noqa: E402
+import sessions  # noqa: E402
+
+# mémoire occupée par des sessions de conversation simulées : ancienne représentation (listes de dictionnaires
+# dans st.session_state, texte de l'utilisateur en double) contre sessions.SessionStore, avec et sans budget
+
+USER_MESSAGE = "Je dors environ {i} heures par nuit, je me réveille souvent et je suis assez stressé au travail."
+ASSISTANT_MESSAGE = ("Merci, c'est noté ! Passons maintenant à votre activité physique : combien de minutes "
+                     "par jour bougez-vous, et combien de pas faites-vous environ ? ({i})")
+MISSING_FIELDS = ["Physical Activity Level", "Daily Steps", "Heart Rate", "Blood Pressure"]
+REPORT = ("**Diagnostic : Insomnia** (confiance du modèle : 87 %). Votre durée de sommeil et votre niveau de "
+          "stress sont les facteurs les plus déterminants. ") * 40
+
+
+def usage(i):
+    return {'estimated_prompt_tokens': 1200 + i, 'prompt_tokens': 1180 + i, 'response_tokens': 90,
+            'total_tokens': 1270 + i, 'history_messages': 8}
+
+
+def legacy_session(turns):
+    # ancienne représentation : messages affichés + historique Gemini + métriques + rapport
+    state = {'messages': [], 'chat_history': [], 'chat_token_usage': [], 'chat_parse_status': [],
+             'report_content': REPORT}
+    for i in range(turns):
+        user, reply = USER_MESSAGE.format(i=i), ASSISTANT_MESSAGE.format(i=i)
+        state['messages'].append({'role': 'user', 'content': user})
+        state['messages'].append({'role': 'assistant', 'content': reply})
+        state['chat_history'].append({'role': 'user', 'content': user})
+        state['chat_history'].append({'role': 'model', 'content': chat_context.compact_model_reply(
+            {'user_interaction': {'message_to_user': reply, 'missing_fields': MISSING_FIELDS}})})
+        state['chat_token_usage'].append(usage(i))
+        state['chat_parse_status'].append('ok')
+    return state
+
+
+def fill_session(store, session, turns):
+    for i in range(turns):
+        user_turn = session.append('user', USER_MESSAGE.format(i=i))
+        user_turn.usage = {**usage(i), 'parse_status': 'ok'}
+        user_turn.in_history = True
+        session.append('assistant', ASSISTANT_MESSAGE.format(i=i), MISSING_FIELDS, in_history=True)
+        store.compact(session)
+    session.set_report(REPORT)
+    store.compact(session)
+
+
+def measure(build, n_sessions):
+    # octets alloués (tracemalloc) pour n_sessions sessions gardées en vie
+    tracemalloc.start()
+    kept = [build(i) for i in range(n_sessions)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return {'bytes_per_session': allocated / n_sessions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la mémoire des sessions")
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=40, help="échanges (message + réponse) par session")
+    parser.add_argument('--budget', type=int, default=sessions.DEFAULT_BUDGET)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='sleepy-sessions-')
+    try:
+        results = {'sessions': args.sessions, 'turns': args.turns,
+                   'legacy': measure(lambda i: legacy_session(args.turns), args.sessions)}
+        for name, budget in [('store_unbounded', float('inf')), ('store_budget', args.budget)]:
+            store = sessions.SessionStore(os.path.join(directory, name), budget=budget)
+
+            def build(i):
+                session = store.get(f'{name}-{i}')
+                fill_session(store, session, args.turns)
+                return session
+
+            results[name] = measure(build, args.sessions)
+            stats = store.stats()
+            # coût de la tenue de la session (mesure + déchargement), hors tracemalloc
+            start = time.perf_counter()
+            build(args.sessions)
+            results[name]['ms_per_turn'] = (time.perf_counter() - start) / args.turns * 1000
+            results[name].update({'estimated_bytes_per_session': stats['bytes_per_session'],
+                                  'archived_turns': stats['archived_turns'],
+                                  'archived_reports': stats['archived_reports'], 'disk': stats['disk']})
+
+        # éviction des sessions inactives puis reprise : l'historique envoyé à Gemini doit être identique
+        store = sessions.SessionStore(os.path.join(directory, 'eviction'), budget=args.budget, idle_timeout=0)
+        session = store.get('eviction')
+        fill_session(store, session, args.turns)
+        history, report = session.chat_history(), session.report()
+        store._last_housekeeping = 0
+        store.housekeeping(time.time() + 1)
+        restored = store.get('eviction')
+        results['eviction'] = {'evicted': store.evictions, 'restored': store.restored,
+                               'same_history': restored.chat_history() == history,
+                               'same_report': restored.report() == report,
+                               'archived_turns': len(restored.archived())}
+    finally:
+        shutil.rmtree(directory)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+
+HEAVY_MODULES = ['pandas', 'numpy', 'joblib', 'sklearn', 'xgboost', 'google.genai']
+
+
+def child():
+    # exécuté dans un processus neuf (démarrage à froid) sous "python -X importtime"
+    from streamlit.testing.v1 import AppTest
+
+    start = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+
+    at.run()
+    first_paint = time.perf_counter() - start
+    heavy_at_first_paint = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    at.run()
+    interactive = time.perf_counter() - start
+
+    at.button(key='form_mode').click().run()
+    at.button[-1].click().run()
+    first_prediction = time.perf_counter() - start
+
+    print(json.dumps({
+        'first_paint_s': first_paint,
+        'mode_selection_s': interactive,
+        'first_prediction_s': first_prediction,
+        'prediction': at.session_state['prediction_result'],
+        # importés pendant le premier rendu (dont ceux déjà chargés par le thread de préchauffage)
+        'heavy_modules_loaded_at_first_paint': heavy_at_first_paint,
+    }))
+
+
+def parse_importtime(stderr, top=15):
+    # lignes "import time: self [us] | cumulative | module" ; on garde les imports de premier niveau
+    modules = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)", line)
+        if match and not match.group(3):
+            modules.append((match.group(4), int(match.group(2))))
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return {
+        'total_top_level_import_s': sum(cumulative for _, cumulative in modules) / 1e6,
+        'slowest_imports': [{'module': name, 'cumulative_s': cumulative / 1e6} for name, cumulative in modules[:top]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid de l'application")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child()
+        return
+
+    env = dict(os.environ, SLEEPY_REPORT_CACHE=os.path.join(ROOT, '.cache', 'bench_reports.sqlite'))
+    env.pop('GEMINI_API_KEY', None)
+
+    runs = []
+    for _ in range(args.runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child'],
+                                 cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        result['importtime'] = parse_importtime(process.stderr)
+        runs.append(result)
+
+    summary = {
+        key: sorted(run[key] for run in runs)[len(runs) // 2]
+        for key in ('first_paint_s', 'mode_selection_s', 'first_prediction_s')
+    }
+    print(json.dumps({'median': summary, 'runs': runs}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import caching  # noqa: E402
+import inference  # noqa: E402
+import sleep_model  # noqa: E402
+import telemetry  # noqa: E402
+
+# surcoût de l'instrumentation : coût d'un span vide, désactivé et activé, puis latence de
+# Predictor.predict (cache désactivé, donc modèle à chaque appel) avec et sans mesures
+
+
+def span_cost(repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with telemetry.span("bench"):
+            pass
+    return (time.perf_counter() - start) / repeat * 1e9
+
+
+def predict_latency(predictor, rows, repeat):
+    latencies = []
+    for i in range(repeat):
+        user_data = rows[i % len(rows)]
+        start = time.perf_counter()
+        predictor.predict(user_data)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {f'p{p}_us': latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e6 for p in (50, 90)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du surcoût des mesures (telemetry)")
+    parser.add_argument('--artifacts', default=None)
+    parser.add_argument('--csv', default=sleep_model.DATASET_PATH)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3000)
+    args = parser.parse_args(argv)
+
+    artifacts = sleep_model.load_artifacts(args.artifacts)
+    if artifacts is None:
+        print("ERREUR : modèle introuvable.", file=sys.stderr)
+        return 1
+    brain = (artifacts, sleep_model.FastPredictor.from_artifacts(artifacts))
+    predictor = inference.Predictor(lambda: brain, cache=caching.LRUCache(maxsize=0))
+    rows = pd.read_csv(args.csv, nrows=args.rows).to_dict(orient='records')
+    predict_latency(predictor, rows, 200)
+
+    results = {}
+    for name, flag in [('disabled', False), ('enabled', True)]:
+        telemetry.enable(flag)
+        telemetry.reset()
+        results[name] = {'span_ns': span_cost(args.repeat * 100),
+                         'predict': predict_latency(predictor, rows, args.repeat)}
+    results['phases'] = telemetry.snapshot()['phases']
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
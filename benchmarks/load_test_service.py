@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# test de charge du service HTTP (service.py) avec un faux client Gemini local :
+# le serveur tourne dans un sous-processus (uvicorn, N workers), la charge vient de plusieurs
+# processus clients asynchrones pour que le client ne soit pas le goulot d'étranglement
+
+
+class StubModels:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config):
+        time.sleep(self.latency)
+        return SimpleNamespace(text="Bonjour ! Rapport de test.", usage_metadata=None)
+
+    def generate_content_stream(self, model, contents, config):
+        for word in ["Bonjour ! ", "Rapport ", "de test."]:
+            time.sleep(self.latency / 3)
+            yield SimpleNamespace(text=word)
+
+
+def stub_app():
+    # fabrique appelée par uvicorn dans chaque worker du serveur
+    import service
+
+    stub = SimpleNamespace(models=StubModels(float(os.environ.get("SLEEPY_STUB_LATENCY", "0.5"))))
+    return service.create_app(client_source=lambda: stub)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def load_profiles(n):
+    import pandas as pd
+    import sleep_model
+
+    df = pd.read_csv(os.path.join(ROOT, sleep_model.DATASET_PATH), nrows=n)
+    return [{field: row[field] for field in sleep_model.INPUT_FIELDS} for row in df.to_dict('records')]
+
+
+def request_body(endpoint, profiles, i, batch_size):
+    if endpoint == '/predict/batch':
+        start = (i * batch_size) % len(profiles)
+        return {"records": (profiles[start:] + profiles[:start])[:batch_size]}
+    return {"user_data": profiles[i % len(profiles)]}
+
+
+async def post(reader, writer, endpoint, body):
+    # client HTTP/1.1 minimal (connexion persistante) : bien plus léger qu'httpx,
+    # pour mesurer le serveur et non le générateur de charge
+    payload = json.dumps(body).encode()
+    writer.write(f"POST {endpoint} HTTP/1.1\r\nHost: sleepy\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def drive(host, port, endpoint, profiles, concurrency, duration, batch_size, offset):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    counter = iter(range(offset, sys.maxsize))
+
+    async def worker():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                body = request_body(endpoint, profiles, next(counter), batch_size)
+                start = time.perf_counter()
+                status = await post(reader, writer, endpoint, body)
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def wait_ready(url, process, timeout=60):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("le serveur s'est arrêté au démarrage")
+        try:
+            if httpx.get(url + '/health', timeout=1).json()["model_loaded"]:
+                return
+        except (httpx.HTTPError, KeyError, ValueError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("le serveur n'a pas démarré à temps")
+
+
+def main(argv=None):
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Test de charge du service HTTP Sleepy (Gemini simulé)")
+    parser.add_argument('--endpoints', nargs='+', default=['/predict', '/predict/batch', '/report'])
+    parser.add_argument('--workers', type=int, default=2, help="workers uvicorn du serveur")
+    parser.add_argument('--clients', type=int, default=2, help="processus générateurs de charge")
+    parser.add_argument('--concurrency', type=int, default=32, help="requêtes simultanées par processus client")
+    parser.add_argument('--duration', type=float, default=10.0, help="durée par endpoint (s)")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--profiles', type=int, default=2000, help="profils distincts tirés du dataset")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="latence simulée de Gemini (s)")
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    cache_path = os.path.join(ROOT, '.cache', f'load_test_reports_{port}.sqlite')
+    env = dict(os.environ, SLEEPY_STUB_LATENCY=str(args.llm_latency), SLEEPY_REPORT_CACHE=cache_path,
+               SLEEPY_AUDIT_LOG=os.path.join(ROOT, '.cache', f'load_test_audit_{port}', 'requests.jsonl'))
+
+    server = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', '-c',
+         "import sys, uvicorn; sys.path.insert(0, sys.argv[1]); "
+         "uvicorn.run('load_test_service:stub_app', factory=True, app_dir=sys.argv[2], host='127.0.0.1', "
+         "port=int(sys.argv[3]), workers=int(sys.argv[4]), log_level='warning', access_log=False)",
+         ROOT, os.path.dirname(os.path.abspath(__file__)), str(port), str(args.workers)],
+        cwd=ROOT, env=env)
+
+    results = {}
+    try:
+        wait_ready(url, server)
+        profiles = load_profiles(args.profiles)
+
+        with multiprocessing.Pool(args.clients) as pool:
+            for endpoint in args.endpoints:
+                jobs = [('127.0.0.1', port, endpoint, profiles, args.concurrency, args.duration, args.batch_size,
+                         i * 1_000_000) for i in range(args.clients)]
+                start = time.perf_counter()
+                outputs = pool.map(client_process, jobs)
+                elapsed = time.perf_counter() - start
+
+                latencies = np.array([latency for output in outputs for latency in output[0]])
+                p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+                results[endpoint] = {
+                    'requests': len(latencies),
+                    'errors': sum(output[1] for output in outputs),
+                    'requests_per_s': len(latencies) / elapsed,
+                    'p50_ms': float(p50),
+                    'p99_ms': float(p99),
+                }
+                if endpoint == '/predict/batch':
+                    results[endpoint]['rows_per_s'] = len(latencies) * args.batch_size / elapsed
+    finally:
+        server.terminate()
+        server.wait()
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    print(json.dumps({
+        'server_workers': args.workers,
+        'client_processes': args.clients,
+        'concurrency': args.clients * args.concurrency,
+        'simulated_llm_latency_s': args.llm_latency,
+        'endpoints': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+sys.path.insert(0, ROOT)
+
+# suite de benchmarks de bout en bout, avant un déploiement : chargement du modèle, prédiction unitaire et par lot,
+# ingestion du CSV, tour de conversation et rapport avec un faux Gemini local (latence configurable).
+# Chaque benchmark tourne dans un processus neuf ; les résultats sortent en JSON et peuvent être comparés
+# à une référence enregistrée :
+#
+#   python benchmarks/suite.py -o baseline.json
+#   python benchmarks/suite.py --baseline baseline.json      # code de sortie 1 en cas de régression
+
+BENCHMARKS = ['load_brain', 'predict', 'ingest', 'chat', 'report']
+
+# messages que l'extraction locale ne sait pas lire (appel à Gemini) / lit entièrement (pas d'appel)
+GEMINI_MESSAGE = "Bonjour, je voudrais faire le point sur mon sommeil, mes nuits sont assez agitées en ce moment"
+LOCAL_MESSAGES = ["j'ai 43 ans", "je dors 7h", "72 bpm", "8000 pas par jour", "ma tension est de 120/80"]
+
+CHAT_REPLY = {
+    "user_interaction": {"message_to_user": "Merci ! Quelle est votre fréquence cardiaque au repos ?",
+                         "missing_fields": ["Heart Rate"]},
+    "data_extraction": {"Gender": "Male", "Age": 43, "Occupation": "Engineer"},
+    "metadata": {"validity_check": {"is_valid": True, "errors": []}, "confidence_score": 0.5,
+                 "ready_for_analysis": False},
+}
+REPORT_TEXT = ("Bonjour ! Je suis l'assistant Sleepy, et voici le rapport détaillé de votre analyse. "
+               "Vos habitudes de sommeil et votre niveau de stress expliquent l'essentiel du diagnostic. ") * 8
+
+# bruit de mesure en deçà duquel un écart n'est pas une régression, selon l'unité
+NOISE = {'_ms': 0.05, '_s': 0.005, '_mb': 5.0}
+
+
+class FakeModels:
+    # faux Gemini local : même interface que client.models, latence fixe par appel
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, model, contents, config):
+        self.calls += 1
+        time.sleep(self.latency)
+        if config.get("response_mime_type") == "application/json":
+            return SimpleNamespace(text=json.dumps(CHAT_REPLY, ensure_ascii=False), usage_metadata=None)
+        return SimpleNamespace(text=REPORT_TEXT, usage_metadata=None)
+
+    def generate_content_stream(self, model, contents, config):
+        self.calls += 1
+        words = REPORT_TEXT.split(" ")
+        for i in range(0, len(words), 8):
+            time.sleep(self.latency / (len(words) / 8))
+            yield SimpleNamespace(text=" ".join(words[i:i + 8]) + " ")
+
+
+def fake_client(latency):
+    return SimpleNamespace(models=FakeModels(latency))
+
+
+def percentiles(values, points=(50, 90, 99)):
+    # en millisecondes ; peu d'échantillons (conversation, rapports) : p99 ne serait que le maximum
+    values = sorted(values)
+    return {f'p{p}_ms': values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 for p in points}
+
+
+def wait_idle(timeout=60.0, interval=0.5):
+    # attend la fin des chargements en arrière-plan de l'application (modèle, explicateur, profils) :
+    # ils se disputeraient le processeur avec les tours mesurés
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        before = time.process_time()
+        time.sleep(interval)
+        if time.process_time() - before < interval * 0.1:
+            return
+
+
+def load_profiles(data, n):
+    import pandas as pd
+    import sleep_model
+
+    # mêmes dictionnaires que ceux construits par l'application (tension "120/80")
+    df = pd.read_csv(data, nrows=n)
+    return [{field: row[field] for field in sleep_model.INPUT_FIELDS} for row in df.to_dict('records')]
+
+
+def bench_load_brain(args):
+    import inference
+
+    start = time.perf_counter()
+    artifacts, fast_predictor = inference.load_brain()
+    cold = time.perf_counter() - start
+
+    # modules déjà importés : ne reste que la lecture de l'artefact
+    warm = []
+    for _ in range(args.load_repeat):
+        start = time.perf_counter()
+        inference.load_brain()
+        warm.append(time.perf_counter() - start)
+    return {'cold_s': cold, 'warm_s': sorted(warm)[len(warm) // 2], 'fast_path': fast_predictor is not None,
+            'model_found': artifacts is not None}
+
+
+def bench_predict(args):
+    import caching
+    import inference
+
+    brain = inference.load_brain()
+    profiles = load_profiles(args.data, args.rows)
+    results = {}
+
+    # predict_sleep_disorder de l'application : Predictor.predict, sans cache (profils tous différents) puis en cache
+    for name, cache in [('single', caching.LRUCache(maxsize=0)), ('single_cached', caching.LRUCache())]:
+        predictor = inference.Predictor(lambda: brain, cache)
+        for user_data in profiles[:50]:
+            predictor.predict(user_data)
+        latencies = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            predictor.predict(profiles[i % len(profiles)])
+            latencies.append(time.perf_counter() - start)
+        results[name] = {**percentiles(latencies), 'predictions_per_s': len(latencies) / sum(latencies)}
+
+    predictor = inference.Predictor(lambda: brain)
+    records = (profiles * (args.batch_size // len(profiles) + 1))[:args.batch_size]
+    predictor.predict_batch(records[:100])
+    latencies = []
+    for _ in range(args.batch_repeat):
+        start = time.perf_counter()
+        predictor.predict_batch(records)
+        latencies.append(time.perf_counter() - start)
+    results['batch'] = {**percentiles(latencies), 'batch_size': args.batch_size,
+                        'rows_per_s': args.batch_size * len(latencies) / sum(latencies)}
+    return results
+
+
+def bench_ingest(args):
+    import dataset
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        n_rows = dataset.ingest(args.data, os.path.join(directory, 'store.parquet'))
+        ingest_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dataset.load(args.data, store=False)
+        csv_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dataset.load(os.path.join(directory, 'store.parquet'))
+        store_time = time.perf_counter() - start
+    return {'rows': n_rows, 'ingest_s': ingest_time, 'ingest_rows_per_s': n_rows / ingest_time,
+            'load_csv_s': csv_time, 'load_store_s': store_time}
+
+
+def install_fake_gemini(latency):
+    # l'application crée son client avec google.genai.Client : remplacé par le faux Gemini
+    from google import genai
+
+    os.environ["GEMINI_API_KEY"] = "benchmark"
+    genai.Client = lambda **kwargs: fake_client(latency)
+
+
+def bench_chat(args):
+    # tour de conversation complet (rerun Streamlit + call_gemini_chat ou extraction locale) dans l'application
+    from streamlit.testing.v1 import AppTest
+
+    install_fake_gemini(args.llm_latency)
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.run()
+    at.button(key='chat_mode').click().run()
+    wait_idle()
+
+    results = {}
+    for name, messages in [('gemini_turn', [GEMINI_MESSAGE]), ('local_turn', LOCAL_MESSAGES)]:
+        latencies = []
+        for i in range(args.turns):
+            start = time.perf_counter()
+            at.chat_input[0].set_value(messages[i % len(messages)]).run()
+            latencies.append(time.perf_counter() - start)
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+        results[name] = percentiles(latencies, (50, 90))
+    return results
+
+
+def bench_report(args):
+    # call_gemini_analysis / stream_gemini_analysis tels que l'application les construit, faux Gemini derrière
+    import caching
+    import inference
+    import llm_gateway
+    import reporting
+
+    client = fake_client(args.llm_latency)
+    brain = inference.load_brain()
+    predictor = inference.Predictor(lambda: brain)
+    predictor.explainer()
+    predictor.neighbors()
+    import sleep_model
+
+    # profils distincts (le CSV échantillonné contient des doublons, qui seraient servis par le cache),
+    # séparés entre rapports Gemini et rapports types (diagnostic "Healthy" quasi certain)
+    profiles, seen = {'gemini': [], 'template': []}, set()
+    for user_data in load_profiles(args.data, args.rows):
+        features = sleep_model.canonical_features(user_data)
+        if features in seen:
+            continue
+        seen.add(features)
+        prediction = predictor.predict(user_data)
+        kind = 'template' if reporting.triage(prediction, predictor.predict_proba(user_data)) == 'template' else 'gemini'
+        if len(profiles[kind]) < args.reports:
+            profiles[kind].append((user_data, prediction))
+
+    with tempfile.TemporaryDirectory() as directory:
+        reporter = reporting.ReportGenerator(
+            llm_gateway.LLMGateway(lambda: client), caching.ReportCache(os.path.join(directory, 'reports.sqlite')),
+            explain=predictor.explain, probabilities=predictor.predict_proba, similar=predictor.similar)
+
+        results = {}
+        for name, kind in [('report', 'gemini'), ('report_cached', 'gemini'), ('template_report', 'template')]:
+            latencies = []
+            for user_data, prediction in profiles[kind]:
+                start = time.perf_counter()
+                reporter.call_gemini_analysis(user_data, prediction)
+                latencies.append(time.perf_counter() - start)
+            if latencies:
+                results[name] = percentiles(latencies, (50, 90))
+
+        reporter.cache = caching.ReportCache(os.path.join(directory, 'stream.sqlite'))
+        first_token, total = [], []
+        for user_data, prediction in profiles['gemini']:
+            timings = {}
+            for _ in reporter.stream_gemini_analysis(user_data, prediction, timings):
+                pass
+            if "time_to_first_token" in timings:
+                first_token.append(timings["time_to_first_token"])
+                total.append(timings["total_time"])
+        if total:
+            results['stream'] = {**{key.replace('_ms', '_first_token_ms'): value
+                                    for key, value in percentiles(first_token, (50, 90)).items()},
+                                 **percentiles(total, (50, 90))}
+
+    results['gemini_calls'] = client.models.calls
+    return results
+
+
+def child(name, args):
+    print(json.dumps(globals()['bench_' + name](args), default=float))
+
+
+def run_child(name, args, argv):
+    with tempfile.TemporaryDirectory() as directory:
+        # caches, sessions et journal d'audit dans un dossier jetable : pas de rapport déjà en cache
+        env = {**os.environ, 'SLEEPY_REPORT_CACHE': os.path.join(directory, 'reports.sqlite'),
+               'SLEEPY_SESSION_DIR': os.path.join(directory, 'sessions'),
+               'SLEEPY_AUDIT_LOG': os.path.join(directory, 'logs', 'requests.jsonl'), 'PYTHONWARNINGS': 'ignore'}
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name] + argv,
+                                capture_output=True, text=True, cwd=ROOT, env=env)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'échec'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def best_of(runs):
+    # meilleure valeur de chaque mesure sur plusieurs exécutions (comme timeit) : moins sensible au bruit
+    if any('error' in run for run in runs):
+        return next(run for run in runs if 'error' in run)
+    merged = {}
+    for key, value in runs[0].items():
+        if isinstance(value, dict):
+            merged[key] = best_of([run[key] for run in runs])
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and direction(key):
+            values = [run[key] for run in runs]
+            merged[key] = max(values) if direction(key) > 0 else min(values)
+        else:
+            merged[key] = value
+    return merged
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=ROOT).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def flatten(results, prefix=''):
+    # {"predict": {"single": {"p50_ms": ...}}} -> {"predict.single.p50_ms": ...}
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def direction(metric) -> int:
+    # -1 : plus bas = mieux (durées, mémoire), +1 : plus haut = mieux (débits), 0 : informatif
+    if metric.endswith('_per_s'):
+        return 1
+    if metric.endswith(tuple(NOISE)):
+        return -1
+    return 0
+
+
+def compare(current, baseline, tolerance) -> list:
+    rows = []
+    current, baseline = flatten(current), flatten(baseline)
+    for metric, before in baseline.items():
+        sign = direction(metric)
+        if sign == 0 or metric not in current or not before:
+            continue
+        after = current[metric]
+        change = (after - before) / before
+        noise = next((floor for suffix, floor in NOISE.items() if metric.endswith(suffix)), 0.0)
+        worse = -sign * change > tolerance and (sign > 0 or after - before > noise)
+        better = sign * change > tolerance
+        rows.append({'metric': metric, 'baseline': before, 'current': after, 'change': change,
+                     'status': 'regression' if worse else 'improvement' if better else 'ok'})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de bout en bout (faux Gemini local)")
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--data', default=os.path.join(ROOT, 'Sleep_Data_Sampled.csv'))
+    parser.add_argument('--rows', type=int, default=2000, help="profils lus dans le CSV")
+    parser.add_argument('--repeat', type=int, default=2000, help="prédictions unitaires")
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--batch-repeat', type=int, default=5)
+    parser.add_argument('--load-repeat', type=int, default=5)
+    parser.add_argument('--turns', type=int, default=20, help="tours de conversation par type")
+    parser.add_argument('--reports', type=int, default=20, help="profils par type de rapport (Gemini, type)")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="latence du faux Gemini (s)")
+    parser.add_argument('--runs', type=int, default=3, help="exécutions de chaque benchmark, la meilleure est gardée")
+    parser.add_argument('-o', '--output', default=None, help="fichier JSON (par défaut : sortie standard)")
+    parser.add_argument('--baseline', default=None, help="résultats de référence à comparer")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="écart relatif toléré")
+    argv = sys.argv[1:] if argv is None else argv
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child, args)
+        return 0
+
+    # options transmises telles quelles aux processus enfants
+    passthrough = [arg for arg in argv if arg not in args.only]
+    for option in ['--only', '-o', '--output', '--baseline', '--tolerance', '--runs']:
+        if option in passthrough:
+            i = passthrough.index(option)
+            del passthrough[i:i + (1 if option == '--only' else 2)]
+
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ('child', 'only', 'output', 'baseline', 'tolerance')}
+    results = {'environment': environment(), 'settings': settings, 'benchmarks': {}}
+    for name in args.only:
+        start = time.perf_counter()
+        results['benchmarks'][name] = best_of([run_child(name, args, passthrough) for _ in range(args.runs)])
+        print(f"{name} : {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        # mesures comparables seulement à réglages et machine identiques
+        changed = [key for key, value in settings.items() if baseline.get('settings', {}).get(key) != value]
+        changed += [key for key in ('cpu_count', 'python')
+                    if baseline.get('environment', {}).get(key) != results['environment'][key]]
+        if changed:
+            print(f"ATTENTION : réglages différents de la référence ({', '.join(changed)})", file=sys.stderr)
+        rows = compare(results['benchmarks'], baseline['benchmarks'], args.tolerance)
+        regressions = [row for row in rows if row['status'] == 'regression']
+        results['comparison'] = {'baseline': baseline.get('environment'), 'tolerance': args.tolerance,
+                                 'changed_settings': changed, 'regressions': len(regressions), 'metrics': rows}
+        for row in regressions:
+            print(f"RÉGRESSION {row['metric']} : {row['baseline']:.4g} -> {row['current']:.4g} "
+                  f"({row['change']:+.0%})", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    errors = [name for name, result in results['benchmarks'].items() if 'error' in result]
+    for name in errors:
+        print(f"ERREUR {name} : {results['benchmarks'][name]['error']}", file=sys.stderr)
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if errors else exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+_MISSING = object()
+
+
+class LRUCache:
+    # cache LRU borné avec durée de vie (ttl en secondes, None = pas d'expiration).
+    # partagé entre les sessions Streamlit, donc protégé par un verrou.
+
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def hash_key(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    # un seul appel en cours par clé : les appelants concurrents attendent le résultat du premier
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, compute):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+            else:
+                self.shared += 1
+
+        if not leader:
+            return call.result()
+
+        try:
+            call.set_result(compute())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.result()
+
+    def begin(self, key):
+        # appel déclaré à la main, pour un calcul qui ne tient pas dans une fonction (rapport en streaming) :
+        # renvoie le Future que les appelants de do() attendront, à terminer avec finish(), ou None si un
+        # appel est déjà en cours pour cette clé
+        with self._lock:
+            if key in self._calls:
+                return None
+            call = self._calls[key] = Future()
+            return call
+
+    def finish(self, key, call, result=None, error=None):
+        if error is not None:
+            call.set_exception(error)
+        else:
+            call.set_result(result)
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._calls
+
+
+class ReportCache:
+    # cache persistant (SQLite) des rapports générés, avec éviction par âge et par taille
+
+    def __init__(self, path, max_entries=10_000, max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.single_flight = SingleFlight()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS reports_accessed ON reports (accessed_at)")
+        self._db.commit()
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value FROM reports WHERE key = ? AND created_at >= ?",
+                                   (key, now - self.max_age)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE reports SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[0]
+
+    def get(self, key):
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?)", (key, value, now, now))
+            expired = self._db.execute("DELETE FROM reports WHERE created_at < ?", (now - self.max_age,)).rowcount
+            overflow = self._db.execute("""
+                DELETE FROM reports WHERE key IN (
+                    SELECT key FROM reports ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+            self._db.commit()
+            self.evictions += expired + overflow
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def compute_and_store():
+            # une autre session a pu remplir le cache entre-temps
+            value = self._lookup(key)
+            if value is None:
+                value = compute()
+                self.set(key, value)
+            return value
+
+        return self.single_flight.do(key, compute_and_store)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'shared_in_flight': self.single_flight.shared,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,80 @@
+import json
+
+# nombre d'échanges (message utilisateur + réponse du modèle) renvoyés tels quels à Gemini
+DEFAULT_MAX_TURNS = 4
+
+
+def compact_model_reply(data: dict) -> str:
+    # on ne garde de la réponse JSON que ce qui sert au dialogue ; les données extraites
+    # sont transmises à part, sous forme d'état fusionné
+    interaction = data.get("user_interaction", {})
+    return json.dumps({
+        "user_interaction": {
+            "message_to_user": interaction.get("message_to_user", ""),
+            "missing_fields": interaction.get("missing_fields", []),
+        }
+    }, ensure_ascii=False)
+
+
+def recent_messages(history, max_turns=DEFAULT_MAX_TURNS):
+    if max_turns <= 0:
+        return []
+    return history[-2 * max_turns:]
+
+
+def summarize_state(extracted_data, n_older_turns, fields, hints=None) -> str:
+    # hints : champs repérés par l'extraction locale dans un message qu'elle n'a pas compris en entier ;
+    # jamais fusionnés d'office, Gemini les confirme ou les écarte
+    extracted_data = extracted_data or {}
+    collected = {field: extracted_data[field] for field in fields if extracted_data.get(field) is not None}
+    missing = [field for field in fields if field not in collected]
+
+    lines = [
+        "",
+        "ÉTAT ACTUEL DE LA COLLECTE (fait foi, ne redemande pas ces informations) :",
+        f"- Données déjà collectées : {json.dumps(collected, ensure_ascii=False)}",
+        f"- Champs encore manquants : {', '.join(missing) if missing else 'aucun'}",
+    ]
+    if hints:
+        lines.append(f"- Indices repérés automatiquement dans le dernier message, non vérifiés : "
+                     f"{json.dumps(hints, ensure_ascii=False)}. Ils peuvent être faux (âge d'un proche, date, "
+                     f"profession d'un tiers...) : reprends-les dans data_extraction seulement s'ils décrivent "
+                     f"bien l'utilisateur, sinon mets ces champs à null.")
+    if n_older_turns:
+        lines.append(f"- {n_older_turns} échange(s) plus ancien(s) ont été résumés par cet état.")
+    lines.append("Dans data_extraction, renvoie toujours l'ensemble des données collectées, anciennes comprises.")
+    return "\n".join(lines)
+
+
+def build_chat_request(system_prompt, history, extracted_data, user_message, fields,
+                       max_turns=DEFAULT_MAX_TURNS, archived_messages=0, hints=None):
+    # archived_messages : messages plus anciens que `history`, déchargés sur disque (sessions.py)
+    recent = recent_messages(history, max_turns)
+    n_older_turns = (archived_messages + len(history) - len(recent)) // 2
+
+    contents = [{"role": msg["role"], "parts": [{"text": msg["content"]}]} for msg in recent]
+    contents.append({"role": "user", "parts": [{"text": user_message}]})
+
+    system_instruction = system_prompt + "\n" + summarize_state(extracted_data, n_older_turns, fields, hints)
+    return contents, system_instruction
+
+
+def estimate_tokens(text) -> int:
+    # estimation grossière (~4 caractères par token), utilisée si l'API ne renvoie pas de compte
+    return len(text) // 4
+
+
+def request_size(contents, system_instruction) -> int:
+    return estimate_tokens(system_instruction) + sum(
+        estimate_tokens(part["text"]) for message in contents for part in message["parts"])
+
+
+def token_usage(response, contents, system_instruction) -> dict:
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "estimated_prompt_tokens": request_size(contents, system_instruction),
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "response_tokens": getattr(usage, "candidates_token_count", None),
+        "total_tokens": getattr(usage, "total_token_count", None),
+        "history_messages": len(contents) - 1,
+    }
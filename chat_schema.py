@@ -0,0 +1,285 @@
+import json
+import math
+import re
+
+import local_extractor
+
+# lecture tolérante des réponses JSON de Gemini et validation des 11 champs de chat_prompt :
+# une réponse mal formée ou une valeur hors bornes ne coûte plus un nouvel aller-retour complet
+
+
+class JSONStreamExtractor:
+    # extraction incrémentale du premier objet JSON d'un texte reçu par morceaux :
+    # texte avant l'objet et bloc ```json ignorés, arrêt dès la fermeture de l'objet (texte après ignoré),
+    # réparation à la fin si l'objet est tronqué (guillemets / accolades non fermés, virgule finale)
+
+    def __init__(self):
+        self.buffer = []
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.done = False
+
+    def feed(self, chunk):
+        # renvoie l'objet dès qu'il est complet, None sinon
+        if self.done:
+            return None
+        for char in chunk:
+            if not self.started:
+                if char != '{':
+                    continue
+                self.started = True
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.stack.append('}' if char == '{' else ']')
+            elif char in '}]':
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                    return loads_lenient(''.join(self.buffer))
+        return None
+
+    def finish(self):
+        # fin du texte sans objet complet : on ferme ce qui est resté ouvert
+        if not self.started or self.done:
+            return None
+        text = ''.join(self.buffer)
+        if self.in_string:
+            text += '"'
+        return loads_lenient(_drop_dangling(text) + ''.join(reversed(self.stack)))
+
+
+def _drop_dangling(text):
+    # fin tronquée : virgule finale, clé sans valeur ou valeur littérale coupée ("tr", "nul", "12.")
+    previous = None
+    while previous != text:
+        previous = text
+        text = text.rstrip()
+        text = re.sub(r',\s*$', '', text)
+        text = re.sub(r'[{,]\s*"[^"]*"\s*:?\s*$', lambda m: m.group(0)[0] if m.group(0)[0] == '{' else '', text)
+        text = re.sub(r':\s*(?:t|tr|tru|f|fa|fal|fals|n|nu|nul|-)$', ': null', text)
+        text = re.sub(r'(\d)\.$', r'\1', text)
+    return text
+
+
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_PYTHON_LITERALS = re.compile(r'(?<=[\s:\[,])(None|True|False)(?=\s*[,}\]])')
+
+
+def loads_lenient(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    repaired = _TRAILING_COMMA.sub(r'\1', text)
+    repaired = _PYTHON_LITERALS.sub(lambda m: {'None': 'null', 'True': 'true', 'False': 'false'}[m.group(1)],
+                                    repaired)
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError:
+        return None
+
+
+def extract_json(text):
+    # None si aucun objet JSON n'est récupérable
+    if not text:
+        return None
+    extractor = JSONStreamExtractor()
+    data = extractor.feed(text)
+    if data is None:
+        data = extractor.finish()
+    return data if isinstance(data, dict) else None
+
+
+# ---------- validation des champs ----------
+
+GENDERS = {'male': 'Male', 'homme': 'Male', 'm': 'Male', 'female': 'Female', 'femme': 'Female', 'f': 'Female'}
+BMI_CATEGORIES = {'normal': 'Normal', 'normal weight': 'Normal', 'overweight': 'Overweight', 'surpoids': 'Overweight',
+                  'obese': 'Obese', 'obèse': 'Obese', 'obesity': 'Obese'}
+
+# (type, bornes) de chaque champ ; les bornes sont celles de local_extractor
+FIELD_SPECS = {
+    'Gender': ('choice', GENDERS),
+    'Age': ('int', 1, 119),
+    'Occupation': ('text', 60),
+    'Sleep Duration': ('float', 0.5, 24),
+    'Quality of Sleep': ('int', 1, 10),
+    'Physical Activity Level': ('int', 0, 600),
+    'Stress Level': ('int', 1, 10),
+    'BMI Category': ('choice', BMI_CATEGORIES),
+    'Blood Pressure': ('blood_pressure', (70, 250), (40, 150)),
+    'Heart Rate': ('int', 30, 220),
+    'Daily Steps': ('int', 0, 100_000),
+}
+
+_NUMBER = re.compile(r'^\s*(-?\d+(?:[.,]\d+)?)\s*[a-zA-Zé/%]*\s*$')
+_BLOOD_PRESSURE = re.compile(r'^\s*(\d{1,3})\s*/\s*(\d{1,3})\s*(?:mmhg|cmhg)?\s*$', re.IGNORECASE)
+
+
+class Invalid(ValueError):
+    pass
+
+
+def _as_number(value):
+    if isinstance(value, bool):
+        raise Invalid("nombre attendu")
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER.match(str(value))
+        if not match:
+            raise Invalid("nombre attendu")
+        number = float(match.group(1).replace(',', '.'))
+    if not math.isfinite(number):
+        raise Invalid("nombre attendu")
+    return number
+
+
+def _compile_field(spec):
+    kind = spec[0]
+
+    if kind == 'int':
+        low, high = spec[1], spec[2]
+
+        def check(value):
+            number = _as_number(value)
+            if number != int(number):
+                raise Invalid("nombre entier attendu")
+            if not low <= number <= high:
+                raise Invalid(f"doit être entre {low} et {high}")
+            return int(number)
+
+    elif kind == 'float':
+        low, high = spec[1], spec[2]
+
+        def check(value):
+            number = _as_number(value)
+            if not low <= number <= high:
+                raise Invalid(f"doit être entre {low} et {high}")
+            return round(number, 2)
+
+    elif kind == 'choice':
+        choices = spec[1]
+
+        def check(value):
+            choice = choices.get(str(value).strip().lower())
+            if choice is None:
+                raise Invalid(f"valeur attendue parmi {sorted(set(choices.values()))}")
+            return choice
+
+    elif kind == 'text':
+        max_length = spec[1]
+
+        def check(value):
+            if not isinstance(value, str) or not value.strip() or len(value) > max_length:
+                raise Invalid("texte court attendu")
+            return value.strip()
+
+    elif kind == 'blood_pressure':
+        (sys_low, sys_high), (dia_low, dia_high) = spec[1], spec[2]
+
+        def check(value):
+            match = _BLOOD_PRESSURE.match(str(value))
+            if not match:
+                raise Invalid("format Sys/Dia attendu (ex : 120/80)")
+            systolic, diastolic = int(match.group(1)), int(match.group(2))
+            if systolic < 30 and diastolic < 20:
+                # notation française "12/8" en cmHg, comme dans local_extractor
+                systolic, diastolic = systolic * 10, diastolic * 10
+            if not (sys_low <= systolic <= sys_high and dia_low <= diastolic <= dia_high) or diastolic >= systolic:
+                raise Invalid("valeurs de tension invraisemblables")
+            return f"{systolic}/{diastolic}"
+
+    else:
+        raise ValueError(f"type de champ inconnu : {kind}")
+
+    return check
+
+
+def compile_schema(specs):
+    # les règles sont transformées une fois pour toutes en fonctions de vérification
+    checks = {field: _compile_field(spec) for field, spec in specs.items()}
+
+    def validate(extraction):
+        # renvoie (champs valides normalisés, {champ: erreur}) ; les champs null ou inconnus sont ignorés
+        clean, errors = {}, {}
+        if not isinstance(extraction, dict):
+            return clean, errors
+        for field, value in extraction.items():
+            check = checks.get(field)
+            if check is None or value is None or value == "":
+                continue
+            try:
+                clean[field] = check(value)
+            except Invalid as e:
+                errors[field] = str(e)
+        return clean, errors
+
+    return validate
+
+
+validate_extraction = compile_schema(FIELD_SPECS)
+
+
+def reask_message(invalid_fields):
+    labels = [local_extractor.FIELD_LABELS[field] for field in invalid_fields]
+    asked = labels[0] if len(labels) == 1 else ", ".join(labels[:-1]) + " et " + labels[-1]
+    return f"Je ne suis pas sûr d'avoir bien compris {asked}. Pouvez-vous préciser ?"
+
+
+def parse_chat_response(text, extracted_data):
+    # réponse brute de Gemini -> réponse au format attendu, données validées ;
+    # renvoie (réponse, statut) avec statut 'ok', 'repaired', 'invalid_fields' ou 'unparseable'
+    status = 'ok'
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        data = None
+    if not isinstance(data, dict):
+        data = extract_json(text)
+        status = 'repaired'
+
+    if data is None:
+        # rien de récupérable : on repose la question suivante au lieu de faire renvoyer le message
+        reply = local_extractor.local_reply(extracted_data, {})
+        reply["metadata"]["validity_check"] = {"is_valid": False, "errors": ["réponse illisible"]}
+        reply["metadata"]["ready_for_analysis"] = False
+        return reply, 'unparseable'
+
+    clean, errors = validate_extraction(data.get("data_extraction"))
+    interaction = data.get("user_interaction") if isinstance(data.get("user_interaction"), dict) else {}
+    metadata = data.get("metadata") if isinstance(data.get("metadata"), dict) else {}
+
+    merged = {**(extracted_data or {}), **clean}
+    missing = [field for field in local_extractor.FIELDS if merged.get(field) is None]
+    ready = bool(metadata.get("ready_for_analysis")) and not missing and not errors
+
+    message = interaction.get("message_to_user") or local_extractor.next_question(merged)[0]
+    if errors:
+        # seules les valeurs refusées sont redemandées, le reste de la réponse est conservé
+        invalid = [field for field in local_extractor.FIELDS if field in errors]
+        message = reask_message(invalid)
+        missing = invalid + [field for field in missing if field not in errors]
+        status = 'invalid_fields'
+
+    return {
+        "user_interaction": {"message_to_user": message, "missing_fields": missing},
+        "data_extraction": clean,
+        "metadata": {
+            "validity_check": {"is_valid": not errors, "errors": [f"{field} : {error}" for field, error in errors.items()]},
+            "confidence_score": metadata.get("confidence_score", 0.0),
+            "ready_for_analysis": ready,
+        }
+    }, status
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import sleep_model
+
+# profils de population ("les personnes comme vous") : K-Means par mini-lots sur les features du modèle,
+# normalisées et encodées comme pour XGBoost. Centroïdes, ACP 2D et statistiques de chaque groupe sont
+# enregistrés à côté de l'artefact du modèle ; à la requête, affecter un profil = k distances.
+#
+#   python cohorts.py fit                 # coude sur k = 1..10 (en parallèle), k choisi automatiquement
+#   python cohorts.py fit --k 3 --data export.parquet
+
+COHORTS_PATH = 'sleep_model_cohorts.json'
+COHORTS_FORMAT = 'sleepy-cohorts'
+COHORTS_FORMAT_VERSION = 1
+
+
+class Cohorts:
+
+    def __init__(self, model: dict):
+        self.model = model
+        self.encoding = sleep_model.Encoding(model['mean'], model['scale'], model['categories'])
+        self.centroids = np.asarray(model['centroids'], dtype=np.float64)
+        self.pca_mean = np.asarray(model['pca']['mean'], dtype=np.float64)
+        self.pca_components = np.asarray(model['pca']['components'], dtype=np.float64)
+        self.profiles = model['profiles']
+
+    @classmethod
+    def load(cls, path=COHORTS_PATH):
+        with open(path, encoding='utf-8') as f:
+            model = json.load(f)
+        if model.get('format') != COHORTS_FORMAT or model.get('format_version') != COHORTS_FORMAT_VERSION:
+            raise ValueError(f"'{path}' : format {model.get('format')} v{model.get('format_version')} non supporté")
+        if model['features'] != sleep_model.FEATURES:
+            raise ValueError(f"'{path}' : liste de features différente de celle du code")
+        return cls(model)
+
+    @property
+    def k(self) -> int:
+        return len(self.centroids)
+
+    def assign_features(self, features) -> tuple:
+        # (profil le plus proche, distance) : k distances en dimension 25
+        x = self.encoding.encode(features)
+        distances = ((self.centroids - x) ** 2).sum(axis=1)
+        cohort = int(np.argmin(distances))
+        return cohort, float(np.sqrt(distances[cohort])), x
+
+    def assign_frame(self, df: pd.DataFrame) -> np.ndarray:
+        return assign(self.centroids, self.encoding.encode_frame(df))
+
+    def profile(self, user_data) -> dict:
+        features = sleep_model.canonical_features(user_data)
+        cohort, distance, x = self.assign_features(features)
+        profile = self.profiles[cohort]
+        n_numeric = self.encoding.n_numeric
+        # écarts à la moyenne du groupe, en écarts-types de la population
+        gaps = {feature: float((value - profile['means'][feature]) / scale)
+                for feature, value, scale in zip(sleep_model.NUMERIC_FEATURES, features[:n_numeric],
+                                                 self.encoding.scale)}
+        return {
+            'cohort': cohort,
+            'share': profile['share'],
+            'size': profile['size'],
+            'disorders': profile['disorders'],
+            'means': profile['means'],
+            'categories': profile['categories'],
+            'largest_gaps': dict(sorted(gaps.items(), key=lambda item: -abs(item[1]))[:3]),
+            'distance': distance,
+            'projection': ((x - self.pca_mean) @ self.pca_components.T).tolist(),
+        }
+
+
+def assign(centroids, x) -> np.ndarray:
+    # ||x - c||² = ||x||² - 2 x.c + ||c||² : une multiplication de matrices par lot
+    distances = (centroids ** 2).sum(axis=1) - 2 * (x @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+
+# ---------- apprentissage ----------
+
+def sample_rows(data, encoding, rows, chunk_size, seed):
+    # échantillon uniforme de taille fixe (lignes aux plus petites clés aléatoires), lu morceau par morceau ;
+    # renvoie (lignes encodées, nombre total de lignes)
+    rng = np.random.default_rng(seed)
+    sample, keys = np.empty((0, encoding.n_columns), dtype=np.float32), np.empty(0)
+    n_rows = 0
+    for chunk in dataset.iter_file(data, chunk_size):
+        x = encoding.encode_frame(chunk)
+        n_rows += len(x)
+        keys = np.concatenate([keys, rng.random(len(x))])
+        sample = np.concatenate([sample, x])
+        keep = np.argsort(keys)[:rows]
+        sample, keys = sample[keep], keys[keep]
+    return sample, n_rows
+
+
+def fit_k(x, k, batch_size, seed):
+    from sklearn.cluster import MiniBatchKMeans
+
+    start = time.perf_counter()
+    model = MiniBatchKMeans(n_clusters=k, batch_size=batch_size, n_init=3, random_state=seed).fit(x)
+    return {'k': k, 'inertia_per_row': float(model.inertia_ / len(x)), 'duration_s': time.perf_counter() - start,
+            'centroids': model.cluster_centers_}
+
+
+def elbow(ks, inertia) -> int:
+    # point de la courbe normalisée le plus éloigné de la droite entre le premier et le dernier k
+    ks, inertia = np.asarray(ks, dtype=np.float64), np.asarray(inertia, dtype=np.float64)
+    if len(ks) < 3:
+        return int(ks[-1])
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertia - inertia[-1]) / max(inertia[0] - inertia[-1], 1e-12)
+    return int(ks[np.argmax(1 - x - y)])
+
+
+def fit_cohorts(encoding, data=dataset.DATASET_PATH, ks=range(1, 11), k=None, sample_size=100_000,
+                chunk_size=dataset.DEFAULT_CHUNK_SIZE, batch_size=4096, n_jobs=-1, seed=42) -> dict:
+    from joblib import Parallel, delayed
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.decomposition import PCA
+
+    timings = {}
+    start = time.perf_counter()
+    sample, n_rows = sample_rows(data, encoding, sample_size, chunk_size, seed)
+    timings['sample_s'] = time.perf_counter() - start
+
+    # coude : un MiniBatchKMeans par valeur de k, en parallèle, sur l'échantillon
+    start = time.perf_counter()
+    ks = sorted(set(ks) | ({k} if k else set()))
+    curve = Parallel(n_jobs=n_jobs)(delayed(fit_k)(sample, candidate, batch_size, seed) for candidate in ks)
+    timings['elbow_s'] = time.perf_counter() - start
+    chosen = k or elbow(ks, [point['inertia_per_row'] for point in curve])
+    centroids = next(point['centroids'] for point in curve if point['k'] == chosen)
+
+    # fichier plus gros que l'échantillon : les centroïdes sont affinés sur toutes les lignes
+    start = time.perf_counter()
+    if n_rows > len(sample):
+        model = MiniBatchKMeans(n_clusters=chosen, init=centroids, n_init=1, batch_size=batch_size,
+                                random_state=seed)
+        for chunk in dataset.iter_file(data, chunk_size):
+            x = encoding.encode_frame(chunk)
+            for offset in range(0, len(x), batch_size):
+                model.partial_fit(x[offset:offset + batch_size])
+        centroids = model.cluster_centers_
+    timings['refine_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profiles = profile_cohorts(data, encoding, centroids, chunk_size)
+    timings['profiles_s'] = time.perf_counter() - start
+
+    pca = PCA(n_components=2, random_state=seed).fit(sample)
+    return {
+        'format': COHORTS_FORMAT,
+        'format_version': COHORTS_FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'dataset': os.path.basename(str(data)),
+        'rows': n_rows,
+        'features': sleep_model.FEATURES,
+        'mean': encoding.mean.tolist(),
+        'scale': encoding.scale.tolist(),
+        'categories': encoding.categories,
+        'k': chosen,
+        'elbow': [{key: point[key] for key in ('k', 'inertia_per_row', 'duration_s')} for point in curve],
+        'centroids': centroids.tolist(),
+        'pca': {
+            'mean': pca.mean_.tolist(),
+            'components': pca.components_.tolist(),
+            'explained_variance_ratio': pca.explained_variance_ratio_.tolist(),
+            'centroids': pca.transform(centroids).tolist(),
+        },
+        'profiles': profiles,
+        'timings': timings,
+    }
+
+
+def profile_cohorts(data, encoding, centroids, chunk_size) -> list:
+    # une passe : effectif, moyennes des mesures, répartition des diagnostics et des catégories de chaque groupe
+    k = len(centroids)
+    sizes = np.zeros(k, dtype=np.int64)
+    sums = np.zeros((k, len(sleep_model.NUMERIC_FEATURES)))
+    counts = [{} for _ in range(k)]
+    for chunk in dataset.iter_file(data, chunk_size):
+        x = sleep_model.prepare_features(chunk)
+        labels = assign(centroids, encoding.encode_frame(x))
+        sizes += np.bincount(labels, minlength=k)
+        np.add.at(sums, labels, x[sleep_model.NUMERIC_FEATURES].to_numpy(dtype=np.float64))
+
+        columns = sleep_model.CATEGORICAL_FEATURES + ([dataset.TARGET] if dataset.TARGET in chunk.columns else [])
+        values = x[sleep_model.CATEGORICAL_FEATURES].assign(cohort=labels)
+        if dataset.TARGET in chunk.columns:
+            values[dataset.TARGET] = chunk[dataset.TARGET].astype(object).fillna('None').to_numpy()
+        for column in columns:
+            for (cohort, value), count in values.groupby(['cohort', column], observed=True).size().items():
+                column_counts = counts[cohort].setdefault(column, {})
+                column_counts[str(value)] = column_counts.get(str(value), 0) + int(count)
+
+    total = max(int(sizes.sum()), 1)
+    profiles = []
+    for cohort in range(k):
+        size = max(int(sizes[cohort]), 1)
+
+        def shares(column):
+            column_counts = counts[cohort].get(column, {})
+            return {value: count / size for value, count in sorted(column_counts.items(), key=lambda item: -item[1])}
+
+        profiles.append({
+            'size': int(sizes[cohort]),
+            'share': int(sizes[cohort]) / total,
+            'means': {feature: float(value) for feature, value in
+                      zip(sleep_model.NUMERIC_FEATURES, sums[cohort] / size)},
+            'disorders': shares(dataset.TARGET),
+            'categories': {column: shares(column) for column in sleep_model.CATEGORICAL_FEATURES},
+        })
+    return profiles
+
+
+def save(model, path=COHORTS_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profils de population (K-Means par mini-lots)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fit_parser = subparsers.add_parser('fit', help="calcule les profils et les enregistre à côté du modèle")
+    fit_parser.add_argument('--data', default=dataset.DATASET_PATH, help="CSV ou Parquet, lu par morceaux")
+    fit_parser.add_argument('--artifacts', default=None, help="modèle dont on reprend la normalisation")
+    fit_parser.add_argument('-o', '--output', default=COHORTS_PATH)
+    fit_parser.add_argument('--k', type=int, default=None, help="par défaut : choisi par la méthode du coude")
+    fit_parser.add_argument('--max-k', type=int, default=10)
+    fit_parser.add_argument('--sample-rows', type=int, default=100_000, help="échantillon pour le coude et l'ACP")
+    fit_parser.add_argument('--chunk-size', type=int, default=dataset.DEFAULT_CHUNK_SIZE)
+    fit_parser.add_argument('--batch-size', type=int, default=4096)
+    fit_parser.add_argument('--n-jobs', type=int, default=-1)
+    fit_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args(argv)
+    if args.command == 'fit':
+        artifacts = sleep_model.load_artifacts(args.artifacts)
+        if artifacts is None:
+            print("ERREUR : modèle introuvable.", file=sys.stderr)
+            return 1
+        predictor = sleep_model.FastPredictor.from_artifacts(artifacts)
+        encoding = predictor.encoding()
+        model = fit_cohorts(encoding, args.data, range(1, args.max_k + 1), args.k, args.sample_rows,
+                            args.chunk_size, args.batch_size, args.n_jobs, args.seed)
+        save(model, args.output)
+        print(json.dumps({key: model[key] for key in ('rows', 'k', 'elbow', 'timings')}, indent=2), file=sys.stderr)
+        print(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
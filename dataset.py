@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+# lecture des exports CSV / Parquet avec des types compacts : catégories pour les colonnes texte répétées,
+# petits entiers pour les scores et les mesures. Les types "nullables" (Int8, Int16...) acceptent les
+# cellules vides, que prepare_features complète.
+#
+# `python dataset.py ingest` convertit le CSV en un magasin Parquet typé (tension déjà découpée en
+# Systolic / Diastolic, catégories encodées en dictionnaire, "Normal Weight" fusionné avec "Normal").
+# load() et iter_file() l'utilisent à la place du CSV tant qu'il est à jour.
+
+DATASET_PATH = 'Sleep_Data_Sampled.csv'
+TARGET = 'Sleep Disorder'
+
+COLUMN_DTYPES = {
+    'Person ID': 'Int32',
+    'Gender': 'category',
+    'Age': 'Int16',
+    'Occupation': 'category',
+    # float64 : mêmes valeurs que le CSV, donc mêmes entrées pour le modèle qu'une saisie dans l'application
+    'Sleep Duration': 'Float64',
+    'Quality of Sleep': 'Int8',
+    'Physical Activity Level': 'Int16',
+    'Stress Level': 'Int8',
+    'BMI Category': 'category',
+    'Blood Pressure': 'category',
+    'Heart Rate': 'Int16',
+    'Daily Steps': 'Int32',
+    'Systolic': 'Int16',
+    'Diastolic': 'Int16',
+    'Sleep Disorder': 'category',
+}
+
+# colonnes du magasin : celles du CSV, avec Systolic / Diastolic à la place de la tension
+STORE_COLUMNS = [column for column in COLUMN_DTYPES if column != 'Blood Pressure']
+SOURCE_METADATA_KEY = b'sleepy.source'
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def file_format(path) -> str:
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'csv'
+
+
+def store_path(csv_path) -> str:
+    return os.path.splitext(str(csv_path))[0] + '.parquet'
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    # même schéma quelle que soit la source : tension découpée, libellés BMI fusionnés, types compacts
+    if 'Blood Pressure' in df.columns:
+        if 'Systolic' not in df.columns or 'Diastolic' not in df.columns:
+            parts = df['Blood Pressure'].astype('string').str.extract(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+            df = df.assign(Systolic=pd.to_numeric(parts[0]), Diastolic=pd.to_numeric(parts[1]))
+        df = df.drop(columns='Blood Pressure')
+    if 'BMI Category' in df.columns:
+        bmi = df['BMI Category']
+        if not isinstance(bmi.dtype, pd.CategoricalDtype) or 'Normal Weight' in bmi.cat.categories:
+            df = df.assign(**{'BMI Category': bmi.astype(object).replace('Normal Weight', 'Normal')})
+    columns = [column for column in STORE_COLUMNS if column in df.columns]
+    df = df[columns + [column for column in df.columns if column not in columns]]
+    # colonnes déjà au bon type (magasin Parquet) : pas de copie
+    return df.astype({column: dtype for column, dtype in COLUMN_DTYPES.items()
+                      if column in df.columns and str(df[column].dtype) != dtype})
+
+
+def _source_stamp(csv_path) -> dict:
+    # taille + date de modification : vérifier la fraîcheur du magasin sans relire le CSV
+    stat = os.stat(csv_path)
+    return {'file': os.path.basename(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {'category': pa.dictionary(pa.int32(), pa.string()), 'Int8': pa.int8(), 'Int16': pa.int16(),
+             'Int32': pa.int32(), 'Float64': pa.float64()}
+    return pa.schema([(column, types[COLUMN_DTYPES[column]]) for column in columns])
+
+
+def ingest(csv_path=DATASET_PATH, destination=None, chunk_size=DEFAULT_CHUNK_SIZE) -> int:
+    # CSV -> Parquet typé, morceau par morceau ; écrit dans un fichier temporaire puis renommé
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    destination = destination or store_path(csv_path)
+    n_rows = 0
+    writer = None
+    tmp_path = destination + '.tmp'
+    try:
+        for chunk in _read_csv(csv_path, chunk_size):
+            columns = [column for column in chunk.columns if column in STORE_COLUMNS]
+            if writer is None:
+                schema = _arrow_schema(columns).with_metadata(
+                    {SOURCE_METADATA_KEY: json.dumps(_source_stamp(csv_path))})
+                writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+            writer.write_table(pa.Table.from_pandas(chunk[columns], schema=schema, preserve_index=False))
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"'{csv_path}' : fichier vide")
+    os.replace(tmp_path, destination)
+    return n_rows
+
+
+def is_fresh(csv_path, store=None) -> bool:
+    import pyarrow.parquet as pq
+
+    store = store or store_path(csv_path)
+    if not os.path.exists(store):
+        return False
+    metadata = pq.read_schema(store).metadata or {}
+    return SOURCE_METADATA_KEY in metadata and json.loads(metadata[SOURCE_METADATA_KEY]) == _source_stamp(csv_path)
+
+
+def resolve(path) -> str:
+    # fichier réellement lu : le magasin Parquet s'il existe et correspond au CSV, sinon le fichier demandé
+    if file_format(path) == 'csv' and os.path.exists(store_path(path)) and is_fresh(path):
+        return store_path(path)
+    return str(path)
+
+
+def _arrow_to_pandas(table) -> pd.DataFrame:
+    import pyarrow as pa
+
+    # entiers et flottants directement en types pandas nullables, dictionnaires en catégories
+    nullable = {pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(),
+                pa.float64(): pd.Float64Dtype()}
+    return normalize(table.to_pandas(types_mapper=nullable.get))
+
+
+def _read_csv(path, chunk_size):
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {column: dtype for column, dtype in COLUMN_DTYPES.items() if column in header}
+    for chunk in pd.read_csv(path, chunksize=chunk_size, dtype=dtypes):
+        yield normalize(chunk)
+
+
+def load(path=DATASET_PATH, columns=None, store=True) -> pd.DataFrame:
+    # DataFrame typé et normalisé ; lecture en mémoire mappée du magasin Parquet quand il est disponible
+    # (store=False : toujours le fichier demandé)
+    path = resolve(path) if store else str(path)
+    if file_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+
+        df = _arrow_to_pandas(pq.read_table(path, columns=columns, memory_map=True))
+    else:
+        df = pd.concat(_read_csv(path, DEFAULT_CHUNK_SIZE), ignore_index=True)
+    return df if columns is None else df[columns]
+
+
+def iter_file(path, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, store=True):
+    # DataFrames d'au plus chunk_size lignes ; la mémoire utilisée ne dépend pas de la taille du fichier
+    path = resolve(path) if store else str(path)
+    if file_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size, columns=columns):
+            yield _arrow_to_pandas(batch)
+        return
+
+    for chunk in _read_csv(path, chunk_size):
+        yield chunk if columns is None else chunk[columns]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Magasin Parquet typé du dataset")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help="convertit le CSV en Parquet typé")
+    ingest_parser.add_argument('--data', default=DATASET_PATH)
+    ingest_parser.add_argument('-o', '--output', default=None, help="par défaut : même nom, extension .parquet")
+    ingest_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+    if args.command == 'ingest':
+        n_rows = ingest(args.data, args.output, args.chunk_size)
+        print(f"{n_rows} lignes -> {args.output or store_path(args.data)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
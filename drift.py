@@ -0,0 +1,297 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import sleep_model
+
+# dérive des entrées : profils reçus (formulaire, chat, service) comparés à la distribution du dataset
+# d'entraînement. La référence est calculée une fois et enregistrée à côté de l'artefact : bornes de classes
+# (quantiles) et proportions par feature numérique, fréquences des catégories.
+# En ligne, mémoire constante : un histogramme sur les mêmes classes par feature numérique, les valeurs hors de
+# l'intervalle du dataset (âge 85, 0,5 h de sommeil), un compteur par catégorie connue et les catégories inconnues
+# de l'encodeur (professions extraites par le chat) comptées à part, au plus MAX_UNKNOWN valeurs retenues.
+# Scores : PSI (population stability index) et KS (écart maximal entre les fonctions de répartition, sur les
+# classes de la référence).
+#
+#   python drift.py reference              # statistiques de Sleep_Data_Sampled.csv
+#   python drift.py check export.csv       # scores d'un fichier de profils contre la référence
+
+DRIFT_PATH = 'sleep_model_drift.json'
+DRIFT_FORMAT = 'sleepy-drift'
+DRIFT_FORMAT_VERSION = 1
+N_BINS = 20
+MAX_UNKNOWN = 50
+# profils mis en attente puis ajoutés aux histogrammes d'un coup (numpy), par un thread de fond
+BUFFER_SIZE = 256
+# seuils usuels du PSI : < 0,1 stable, 0,1 - 0,25 à surveiller, > 0,25 dérive
+PSI_WARNING = 0.1
+PSI_ALERT = 0.25
+# pas de verdict avant ce nombre de profils
+MIN_SAMPLES = 100
+# proportion plancher des classes vides (le PSI n'est pas défini pour une proportion nulle)
+EPSILON = 1e-4
+
+N_NUMERIC = len(sleep_model.NUMERIC_FEATURES)
+
+
+def reference(data=dataset.DATASET_PATH, chunk_size=dataset.DEFAULT_CHUNK_SIZE, n_bins=N_BINS) -> dict:
+    # lecture par morceaux ; valeurs numériques gardées en float64 pour les quantiles : des bornes en float32
+    # (5.8 -> 5.8000002) placeraient les saisies exactes dans la classe voisine
+    numeric, counts, n_rows = [], {column: {} for column in sleep_model.CATEGORICAL_FEATURES}, 0
+    for chunk in dataset.iter_file(data, chunk_size):
+        df = sleep_model.prepare_features(chunk)
+        numeric.append(df[sleep_model.NUMERIC_FEATURES].to_numpy(dtype=np.float64))
+        for column in sleep_model.CATEGORICAL_FEATURES:
+            for value, n in df[column].astype(str).value_counts().items():
+                counts[column][value] = counts[column].get(value, 0) + int(n)
+        n_rows += len(df)
+    numeric = np.concatenate(numeric)
+
+    features = {}
+    for i, column in enumerate(sleep_model.NUMERIC_FEATURES):
+        values = numeric[:, i]
+        # bornes intérieures aux quantiles ; dédoublonnées pour les features à peu de valeurs (scores sur 10)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        histogram = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        features[column] = {
+            'edges': edges.tolist(),
+            'proportions': (histogram / len(values)).tolist(),
+            'min': float(values.min()), 'max': float(values.max()), 'mean': float(values.mean()),
+        }
+    for column in sleep_model.CATEGORICAL_FEATURES:
+        features[column] = {'proportions': {value: n / n_rows for value, n in
+                                            sorted(counts[column].items(), key=lambda item: -item[1])}}
+
+    return {
+        'format': DRIFT_FORMAT,
+        'format_version': DRIFT_FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'dataset': os.path.basename(str(data)),
+        'rows': n_rows,
+        'features_list': sleep_model.FEATURES,
+        'features': features,
+    }
+
+
+def psi(expected, actual) -> float:
+    expected = np.maximum(np.asarray(expected, dtype=np.float64), EPSILON)
+    actual = np.maximum(np.asarray(actual, dtype=np.float64), EPSILON)
+    return float(((actual - expected) * np.log(actual / expected)).sum())
+
+
+def ks(expected, actual) -> float:
+    return float(np.abs(np.cumsum(expected) - np.cumsum(actual)).max())
+
+
+def status(value, samples) -> str:
+    if samples < MIN_SAMPLES:
+        return 'insufficient'
+    if value >= PSI_ALERT:
+        return 'alert'
+    if value >= PSI_WARNING:
+        return 'warning'
+    return 'ok'
+
+
+def metric_name(column) -> str:
+    # "Sleep Duration" -> "sleep_duration" (noms de métriques Prometheus)
+    return column.lower().replace(' ', '_')
+
+
+class DriftMonitor:
+    # partagé entre les requêtes (st.cache_resource, worker du service) : un verrou pour la liste d'attente,
+    # un autre pour les compteurs, pour qu'une requête n'attende jamais l'ajout d'un lot aux histogrammes.
+    # Liste pleine : la requête réveille le thread de fond qui fait l'ajout (jamais dans la boucle du service)
+
+    def __init__(self, reference: dict):
+        self.reference = reference
+        features = reference['features']
+        self.edges = [np.asarray(features[column]['edges']) for column in sleep_model.NUMERIC_FEATURES]
+        self.low = np.array([features[column]['min'] for column in sleep_model.NUMERIC_FEATURES])
+        self.high = np.array([features[column]['max'] for column in sleep_model.NUMERIC_FEATURES])
+        self.categories = [features[column]['proportions'] for column in sleep_model.CATEGORICAL_FEATURES]
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._pending = []
+        self._fold_lock = threading.Lock()
+        self._full = threading.Event()
+        self._folder = None
+        self.reset()
+
+    @classmethod
+    def load(cls, path=DRIFT_PATH):
+        with open(path, encoding='utf-8') as f:
+            model = json.load(f)
+        if model.get('format') != DRIFT_FORMAT or model.get('format_version') != DRIFT_FORMAT_VERSION:
+            raise ValueError(f"'{path}' : format {model.get('format')} v{model.get('format_version')} non supporté")
+        if model['features_list'] != sleep_model.FEATURES:
+            raise ValueError(f"'{path}' : liste de features différente de celle du code")
+        return cls(model)
+
+    def reset(self):
+        # _fold_lock d'abord (même ordre que fold) : un lot en cours d'ajout par le thread de fond ne retombe pas
+        # dans les compteurs remis à zéro ; les profils en attente sont abandonnés avec eux
+        with self._fold_lock, self._lock, self._counts_lock:
+            self._pending = []
+            self.samples = 0
+            self.histograms = [np.zeros(len(edges) + 1, dtype=np.int64) for edges in self.edges]
+            self.sums = np.zeros(N_NUMERIC)
+            self.below = np.zeros(N_NUMERIC, dtype=np.int64)
+            self.above = np.zeros(N_NUMERIC, dtype=np.int64)
+            self.category_counts = [dict.fromkeys(categories, 0) for categories in self.categories]
+            self.unknown = [{} for _ in self.categories]
+            self.unknown_counts = [0] * len(self.categories)
+
+    def observe(self, features):
+        # features : tuple de canonical_features ; dans le chemin de la requête, un simple ajout à une liste
+        with self._lock:
+            self._pending.append(features)
+            # un réveil par lot plein, pas à chaque profil tant que le thread n'a pas vidé la liste
+            full = len(self._pending) % BUFFER_SIZE == 0
+            if full and self._folder is None:
+                # démarré au premier lot plein : les moniteurs jamais alimentés (tests, drift.py check) n'en ont pas
+                self._folder = threading.Thread(target=self._run, name='sleepy-drift', daemon=True)
+                self._folder.start()
+        if full:
+            self._full.set()
+
+    def _run(self):
+        while True:
+            self._full.wait()
+            self._full.clear()
+            self.fold()
+
+    def fold(self):
+        # _fold_lock : scores() attend le lot que le thread de fond est en train d'ajouter
+        with self._fold_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if pending:
+                # lignes -> colonnes d'un coup (zip), puis numpy pour les histogrammes et Counter pour les catégories
+                columns = list(zip(*pending))
+                self._add(np.array(columns[:N_NUMERIC], dtype=np.float64).T, columns[N_NUMERIC:])
+
+    def observe_frame(self, df: pd.DataFrame):
+        # fichier de profils (python drift.py check) : mêmes compteurs, par colonnes
+        df = sleep_model.prepare_features(df)
+        self._add(df[sleep_model.NUMERIC_FEATURES].to_numpy(dtype=np.float64),
+                  [df[column].astype(str).to_numpy() for column in sleep_model.CATEGORICAL_FEATURES])
+
+    def _add(self, numeric, categorical):
+        # numeric : tableau (profils, features numériques) ; categorical : une séquence de valeurs par feature
+        histograms = [np.bincount(np.searchsorted(edges, numeric[:, i], side='right'), minlength=len(edges) + 1)
+                      for i, edges in enumerate(self.edges)]
+        frequencies = [collections.Counter(values) for values in categorical]
+        with self._counts_lock:
+            for histogram, counts in zip(self.histograms, histograms):
+                histogram += counts
+            self.sums += numeric.sum(axis=0)
+            self.below += (numeric < self.low).sum(axis=0)
+            self.above += (numeric > self.high).sum(axis=0)
+            for i, frequency in enumerate(frequencies):
+                counts, unknown = self.category_counts[i], self.unknown[i]
+                for value, n in frequency.items():
+                    value = str(value)
+                    if value in counts:
+                        counts[value] += n
+                        continue
+                    self.unknown_counts[i] += n
+                    if value in unknown or len(unknown) < MAX_UNKNOWN:
+                        unknown[value] = unknown.get(value, 0) + n
+            self.samples += len(numeric)
+
+    def scores(self) -> dict:
+        self.fold()
+        with self._counts_lock:
+            n = self.samples
+            features = {}
+            for i, column in enumerate(sleep_model.NUMERIC_FEATURES):
+                expected = self.reference['features'][column]['proportions']
+                actual = self.histograms[i] / n if n else np.zeros(len(expected))
+                features[column] = {
+                    'psi': psi(expected, actual) if n else 0.0,
+                    'ks': ks(expected, actual) if n else 0.0,
+                    'mean': float(self.sums[i] / n) if n else None,
+                    'reference_mean': self.reference['features'][column]['mean'],
+                    'below_range_rate': float(self.below[i] / n) if n else 0.0,
+                    'above_range_rate': float(self.above[i] / n) if n else 0.0,
+                }
+            for i, column in enumerate(sleep_model.CATEGORICAL_FEATURES):
+                categories = self.categories[i]
+                # catégories inconnues : une classe de plus, absente de la référence
+                expected = list(categories.values()) + [0.0]
+                actual = list(self.category_counts[i].values()) + [self.unknown_counts[i]]
+                actual = [count / n for count in actual] if n else [0.0] * len(expected)
+                features[column] = {
+                    'psi': psi(expected, actual) if n else 0.0,
+                    'unknown_rate': self.unknown_counts[i] / n if n else 0.0,
+                    'unknown': dict(sorted(self.unknown[i].items(), key=lambda item: -item[1])),
+                }
+        max_psi = max(values['psi'] for values in features.values())
+        return {'samples': n, 'max_psi': max_psi, 'status': status(max_psi, n), 'features': features}
+
+    def stats(self) -> dict:
+        # jauges pour telemetry (sleepy_drift_psi_age...)
+        scores = self.scores()
+        features = scores['features']
+        return {
+            'samples': scores['samples'],
+            'max_psi': scores['max_psi'],
+            'psi': {metric_name(column): values['psi'] for column, values in features.items()},
+            'ks': {metric_name(column): values['ks'] for column, values in features.items() if 'ks' in values},
+            'out_of_range_rate': {metric_name(column): values['below_range_rate'] + values['above_range_rate']
+                                  for column, values in features.items() if 'below_range_rate' in values},
+            'unknown_rate': {metric_name(column): values['unknown_rate']
+                             for column, values in features.items() if 'unknown_rate' in values},
+        }
+
+
+def save(model, path=DRIFT_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dérive des entrées par rapport au dataset d'entraînement")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    reference_parser = subparsers.add_parser('reference', help="statistiques de référence du dataset")
+    reference_parser.add_argument('--data', default=dataset.DATASET_PATH, help="CSV ou Parquet, lu par morceaux")
+    reference_parser.add_argument('-o', '--output', default=DRIFT_PATH)
+    reference_parser.add_argument('--bins', type=int, default=N_BINS)
+    reference_parser.add_argument('--chunk-size', type=int, default=dataset.DEFAULT_CHUNK_SIZE)
+
+    check_parser = subparsers.add_parser('check', help="scores d'un fichier de profils contre la référence")
+    check_parser.add_argument('data', help="CSV ou Parquet, mêmes colonnes que le dataset")
+    check_parser.add_argument('--reference', default=DRIFT_PATH)
+    check_parser.add_argument('--chunk-size', type=int, default=dataset.DEFAULT_CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    if args.command == 'reference':
+        model = reference(args.data, args.chunk_size, args.bins)
+        save(model, args.output)
+        print(json.dumps({'rows': model['rows'], 'duration_s': time.perf_counter() - start}), file=sys.stderr)
+        print(args.output)
+        return 0
+
+    monitor = DriftMonitor.load(args.reference)
+    for chunk in dataset.iter_file(args.data, args.chunk_size):
+        monitor.observe_frame(chunk)
+    scores = monitor.scores()
+    print(json.dumps(scores, indent=2, ensure_ascii=False))
+    return 1 if scores['status'] == 'alert' else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import os
+import threading
+
+import caching
+import telemetry
+
+# prédiction partagée par l'interface Streamlit (app.py) et le service HTTP (service.py) ;
+# sleep_model (pandas, numpy) n'est importé qu'au chargement du modèle
+
+MODEL_MISSING = "Modèle introuvable (fichier .pkl manquant)"
+
+
+def load_brain():
+    import sleep_model
+
+    artifacts = sleep_model.load_artifacts()
+    fast_predictor = None
+    # chemin rapide sans pandas ; désactivable avec SLEEPY_FAST_PATH=0
+    # (l'artefact compact n'a pas de pipeline sklearn : le chemin rapide y est toujours utilisé)
+    if artifacts is not None and ("model" not in artifacts or os.environ.get("SLEEPY_FAST_PATH", "1") != "0"):
+        try:
+            fast_predictor = sleep_model.FastPredictor.from_artifacts(artifacts)
+        except Exception as e:
+            print(f"chemin rapide indisponible : {e}")
+    return artifacts, fast_predictor
+
+
+def load_cohorts():
+    # profils de population (cohorts.py) ; None si le fichier n'a pas été calculé
+    import cohorts
+
+    try:
+        return cohorts.Cohorts.load(os.environ.get("SLEEPY_COHORTS_PATH", cohorts.COHORTS_PATH))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        print(f"profils de population indisponibles : {e}")
+        return None
+
+
+def load_neighbors():
+    # index des profils similaires (neighbors.py) ; None s'il n'a pas été construit
+    import neighbors
+
+    try:
+        return neighbors.NeighborIndex.load(os.environ.get("SLEEPY_NEIGHBORS_PATH", neighbors.NEIGHBORS_PATH))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        print(f"index des profils similaires indisponible : {e}")
+        return None
+
+
+def load_drift():
+    # statistiques de référence du dataset (drift.py) ; None si elles n'ont pas été calculées
+    import drift
+
+    try:
+        return drift.DriftMonitor.load(os.environ.get("SLEEPY_DRIFT_PATH", drift.DRIFT_PATH))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        print(f"suivi de la dérive indisponible : {e}")
+        return None
+
+
+def json_records(df) -> list:
+    # lignes d'un DataFrame, valeurs manquantes (lignes illisibles d'un lot) en None : NaN n'est pas du JSON
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+class ModelMissing(Exception):
+    pass
+
+
+class Predictor:
+    # brain_source : fonction renvoyant (artifacts, fast_predictor), appelée à chaque prédiction
+    # pour que l'appelant décide comment attendre le chargement (spinner Streamlit, démarrage du service...)
+
+    def __init__(self, brain_source, cache=None):
+        self.brain_source = brain_source
+        self.cache = cache if cache is not None else caching.LRUCache(maxsize=4096, ttl=24 * 3600)
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self._optional = {}
+        self._optional_locks = {name: threading.Lock() for name in ("cohorts", "neighbors", "drift")}
+
+    def artifacts(self):
+        artifacts = self.brain_source()[0]
+        if artifacts is None:
+            raise ModelMissing(MODEL_MISSING)
+        return artifacts
+
+    def version(self):
+        # version de l'entraînement (train.py) ; None pour un artefact sans version ou pas encore chargé
+        artifacts = self.brain_source()[0]
+        return artifacts.get("version") if artifacts is not None else None
+
+    def classes(self) -> list:
+        # diagnostics connus du modèle, dans l'ordre de l'encodeur
+        artifacts, fast_predictor = self.brain_source()
+        if artifacts is None:
+            raise ModelMissing(MODEL_MISSING)
+        classes = fast_predictor.classes if fast_predictor is not None else artifacts['label_encoder'].classes_
+        return [str(c) for c in classes]
+
+    def run_model(self, features):
+        import pandas as pd
+        import sleep_model
+
+        artifacts, fast_predictor = self.brain_source()
+        if fast_predictor is not None:
+            with telemetry.span("predict.fast_path"):
+                return fast_predictor.predict_features(features)
+
+        # Préparation du DataFrame pour la prédiction
+        with telemetry.span("predict.frame"):
+            df_input = pd.DataFrame([features], columns=sleep_model.FEATURES)
+
+        pipeline = artifacts['model']
+        le = artifacts['label_encoder']
+
+        with telemetry.span("predict.xgboost"):
+            pred_code = pipeline.predict(df_input)
+        return le.inverse_transform(pred_code)[0]
+
+    def predict(self, user_data, observe=True) -> str:
+        # observe : profil compté dans le suivi de la dérive (False pour les appels spéculatifs)
+        import sleep_model
+
+        with telemetry.span("predict"):
+            self.artifacts()
+            # clé de cache : les 12 features après valeurs par défaut et découpage de la tension
+            features = sleep_model.canonical_features(user_data)
+            if observe:
+                monitor = self.drift(wait=False)
+                if monitor is not None:
+                    monitor.observe(features)
+            return self.cache.get_or_compute(features, lambda: self.run_model(features))
+
+    def run_proba(self, features) -> dict:
+        import pandas as pd
+        import sleep_model
+
+        artifacts, fast_predictor = self.brain_source()
+        if fast_predictor is not None:
+            probabilities = fast_predictor.predict_proba_features(features)
+            return {str(c): float(p) for c, p in zip(fast_predictor.classes, probabilities)}
+
+        df_input = pd.DataFrame([features], columns=sleep_model.FEATURES)
+        return {c: float(p) for c, p in sleep_model.predict_proba_chunk(df_input, artifacts).iloc[0].items()}
+
+    def predict_proba(self, user_data) -> dict:
+        # probabilités calibrées par classe ({classe: probabilité}), même cache que predict()
+        import sleep_model
+
+        with telemetry.span("predict_proba"):
+            self.artifacts()
+            features = sleep_model.canonical_features(user_data)
+            return self.cache.get_or_compute(("proba", features), lambda: self.run_proba(features))
+
+    def predict_proba_batch(self, records) -> list:
+        import sleep_model
+
+        return json_records(sleep_model.predict_proba_batch(records, self.artifacts()))
+
+    def predict_batch(self, records) -> list:
+        import sleep_model
+
+        return sleep_model.predict_batch(records, self.artifacts()).tolist()
+
+    def score_batch(self, records, probabilities=False) -> dict:
+        # une seule passe sur le lot : prédictions (None pour une ligne illisible), {ligne: erreur},
+        # et probabilités si demandées
+        import sleep_model
+
+        scored = sleep_model.score_batch(records, self.artifacts(), probabilities=probabilities)
+        errors = scored[sleep_model.ERROR_COLUMN].dropna()
+        result = {"predictions": scored[sleep_model.PREDICTION_COLUMN].tolist(),
+                  "errors": {int(row): error for row, error in errors.items()}}
+        if probabilities:
+            columns = [column for column in scored.columns if column.startswith(sleep_model.PROBABILITY_PREFIX)]
+            result["probabilities"] = json_records(
+                scored[columns].rename(columns=lambda column: column[len(sleep_model.PROBABILITY_PREFIX):-1]))
+        return result
+
+    def explainer(self, wait=True):
+        # construit au premier usage : importance globale calculée une fois, arbres déjà chargés ;
+        # wait=False : None si une autre requête est en train de le construire (import de xgboost, environ 1 s)
+        import sleep_model
+
+        if self._explainer is not None:
+            return self._explainer
+        if not self._explainer_lock.acquire(blocking=wait):
+            return None
+        try:
+            if self._explainer is None:
+                artifacts, fast_predictor = self.brain_source()
+                if artifacts is None:
+                    raise ModelMissing(MODEL_MISSING)
+                predictor = fast_predictor or sleep_model.FastPredictor.from_artifacts(artifacts)
+                self._explainer = sleep_model.Explainer(
+                    predictor, approximate=os.environ.get("SLEEPY_EXPLAIN_APPROXIMATE", "0") == "1")
+            return self._explainer
+        finally:
+            self._explainer_lock.release()
+
+    def explain(self, user_data, target=None, top=3, wait=True):
+        explainer = self.explainer(wait)
+        if explainer is None:
+            return None
+        with telemetry.span("explain"):
+            return explainer.explain(user_data, target, top)
+
+    def load_optional(self, name, loader, wait=True):
+        # fichiers facultatifs calculés à part (profils, index) : chargés une fois, au premier usage ;
+        # None s'ils sont absents. wait=False : None tant qu'ils ne sont pas chargés, jamais de chargement
+        # dans la requête (l'appelant les précharge en arrière-plan)
+        if name not in self._optional:
+            if not wait:
+                return None
+            with self._optional_locks[name]:
+                if name not in self._optional:
+                    self._optional[name] = loader()
+        return self._optional[name]
+
+    def cohorts(self, wait=True):
+        return self.load_optional("cohorts", load_cohorts, wait)
+
+    def cohort(self, user_data):
+        # "les personnes comme vous" : profil le plus proche (k distances) et ses statistiques ; None sans profils
+        cohorts = self.cohorts()
+        if cohorts is None:
+            return None
+        with telemetry.span("cohort"):
+            return cohorts.profile(user_data)
+
+    def neighbors(self, wait=True):
+        return self.load_optional("neighbors", load_neighbors, wait)
+
+    def similar(self, user_data, k=None, wait=True):
+        # diagnostics des k lignes du dataset les plus proches (arbre k-d, < 1 ms) ; None sans index
+        # (pas d'import de neighbors ici : il peut être en cours d'import par le thread de préchargement)
+        index = self.neighbors(wait)
+        if index is None:
+            return None
+        with telemetry.span("similar"):
+            return index.similar(user_data) if k is None else index.similar(user_data, k)
+
+    def drift(self, wait=True):
+        # suivi de la dérive des entrées ; None tant que la référence n'est pas chargée (préchargée en
+        # arrière-plan) ou si elle n'a pas été calculée
+        return self.load_optional("drift", load_drift, wait)
+
+    def drift_stats(self) -> dict:
+        monitor = self.drift(wait=False)
+        return monitor.stats() if monitor is not None else {}
+
+    def explain_batch(self, records) -> list:
+        import sleep_model
+
+        return json_records(sleep_model.explain_batch(records, self.explainer()))
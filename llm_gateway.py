@@ -0,0 +1,346 @@
+import asyncio
+import inspect
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# passerelle unique vers Gemini, partagée par toutes les sessions (app.py) ou tous les appels d'un worker (service.py) :
+# - appels asynchrones sur une boucle asyncio dédiée (thread de fond), avec des enveloppes synchrones
+#   pour les threads Streamlit
+# - sémaphore borné : au plus max_in_flight requêtes en cours, les autres attendent leur tour
+# - échéance par appel (file d'attente + tentatives + attente entre tentatives), et durée maximale par tentative
+# - nouvelle tentative sur 429 / 5xx / timeout / erreur réseau, avec attente exponentielle aléatoire ("full jitter")
+# - disjoncteur : après plusieurs échecs consécutifs, les appels échouent immédiatement pendant un temps,
+#   l'appelant se rabat alors sur une réponse locale (rapport basé sur la seule prédiction)
+
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("SLEEPY_LLM_MAX_IN_FLIGHT", "16"))
+DEFAULT_DEADLINE = float(os.environ.get("SLEEPY_LLM_DEADLINE", "30"))
+DEFAULT_ATTEMPT_TIMEOUT = float(os.environ.get("SLEEPY_LLM_ATTEMPT_TIMEOUT", "15"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("SLEEPY_LLM_MAX_RETRIES", "3"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_DONE = object()
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMUnavailable(LLMError):
+    # pas de client, ou disjoncteur ouvert : inutile d'essayer
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+def status_code(error):
+    # google.genai.errors.APIError expose .code ; les clients HTTP génériques .status_code
+    for attribute in ("code", "status_code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_network_error(error) -> bool:
+    # erreurs réseau du SDK google-genai (httpx.RequestError et ses sous-classes : connexion refusée ou coupée,
+    # DNS, délai de lecture...), reconnues par leur classe sans importer httpx au démarrage
+    return any(cls.__name__ == "RequestError" and cls.__module__.startswith("httpx") for cls in type(error).__mro__)
+
+
+def is_retryable(error) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)) or is_network_error(error):
+        return True
+    return status_code(error) in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    # fermé -> ouvert après failure_threshold échecs consécutifs ; après reset_timeout,
+    # un seul appel d'essai (semi-ouvert) décide de la refermeture. Un essai resté sans
+    # réponse (appel annulé) est abandonné au bout d'un nouveau reset_timeout.
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.probe_started is not None or self.clock() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = self.clock()
+            if self.probe_started is not None:
+                if now - self.probe_started < self.reset_timeout:
+                    return False
+            elif now - self.opened_at < self.reset_timeout:
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probe_started is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.trips += 1
+                self.opened_at = self.clock()
+                self.probe_started = None
+
+
+class LLMGateway:
+
+    def __init__(self, client_source, max_in_flight=DEFAULT_MAX_IN_FLIGHT, deadline=DEFAULT_DEADLINE,
+                 attempt_timeout=DEFAULT_ATTEMPT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES, backoff=0.5,
+                 max_backoff=8.0, breaker=None):
+        self.client_source = client_source
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+        self._semaphore = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def client(self):
+        return self.client_source()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+        }
+
+    # ---------- boucle asyncio dédiée ----------
+
+    def loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                # clients synchrones (asyncio.to_thread) : le pool par défaut est trop petit pour max_in_flight appels,
+                # et une tentative abandonnée sur échéance garde son thread jusqu'à la réponse
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=2 * self.max_in_flight,
+                                                             thread_name_prefix="sleepy-llm-call"))
+                threading.Thread(target=loop.run_forever, name="sleepy-llm", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coroutine):
+        # concurrent.futures.Future : utilisable depuis n'importe quel thread
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop())
+
+    def generate(self, deadline=None, **request):
+        return self.submit(self.agenerate(deadline, **request)).result()
+
+    def stream(self, deadline=None, **request):
+        # générateur synchrone alimenté par astream() qui tourne sur la boucle de la passerelle
+        chunks = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(deadline, **request):
+                    chunks.put((chunk, None))
+                chunks.put((_DONE, None))
+            except BaseException as e:
+                chunks.put((_DONE, e))
+
+        future = self.submit(pump())
+        try:
+            while True:
+                chunk, error = chunks.get()
+                if chunk is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield chunk
+        finally:
+            # lecteur parti avant la fin (session fermée) : on libère la place dans le sémaphore
+            future.cancel()
+
+    # ---------- appels asynchrones ----------
+
+    def _deadline_at(self, deadline):
+        return time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+    def _remaining(self, deadline_at):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            self.timeouts += 1
+            raise LLMTimeout("échéance dépassée")
+        return remaining
+
+    def _attempt_window(self, deadline_at):
+        # fin de la tentative en cours : durée maximale par tentative, sans dépasser l'échéance de l'appel
+        return min(deadline_at, time.monotonic() + self.attempt_timeout)
+
+    def _admit(self):
+        client = self.client()
+        if client is None:
+            raise LLMUnavailable("client Gemini indisponible (clé API manquante ?)")
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailable("Gemini temporairement désactivé après plusieurs échecs (disjoncteur ouvert)")
+        return client
+
+    async def _acquire(self, deadline_at):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self._remaining(deadline_at))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LLMTimeout("trop de requêtes Gemini en attente")
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _retry_or_raise(self, error, attempt, deadline_at):
+        if isinstance(error, asyncio.TimeoutError) and time.monotonic() >= deadline_at:
+            # tentative coupée par l'échéance de l'appel (longue attente dans la file) : rien ne dit que Gemini est en panne
+            self.timeouts += 1
+            self.failures += 1
+            raise LLMTimeout("échéance dépassée") from error
+
+        if not is_retryable(error):
+            if status_code(error) is not None:
+                # erreur de la requête elle-même (400...) : Gemini a répondu, ce n'est pas une panne
+                self.breaker.record_success()
+            else:
+                # pas de réponse HTTP : rien ne prouve que Gemini est joignable
+                self.breaker.record_failure()
+            self.failures += 1
+            raise LLMError(str(error)) from error
+
+        self.breaker.record_failure()
+        if isinstance(error, asyncio.TimeoutError):
+            self.timeouts += 1
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline_at:
+            self.failures += 1
+            if isinstance(error, asyncio.TimeoutError):
+                raise LLMTimeout("échéance dépassée") from error
+            raise LLMError(f"Gemini indisponible après {attempt + 1} tentative(s) : {error}") from error
+
+        self.retries += 1
+        await asyncio.sleep(delay)
+
+    async def _call(self, client, request, remaining):
+        aio = getattr(client, "aio", None)
+        if aio is not None:
+            return await asyncio.wait_for(aio.models.generate_content(**request), remaining)
+        # client synchrone (faux client de test) : exécuté dans un thread
+        return await asyncio.wait_for(asyncio.to_thread(client.models.generate_content, **request), remaining)
+
+    async def agenerate(self, deadline=None, **request):
+        deadline_at = self._deadline_at(deadline)
+        self.calls += 1
+        await self._acquire(deadline_at)
+        try:
+            for attempt in range(self.max_retries + 1):
+                client = self._admit()
+                try:
+                    response = await self._call(client, request, self._remaining(self._attempt_window(deadline_at)))
+                except LLMError:
+                    raise
+                except Exception as e:
+                    await self._retry_or_raise(e, attempt, deadline_at)
+                    continue
+                self.breaker.record_success()
+                return response
+        finally:
+            self._release()
+
+    async def _open_stream(self, client, request, deadline_at):
+        # chaque morceau doit arriver avant la fin de la fenêtre de tentative, qui repart à chaque morceau reçu
+        aio = getattr(client, "aio", None)
+        if aio is not None:
+            iterator = aio.models.generate_content_stream(**request)
+            if inspect.isawaitable(iterator):
+                iterator = await asyncio.wait_for(iterator, self._remaining(self._attempt_window(deadline_at)))
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(),
+                                                   self._remaining(self._attempt_window(deadline_at)))
+                except StopAsyncIteration:
+                    return
+                yield chunk
+
+        iterator = await asyncio.wait_for(asyncio.to_thread(client.models.generate_content_stream, **request),
+                                          self._remaining(self._attempt_window(deadline_at)))
+        while True:
+            chunk = await asyncio.wait_for(asyncio.to_thread(next, iterator, _DONE),
+                                           self._remaining(self._attempt_window(deadline_at)))
+            if chunk is _DONE:
+                return
+            yield chunk
+
+    async def astream(self, deadline=None, **request):
+        # nouvelle tentative uniquement tant que rien n'a été transmis à l'appelant
+        deadline_at = self._deadline_at(deadline)
+        self.calls += 1
+        await self._acquire(deadline_at)
+        try:
+            for attempt in range(self.max_retries + 1):
+                client = self._admit()
+                started = False
+                try:
+                    async for chunk in self._open_stream(client, request, deadline_at):
+                        started = True
+                        yield chunk
+                except LLMError:
+                    raise
+                except Exception as e:
+                    if started:
+                        self.breaker.record_failure()
+                        self.failures += 1
+                        raise LLMError(str(e)) from e
+                    await self._retry_or_raise(e, attempt, deadline_at)
+                    continue
+                self.breaker.record_success()
+                return
+        finally:
+            self._release()
@@ -0,0 +1,244 @@
+import re
+
+# extraction locale (regex) des champs de chat_prompt : les messages simples
+# ("j'ai 43 ans", "120/80", "8000 pas"...) n'ont pas besoin d'un appel à Gemini.
+# Genre, âge, profession et tension ne sont lus qu'à la première personne ("je suis", "j'ai", "ma tension")
+# ou seuls dans un morceau du message ("femme, 52 ans, comptable") : "mon fils a 12 ans", "mon médecin
+# dit 120/80" ou "le 12/05" ne sont pas des informations sur l'utilisateur
+
+FIELDS = ['Gender', 'Age', 'Occupation', 'Sleep Duration', 'Quality of Sleep', 'Physical Activity Level',
+          'Stress Level', 'BMI Category', 'Blood Pressure', 'Heart Rate', 'Daily Steps']
+
+# même regroupement thématique que celui demandé à Gemini dans chat_prompt
+FIELD_GROUPS = [
+    ['Gender', 'Age', 'Occupation'],
+    ['Sleep Duration', 'Quality of Sleep', 'Stress Level'],
+    ['Physical Activity Level', 'Daily Steps', 'Heart Rate', 'Blood Pressure', 'BMI Category'],
+]
+
+FIELD_LABELS = {
+    'Gender': "votre genre",
+    'Age': "votre âge",
+    'Occupation': "votre profession",
+    'Sleep Duration': "votre durée de sommeil par nuit",
+    'Quality of Sleep': "la qualité de votre sommeil (de 1 à 10)",
+    'Physical Activity Level': "vos minutes d'activité physique par jour",
+    'Stress Level': "votre niveau de stress (de 1 à 10)",
+    'BMI Category': "votre poids et votre taille",
+    'Blood Pressure': "votre tension artérielle (ex : 120/80)",
+    'Heart Rate': "votre fréquence cardiaque au repos",
+    'Daily Steps': "votre nombre de pas par jour",
+}
+
+OCCUPATIONS = [
+    (r"ing[ée]nieure?\s+(?:logiciel|informatique|software)|d[ée]veloppeu(?:r|se)|programmeu(?:r|se)",
+     'Software Engineer'),
+    (r"repr[ée]sentante?\s+commercia(?:l|le|ux)", 'Sales Representative'),
+    (r"commercia(?:l|le)|vendeu(?:r|se)", 'Salesperson'),
+    (r"ing[ée]nieure?", 'Engineer'),
+    (r"m[ée]decin|docteur|docteure", 'Doctor'),
+    (r"infirmi(?:er|[eè]re)", 'Nurse'),
+    (r"enseignante?|professeure?|prof|institut(?:eur|rice)", 'Teacher'),
+    (r"comptable", 'Accountant'),
+    (r"scientifique|chercheu(?:r|se)", 'Scientist'),
+    (r"avocate?", 'Lawyer'),
+    (r"manager|manageuse|directeur|directrice|chef d'[ée]quipe", 'Manager'),
+]
+
+# mots sans information : s'il ne reste qu'eux après extraction, le message est entièrement compris
+STOPWORDS = set("""
+    je j' suis un une de d' du des ai a ans et le la les l' ma mon mes me m' moi en environ à au aux par
+    fais fait faire dors dort avec pour chaque jour jours nuit nuits quotidien quotidienne quotidiens
+    est c' ça ca cela comme travaille travail bosse oui ok okay alors donc aussi sinon plutôt vers
+    autour ou bien très mais sur on nous vous y qu' que qui bonjour salut merci voilà voici
+    heure heures h min minutes minute âge age tension artérielle fréquence cardiaque pouls niveau
+    stress qualité sommeil activité physique sport marche mesure taille poids pèse kg kilos bpm
+    battements repos habituellement normalement généralement actuellement
+""".split())
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+
+# valeur seule entre deux séparateurs (début ou fin du message, virgule, point, "et")
+_SEGMENT_START = r"(?:^|[,;.!?]|\bet\b)\s*"
+_SEGMENT_END = r"\s*(?=$|[,;.!?]|\bet\b)"
+
+# entre un mot-clé et sa valeur ("stress au travail : 7") : quelques mots, sans négation ("je dors pas 8h")
+_FILLER = r"(?:(?!\b(?:pas|jamais)\b)\D){0,25}?"
+# nombre non précédé d'une négation, ni suivi d'une durée écoulée ("depuis 2 ans", "12 ans", "3 mois")
+_NOT_NEGATED = r"(?<!\bpas\s)(?<!\bjamais\s)"
+_NOT_ELAPSED = r"(?!\s*(?:ans?|mois|depuis)\b)"
+
+
+def _number(text) -> float:
+    return float(text.replace(',', '.'))
+
+
+def bmi_category(weight_kg, height_m) -> str:
+    bmi = weight_kg / (height_m ** 2)
+    if bmi < 25:
+        return 'Normal'
+    if bmi < 30:
+        return 'Overweight'
+    return 'Obese'
+
+
+class _Text:
+    # texte de travail : chaque extraction "efface" sa portion pour ne pas être relue
+    # par les règles suivantes, et ce qui reste sert à juger si le message est compris
+
+    def __init__(self, text):
+        self.value = text.lower().replace('’', "'")
+        self.rejected = False
+
+    def search(self, pattern, *groups):
+        # groups : n'efface que ces groupes ("je suis" reste lisible pour "je suis un homme de 35 ans" ;
+        # mot-clé et valeur, pas les mots entre les deux, qui comptent encore pour leftover_words)
+        match = re.search(pattern, self.value)
+        if match:
+            for group in groups or (0,):
+                start, end = match.span(group)
+                if start >= 0:
+                    self.value = self.value[:start] + ' ' * (end - start) + self.value[end:]
+        return match
+
+    def leftover_words(self):
+        words = re.findall(r"[a-zàâäçéèêëîïôöûùüÿœ]+'?|\d+", self.value)
+        return [word for word in words if word not in STOPWORDS]
+
+
+def _accept(text, fields, field, value, plausible):
+    # valeur hors bornes : on ne la garde pas et on laisse Gemini clarifier avec l'utilisateur
+    if plausible:
+        fields[field] = value
+    else:
+        text.rejected = True
+
+
+def _extract_bmi(text, fields):
+    weight = text.search(r"\b" + _NUMBER + r"\s*(?:kg|kilos?)\b")
+    height = text.search(r"\b(1)\s*m\s*(\d{2})\b|\b(1[.,]\d{1,2})\s*m\b|\b(1\d{2})\s*cm\b")
+    if weight and height:
+        if height.group(1):
+            height_m = 1 + int(height.group(2)) / 100
+        elif height.group(3):
+            height_m = _number(height.group(3))
+        else:
+            height_m = int(height.group(4)) / 100
+        fields['BMI Category'] = bmi_category(_number(weight.group(1)), height_m)
+        return
+
+    if text.search(r"\bob[èe]s(?:e|it[ée])\b"):
+        fields['BMI Category'] = 'Obese'
+    elif text.search(r"\bsurpoids\b|\ben surcharge pond[ée]rale\b"):
+        fields['BMI Category'] = 'Overweight'
+    elif text.search(r"\bpoids normal\b|\bcorpulence normale\b|\bimc normal\b"):
+        fields['BMI Category'] = 'Normal'
+
+
+def extract(message: str):
+    # renvoie (champs extraits, message entièrement compris ?)
+    text = _Text(message)
+    fields = {}
+
+    if (text.search(r"\bje suis\s+((?:un\s+)?(?:homme|garçon))\b", 1)
+            or text.search(_SEGMENT_START + r"(?:un\s+)?(?:homme|masculin)" + _SEGMENT_END)):
+        fields['Gender'] = 'Male'
+    elif (text.search(r"\bje suis\s+((?:une\s+)?(?:femme|fille))\b", 1)
+            or text.search(_SEGMENT_START + r"(?:une\s+)?(?:femme|féminin)" + _SEGMENT_END)):
+        fields['Gender'] = 'Female'
+
+    match = (text.search(r"\bj'ai\s+(\d{1,3})\s*ans\b")
+             or text.search(r"\bje suis\s+(?:âgée?\s+)?de\s+(\d{1,3})\s*ans\b")
+             or text.search(r"\bmon\s+âge\s*(?:est\s+de|est|:)?\s*(\d{1,3})\b")
+             or text.search(_SEGMENT_START + r"(?:âge\s*:?\s*)?(\d{1,3})\s*ans" + _SEGMENT_END))
+    if match:
+        _accept(text, fields, 'Age', int(match.group(1)), 1 <= int(match.group(1)) < 120)
+
+    for pattern, occupation in OCCUPATIONS:
+        if (text.search(r"\b(?:je suis|je travaille comme|je bosse comme|m[ée]tier\s*:?|profession\s*:?)\s+"
+                        r"(?:une?\s+)?(?:" + pattern + r")\b")
+                or text.search(_SEGMENT_START + r"(?:une?\s+)?(?:" + pattern + r")" + _SEGMENT_END)):
+            fields['Occupation'] = occupation
+            break
+
+    match = (text.search(r"\b(?P<key>dors|dormir|sommeil|nuits?)\b" + _FILLER
+                         + r"(?P<value>(?P<hours>\d+(?:[.,]\d+)?)\s*(?:h|heures?)\s*(?P<minutes>\d{2})?)\b",
+                         'key', 'value')
+             or text.search(r"\b" + _NOT_NEGATED + r"(?P<hours>\d+(?:[.,]\d+)?)\s*(?:h|heures?)\s*(?P<minutes>\d{2})?"
+                            r"\s*(?:de sommeil|par nuit)"))
+    if match:
+        hours = _number(match.group('hours')) + (int(match.group('minutes')) / 60 if match.group('minutes') else 0)
+        _accept(text, fields, 'Sleep Duration', round(hours, 2), 0 < hours <= 24)
+
+    match = text.search(r"\b(?P<key>qualit[ée])\b" + _FILLER + r"\b(?P<value>\d{1,2}(?:\s*/\s*10|\s*sur\s*10)?)\b"
+                        + _NOT_ELAPSED, 'key', 'value')
+    if match:
+        value = int(re.match(r"\d+", match.group('value')).group())
+        _accept(text, fields, 'Quality of Sleep', value, 1 <= value <= 10)
+
+    match = text.search(r"\b(?P<key>stress(?:[ée]e?)?)\b" + _FILLER + r"\b(?P<value>\d{1,2}(?:\s*/\s*10|\s*sur\s*10)?)\b"
+                        + _NOT_ELAPSED, 'key', 'value')
+    if match:
+        value = int(re.match(r"\d+", match.group('value')).group())
+        _accept(text, fields, 'Stress Level', value, 1 <= value <= 10)
+
+    match = text.search(r"\b(\d{1,3}(?:[\s.]\d{3})+|\d+)\s*pas\b")
+    if match:
+        fields['Daily Steps'] = int(re.sub(r"[\s.]", "", match.group(1)))
+
+    match = (text.search(r"\b" + _NOT_NEGATED + r"(?P<value>\d{2,3})\s*(?:bpm|battements)\b")
+             or text.search(r"\b(?P<key>fr[ée]quence cardiaque|rythme cardiaque|pouls|fc)\b" + _FILLER
+                            + r"\b(?P<value>\d{2,3})\b" + _NOT_ELAPSED, 'key', 'value'))
+    if match:
+        _accept(text, fields, 'Heart Rate', int(match.group('value')), 30 <= int(match.group('value')) <= 220)
+
+    match = (text.search(r"\b(?P<key>tension|pression\s+art[ée]rielle)\b" + _FILLER
+                         + r"\b(?P<value>(?P<systolic>\d{1,3})\s*/\s*(?P<diastolic>\d{1,3}))\b", 'key', 'value')
+             or text.search(_SEGMENT_START + r"(?P<systolic>\d{1,3})\s*/\s*(?P<diastolic>\d{1,3})" + _SEGMENT_END))
+    if match:
+        systolic, diastolic = int(match.group('systolic')), int(match.group('diastolic'))
+        if systolic < 30 and diastolic < 20:
+            # notation française "12/8" en cmHg
+            systolic, diastolic = systolic * 10, diastolic * 10
+        _accept(text, fields, 'Blood Pressure', f"{systolic}/{diastolic}",
+                70 <= systolic <= 250 and 40 <= diastolic <= 150)
+
+    match = (text.search(r"\b" + _NOT_NEGATED
+                         + r"(?P<value>\d{1,3})\s*(?:min(?:utes?)?)\s*(?:de\s+|d')?(?:sport|activit[ée]|marche|exercice)")
+             or text.search(r"\b(?P<key>activit[ée](?:\s+physique)?|sport)\b" + _FILLER + r"\b(?P<value>\d{1,3})\b"
+                            + _NOT_ELAPSED, 'key', 'value'))
+    if match:
+        _accept(text, fields, 'Physical Activity Level', int(match.group('value')), int(match.group('value')) <= 600)
+
+    _extract_bmi(text, fields)
+
+    return fields, bool(fields) and not text.rejected and not text.leftover_words()
+
+
+def next_question(extracted_data) -> tuple:
+    extracted_data = extracted_data or {}
+    missing = [field for field in FIELDS if extracted_data.get(field) is None]
+    if not missing:
+        return "Merci, j'ai toutes les informations nécessaires ! Je lance l'analyse de votre sommeil.", missing
+
+    for group in FIELD_GROUPS:
+        group_missing = [field for field in group if field in missing]
+        if group_missing:
+            labels = [FIELD_LABELS[field] for field in group_missing]
+            asked = labels[0] if len(labels) == 1 else ", ".join(labels[:-1]) + " et " + labels[-1]
+            return f"Merci, c'est noté ! Pouvez-vous maintenant m'indiquer {asked} ?", missing
+
+
+def local_reply(extracted_data, new_fields) -> dict:
+    # réponse au même format JSON que celle de Gemini
+    message, missing = next_question(extracted_data)
+    confidence = (len(FIELDS) - len(missing)) / len(FIELDS)
+    return {
+        "user_interaction": {"message_to_user": message, "missing_fields": missing},
+        "data_extraction": dict(new_fields),
+        "metadata": {
+            "validity_check": {"is_valid": True, "errors": []},
+            "confidence_score": confidence,
+            "ready_for_analysis": not missing,
+        }
+    }
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import sleep_model
+
+# "profils similaires" : les k lignes du dataset les plus proches d'un profil, dans l'espace des features
+# normalisées / encodées du modèle, et la répartition de leurs diagnostics.
+# Arbre k-d (scipy) construit une fois et enregistré à côté de l'artefact ; les lignes ajoutées ensuite
+# vont dans un tampon parcouru en force brute, fusionné dans l'arbre quand il devient trop gros.
+#
+#   python neighbors.py build                    # index sur Sleep_Data_Sampled.csv
+#   python neighbors.py add nouveaux_patients.csv
+
+NEIGHBORS_PATH = 'sleep_model_neighbors.joblib'
+NEIGHBORS_FORMAT = 'sleepy-neighbors'
+NEIGHBORS_FORMAT_VERSION = 1
+DEFAULT_K = 50
+# le tampon est fusionné dans l'arbre au-delà de max(MIN_PENDING, PENDING_RATIO * taille de l'arbre)
+MIN_PENDING = 1000
+PENDING_RATIO = 0.1
+
+
+class NeighborIndex:
+
+    def __init__(self, encoding, points, labels, classes, pending_points=None, pending_labels=None, built_at=None):
+        self.encoding = encoding
+        self.points = np.asarray(points)
+        self.labels = np.asarray(labels, dtype=np.int16)
+        self.classes = list(classes)
+        self.pending_points = (np.empty((0, encoding.n_columns), dtype=np.float32) if pending_points is None
+                               else np.asarray(pending_points, dtype=np.float32))
+        self.pending_labels = (np.empty(0, dtype=np.int16) if pending_labels is None
+                               else np.asarray(pending_labels, dtype=np.int16))
+        self.built_at = built_at
+        self.tree = None
+        # add() peut être appelé pendant que d'autres threads interrogent l'index
+        self._lock = threading.Lock()
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.labels) + len(self.pending_labels)
+
+    def rebuild(self):
+        from scipy.spatial import cKDTree
+
+        with self._lock:
+            if len(self.pending_labels):
+                self.points = np.concatenate([self.points, self.pending_points])
+                self.labels = np.concatenate([self.labels, self.pending_labels])
+                self.pending_points = self.pending_points[:0]
+                self.pending_labels = self.pending_labels[:0]
+            # balanced_tree=False : construction bien plus rapide, requêtes aussi rapides sur ces données ;
+            # l'arbre garde sa propre copie des points (float64), on ne conserve que celle-là
+            self.tree = cKDTree(self.points, balanced_tree=False)
+            self.points = self.tree.data
+            self.built_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    def encode_labels(self, values) -> np.ndarray:
+        codes = []
+        for value in values:
+            value = str(value)
+            if value not in self.classes:
+                self.classes.append(value)
+            codes.append(self.classes.index(value))
+        return np.asarray(codes, dtype=np.int16)
+
+    def add(self, df: pd.DataFrame) -> int:
+        # nouvelles lignes étiquetées (colonne 'Sleep Disorder'), visibles dès la requête suivante
+        df = df[df[dataset.TARGET].notna()]
+        points = self.encoding.encode_frame(df)
+        labels = self.encode_labels(df[dataset.TARGET].to_numpy())
+        with self._lock:
+            self.pending_points = np.concatenate([self.pending_points, points])
+            self.pending_labels = np.concatenate([self.pending_labels, labels])
+            full = len(self.pending_labels) > max(MIN_PENDING, PENDING_RATIO * len(self.labels))
+        if full:
+            self.rebuild()
+        return len(df)
+
+    def query(self, x, k=DEFAULT_K) -> tuple:
+        # (distances, étiquettes) des k plus proches voisins d'un point encodé, arbre + tampon
+        with self._lock:
+            tree, labels = self.tree, self.labels
+            pending_points, pending_labels = self.pending_points, self.pending_labels
+        k = min(k, len(labels) + len(pending_labels))
+        distances, indices = tree.query(x, k=min(k, len(labels)))
+        distances, found = np.atleast_1d(distances), labels[np.atleast_1d(indices)]
+        if len(pending_labels):
+            pending_distances = np.sqrt(((pending_points - x) ** 2).sum(axis=1))
+            distances = np.concatenate([distances, pending_distances])
+            found = np.concatenate([found, pending_labels])
+            nearest = np.argsort(distances, kind='stable')[:k]
+            distances, found = distances[nearest], found[nearest]
+        return distances, found
+
+    def similar(self, user_data, k=DEFAULT_K) -> dict:
+        distances, labels = self.query(self.encoding.encode(sleep_model.canonical_features(user_data)), k)
+        counts = np.bincount(labels, minlength=len(self.classes))
+        outcomes = {self.classes[i]: float(counts[i] / len(labels)) for i in np.argsort(-counts, kind='stable')
+                    if counts[i]}
+        return {
+            'k': int(len(labels)),
+            'outcomes': outcomes,
+            'max_distance': float(distances.max()),
+            # points stockés en float32 : "identique" à l'arrondi près
+            'exact_matches': int((distances < 1e-4).sum()),
+            'index_rows': len(self),
+        }
+
+    def save(self, path=NEIGHBORS_PATH):
+        import joblib
+
+        # l'arbre est sérialisé avec ses points : pas de reconstruction au chargement
+        with self._lock:
+            state = {
+                'format': NEIGHBORS_FORMAT,
+                'format_version': NEIGHBORS_FORMAT_VERSION,
+                'features': sleep_model.FEATURES,
+                'mean': self.encoding.mean, 'scale': self.encoding.scale, 'categories': self.encoding.categories,
+                'classes': self.classes, 'labels': self.labels, 'tree': self.tree,
+                'pending_points': self.pending_points, 'pending_labels': self.pending_labels,
+                'built_at': self.built_at,
+            }
+        tmp_path = path + '.tmp'
+        joblib.dump(state, tmp_path, compress=3)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=NEIGHBORS_PATH):
+        import joblib
+
+        state = joblib.load(path)
+        if state.get('format') != NEIGHBORS_FORMAT or state.get('format_version') != NEIGHBORS_FORMAT_VERSION:
+            raise ValueError(f"'{path}' : format {state.get('format')} v{state.get('format_version')} non supporté")
+        if state['features'] != sleep_model.FEATURES:
+            raise ValueError(f"'{path}' : liste de features différente de celle du code")
+
+        index = cls.__new__(cls)
+        index.encoding = sleep_model.Encoding(state['mean'], state['scale'], state['categories'])
+        index.tree = state['tree']
+        index.points = index.tree.data
+        index.labels = state['labels']
+        index.classes = state['classes']
+        index.pending_points = state['pending_points']
+        index.pending_labels = state['pending_labels']
+        index.built_at = state['built_at']
+        index._lock = threading.Lock()
+        return index
+
+
+def build(encoding, data=dataset.DATASET_PATH, chunk_size=dataset.DEFAULT_CHUNK_SIZE) -> NeighborIndex:
+    # lignes étiquetées uniquement, lues morceau par morceau (environ 200 octets par ligne dans l'arbre)
+    points, labels = [], []
+    for chunk in dataset.iter_file(data, chunk_size):
+        chunk = chunk[chunk[dataset.TARGET].notna()]
+        points.append(encoding.encode_frame(chunk))
+        labels.append(chunk[dataset.TARGET].astype(str).to_numpy())
+    labels = np.concatenate(labels)
+    classes = sorted(set(labels))
+    codes = np.searchsorted(classes, labels)
+    return NeighborIndex(encoding, np.concatenate(points), codes, classes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index des profils similaires (k plus proches voisins)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="construit l'index sur un fichier étiqueté")
+    build_parser.add_argument('--data', default=dataset.DATASET_PATH, help="CSV ou Parquet, lu par morceaux")
+    build_parser.add_argument('--artifacts', default=None, help="modèle dont on reprend la normalisation")
+    build_parser.add_argument('-o', '--output', default=NEIGHBORS_PATH)
+    build_parser.add_argument('--chunk-size', type=int, default=dataset.DEFAULT_CHUNK_SIZE)
+
+    add_parser = subparsers.add_parser('add', help="ajoute des lignes étiquetées à un index existant")
+    add_parser.add_argument('data', help="CSV ou Parquet avec la colonne 'Sleep Disorder'")
+    add_parser.add_argument('--index', default=NEIGHBORS_PATH)
+    add_parser.add_argument('--chunk-size', type=int, default=dataset.DEFAULT_CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    if args.command == 'build':
+        artifacts = sleep_model.load_artifacts(args.artifacts)
+        if artifacts is None:
+            print("ERREUR : modèle introuvable.", file=sys.stderr)
+            return 1
+        predictor = sleep_model.FastPredictor.from_artifacts(artifacts)
+        index = build(predictor.encoding(), args.data, args.chunk_size)
+        output = args.output
+    else:
+        index = NeighborIndex.load(args.index)
+        for chunk in dataset.iter_file(args.data, args.chunk_size):
+            index.add(chunk)
+        output = args.index
+
+    index.save(output)
+    print(json.dumps({'rows': len(index), 'pending': int(len(index.pending_labels)), 'classes': index.classes,
+                      'duration_s': time.perf_counter() - start}), file=sys.stderr)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
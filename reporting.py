@@ -0,0 +1,355 @@
+import os
+import time
+
+import caching
+import llm_gateway
+import telemetry
+
+# génération du rapport d'analyse par Gemini, partagée par app.py et service.py
+
+MODEL_TO_USE = "gemini-flash-latest"
+
+analysis_prompt = """
+Commence IMPÉRATIVEMENT ta réponse par la phrase exacte suivante : 'Bonjour ! Je suis l'assistant Sleepy, et voici le rapport détaillé de votre analyse.'
+
+Agis comme un assistant virtuel expert en hygiène de sommeil. Ta mission est de générer un rapport concis, structuré en exactement trois paragraphes, sans aucune liste à puces, en t'appuyant sur les données patient et le diagnostic prédictif fourni.
+
+**RÈGLE DE TON ET VOCABULAIRE :** Utilise un langage simple, accessible et non-médical. Si tu dois utiliser un mot technique ou complexe (ex: "apnée", "hygiène", "comorbidité"), **tu dois impérativement l'expliquer immédiatement entre parenthèses ( )**.
+
+STRICTE STRUCTURE DE RÉPONSE (3 PARAGRAPHES OBLIGATOIRES) :
+
+1. PARAGRAPHE D'ANALYSE (Diagnostic et Liens Factuels) :
+    - Confirme clairement le diagnostic ('Healthy', 'Insomnia', 'Sleep Apnea').
+    - Analyse et explique ce résultat en te basant **uniquement** sur les données du patient (Stress Level, Sleep Duration, BMI Category, etc.). Cite explicitement les données clés qui justifient la conclusion. (Ex: "Le diagnostic d'Insomnia est cohérent avec votre niveau de stress élevé (X/10) et votre courte durée de sommeil (Y heures).")
+
+2. PARAGRAPHE DE CONTEXTUALISATION ET D'IMPACT (Signification et Risques) :
+    - Décris brièvement ce que signifie le diagnostic pour la santé quotidienne de l'utilisateur.
+    - Pour 'Insomnia' ou 'Sleep Apnea', indique clairement les risques potentiels associés ou la nécessité de consultation médicale (surtout pour l'Apnée du Sommeil).
+
+3. PARAGRAPHE DE RECOMMANDATIONS (Trois Actions Clés) :
+    - Fournis **exactement trois** recommandations concrètes et spécifiques, adaptées au profil du patient et à son diagnostic. Chaque recommandation doit être courte et directement actionable. (Ex: "Augmenter l'activité physique à [X minutes] par jour.")
+
+Adopte un ton professionnel, concis et serviable. Le rapport final doit contenir l'ouverture, les trois paragraphes, et se terminer IMPÉRATIVEMENT par la phrase exacte suivante : 'En espérant que cela puisse vous aider et à vous revoir d'ici peu pour retester !'
+
+Les paragraphes seront de petite taille.
+
+NE JAMAIS inclure la liste des champs ou des exemples dans la réponse finale. Le corps de la réponse ne doit être que du texte formaté selon ces règles.
+"""
+
+
+def make_client():
+    if "GEMINI_API_KEY" not in os.environ:
+        return None
+    try:
+        from google import genai
+        return genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+    except Exception as e:
+        print(f"client Gemini indisponible : {e}")
+        return None
+
+
+def format_factors(factors):
+    # factors : liste de {feature, value, contribution} (sleep_model.Explainer), la plus forte d'abord
+    return "\n".join(f"- {factor['feature']} = {factor['value']} (poids {factor['contribution']:+.2f})"
+                     for factor in factors)
+
+
+def format_probabilities(probabilities):
+    return ", ".join(f"{name} {p:.0%}" for name, p in sorted(probabilities.items(), key=lambda item: -item[1]))
+
+
+def format_cohort(profile):
+    # profile : cohorts.Cohorts.profile(), statistiques du groupe de population le plus proche
+    means = profile['means']
+    return (f"Parmi les personnes qui vous ressemblent ({profile['share']:.0%} de la population) : "
+            f"{format_probabilities(profile['disorders'])}. Elles dorment en moyenne {means['Sleep Duration']:.1f} h, "
+            f"stress {means['Stress Level']:.1f}/10, {means['Daily Steps']:.0f} pas par jour.")
+
+
+def format_similar(similar):
+    # similar : neighbors.NeighborIndex.similar(), diagnostics des profils les plus proches du dataset
+    return f"Sur les {similar['k']} profils du dataset les plus proches : {format_probabilities(similar['outcomes'])}"
+
+
+def build_analysis_request(user_data, ai_prediction=None, factors=None, probabilities=None, similar=None):
+    # probabilities : seulement pour un diagnostic incertain, que le rapport doit présenter comme tel
+    prediction_text = f"Le modèle prédictif (XGBoost) a diagnostiqué : {ai_prediction}" if ai_prediction else "Le modèle prédictif n'a pas été exécuté."
+
+    sections = [f"Données du patient : {user_data}", prediction_text]
+    if probabilities:
+        sections.append(f"Le modèle hésite ({format_probabilities(probabilities)}) : signale que le résultat est "
+                        f"incertain et conseille un avis médical en cas de doute.")
+    if factors:
+        # facteurs calculés par le modèle lui-même : Gemini n'a plus à les deviner à partir des données brutes
+        sections.append(f"Facteurs déterminants (contributions du modèle au diagnostic) :\n{format_factors(factors)}")
+        explanation = "Explique le résultat à partir des facteurs déterminants ci-dessus."
+    else:
+        explanation = "Explique le résultat en te basant sur les données (Stress, IMC, Tension...)."
+    if similar:
+        sections.append(f"{format_similar(similar)}. Cite cette proportion pour rendre le résultat concret.")
+
+    sections.append(f"""Consigne :
+1. Respecte STRICTEMENT la structure de 3 paragraphes définie dans la System Instruction.
+2. {explanation}
+3. Donne 3 recommandations concrètes.""")
+    return "\n" + "\n\n".join(sections) + "\n"
+
+
+def analysis_cache_key(user_data, ai_prediction=None, factors=None, uncertain=False, similar=None):
+    import sleep_model
+
+    try:
+        canonical_data = sleep_model.canonical_features(user_data)
+    except Exception:
+        canonical_data = user_data
+    # les facteurs découlent des données, mais changent la demande envoyée à Gemini
+    factor_names = [factor['feature'] for factor in factors] if factors else None
+    key_parts = (MODEL_TO_USE, analysis_prompt, canonical_data, ai_prediction, factor_names)
+    if similar:
+        # l'index peut grandir (lignes ajoutées) : la proportion citée fait partie de la demande
+        key_parts += (format_similar(similar),)
+    return caching.hash_key(*key_parts, "incertain") if uncertain else caching.hash_key(*key_parts)
+
+
+def analysis_request(data_text):
+    return {
+        "model": MODEL_TO_USE,
+        "contents": [{"role": "user", "parts": [{"text": data_text}]}],
+        "config": {
+            "temperature": 0.2,
+            "system_instruction": analysis_prompt
+        }
+    }
+
+
+DIAGNOSIS_SUMMARIES = {
+    'Healthy': "Le modèle ne détecte pas de trouble du sommeil : vos habitudes actuelles semblent favorables "
+               "à un sommeil réparateur.",
+    'Insomnia': "Le modèle détecte un profil compatible avec une insomnie (difficulté à s'endormir ou à rester "
+                "endormi). Le stress et une durée de sommeil courte en sont souvent la cause.",
+    'Sleep Apnea': "Le modèle détecte un profil compatible avec une apnée du sommeil (pauses respiratoires pendant "
+                   "la nuit). Ce trouble mérite l'avis d'un médecin.",
+}
+
+
+def fallback_report(user_data, ai_prediction=None, factors=None, similar=None):
+    # rapport local, sans Gemini : utilisé quand la passerelle est indisponible (disjoncteur, échéance...)
+    summary = DIAGNOSIS_SUMMARIES.get(ai_prediction, "Le modèle prédictif n'a pas pu établir de diagnostic.")
+    if factors:
+        summary += " Les éléments de votre profil qui ont le plus pesé : " + \
+            ", ".join(f"{factor['feature']} ({factor['value']})" for factor in factors) + "."
+    if similar:
+        summary += f" {format_similar(similar)}."
+    return f"""Bonjour ! Je suis l'assistant Sleepy, et voici le rapport détaillé de votre analyse.
+
+**Diagnostic : {ai_prediction or 'indisponible'}.** {summary}
+
+Le rapport personnalisé est momentanément indisponible : ce résumé repose uniquement sur la prédiction du modèle. \
+Vous pouvez relancer l'analyse dans quelques minutes pour obtenir des recommandations détaillées.
+
+En espérant que cela puisse vous aider et à vous revoir d'ici peu pour retester !"""
+
+
+# tri sur les probabilités calibrées (voir `python sleep_model.py calibrate`, confidence_table) :
+# hors échantillon, un "Healthy" à 98 % ou plus se trompe dans moins de 1 % des cas
+HEALTHY_TEMPLATE_THRESHOLD = float(os.environ.get("SLEEPY_HEALTHY_TEMPLATE_THRESHOLD", "0.98"))
+LOW_CONFIDENCE_THRESHOLD = float(os.environ.get("SLEEPY_LOW_CONFIDENCE_THRESHOLD", "0.6"))
+
+
+def triage(ai_prediction, probabilities):
+    # 'template' : rapport type sans Gemini ; 'uncertain' : le rapport doit signaler l'incertitude
+    if not probabilities or ai_prediction not in probabilities:
+        return None
+    confidence = probabilities[ai_prediction]
+    if ai_prediction == 'Healthy' and confidence >= HEALTHY_TEMPLATE_THRESHOLD:
+        return 'template'
+    if confidence < LOW_CONFIDENCE_THRESHOLD:
+        return 'uncertain'
+    return None
+
+
+HEALTHY_TEMPLATE = """Bonjour ! Je suis l'assistant Sleepy, et voici le rapport détaillé de votre analyse.
+
+**Diagnostic : Healthy** (confiance du modèle : {confidence:.1%}). Le modèle ne détecte aucun signe d'insomnie \
+(difficulté à s'endormir ou à rester endormi) ni d'apnée du sommeil (pauses respiratoires pendant la nuit).{factors}
+
+Vos habitudes actuelles semblent favorables à un sommeil réparateur, qui aide à récupérer physiquement, \
+à mieux gérer le stress et à rester concentré dans la journée.
+
+Pour garder ce cap : gardez des horaires de coucher et de lever réguliers, même le week-end ; \
+maintenez une activité physique quotidienne, de préférence en dehors de la soirée ; \
+et limitez les écrans et la caféine dans les heures qui précèdent le coucher.
+
+En espérant que cela puisse vous aider et à vous revoir d'ici peu pour retester !"""
+
+
+def template_report(probabilities, factors=None):
+    # rapport type des diagnostics "Healthy" très sûrs : texte fixe, seuls la confiance et les facteurs changent
+    factors_text = ""
+    if factors:
+        factors_text = " Les éléments de votre profil qui ont le plus pesé : " + \
+            ", ".join(f"{factor['feature']} ({factor['value']})" for factor in factors) + "."
+    return HEALTHY_TEMPLATE.format(confidence=probabilities['Healthy'], factors=factors_text)
+
+
+class ReportGenerator:
+    # gateway : llm_gateway.LLMGateway partagée (sémaphore, échéances, nouvelles tentatives, disjoncteur)
+    # explain : fonction (user_data, prédiction) -> explication de sleep_model.Explainer (ou None), facultative
+    # probabilities : fonction user_data -> {classe: probabilité calibrée}, facultative (tri des rapports)
+    # similar : fonction user_data -> diagnostics des profils similaires (neighbors.py, ou None), facultative
+
+    def __init__(self, gateway, cache, explain=None, probabilities=None, similar=None):
+        self.gateway = gateway
+        self.cache = cache
+        self.explain = explain
+        self.probabilities = probabilities
+        self.similar = similar
+        self.template_reports = 0
+
+    def stats(self) -> dict:
+        return {"template_reports": self.template_reports}
+
+    def triage(self, user_data, ai_prediction):
+        # renvoie (décision, probabilités) ; sans probabilités, tous les rapports passent par Gemini
+        if self.probabilities is None or not ai_prediction:
+            return None, None
+        try:
+            probabilities = self.probabilities(user_data)
+        except Exception as e:
+            print(f"probabilités indisponibles : {e}")
+            return None, None
+        decision = triage(ai_prediction, probabilities)
+        if decision == 'template':
+            self.template_reports += 1
+        return decision, probabilities
+
+    def top_factors(self, user_data, ai_prediction):
+        # quelques millisecondes ; sans explication, le rapport est demandé comme avant
+        if self.explain is None or not ai_prediction:
+            return None
+        try:
+            explanation = self.explain(user_data, ai_prediction)
+        except Exception as e:
+            print(f"explication indisponible : {e}")
+            return None
+        return explanation["top"] if explanation else None
+
+    def similar_profiles(self, user_data):
+        if self.similar is None:
+            return None
+        try:
+            return self.similar(user_data)
+        except Exception as e:
+            print(f"profils similaires indisponibles : {e}")
+            return None
+
+    def generate_analysis(self, data_text):
+        with telemetry.span("report.gemini"):
+            response = self.gateway.generate(**analysis_request(data_text))
+        telemetry.record_usage("report", response)
+        if not response.text:
+            raise ValueError("réponse vide du modèle")
+        return response.text
+
+    def call_gemini_analysis(self, user_data, ai_prediction=None):
+        decision, probabilities = self.triage(user_data, ai_prediction)
+        if decision == 'template':
+            return template_report(probabilities, self.top_factors(user_data, ai_prediction))
+
+        if self.gateway.client() is None:
+            return "La fonction est désactivée car la clé API est manquante."
+
+        factors = self.top_factors(user_data, ai_prediction)
+        similar = self.similar_profiles(user_data)
+        uncertain = decision == 'uncertain'
+        try:
+            data_text = build_analysis_request(user_data, ai_prediction, factors, probabilities if uncertain else None,
+                                               similar)
+            return self.cache.get_or_compute(analysis_cache_key(user_data, ai_prediction, factors, uncertain, similar),
+                                             lambda: self.generate_analysis(data_text))
+
+        except llm_gateway.LLMError as e:
+            # pas mis en cache : le prochain appel retentera Gemini
+            print(f"rapport de secours : {e}")
+            return fallback_report(user_data, ai_prediction, factors, similar)
+
+        except Exception as e:
+            return f"Erreur lors de l'analyse : {str(e)}"
+
+    def stream_gemini_analysis(self, user_data, ai_prediction=None, timings=None):
+        # même rapport que call_gemini_analysis, mais rendu morceau par morceau
+        decision, probabilities = self.triage(user_data, ai_prediction)
+        if decision == 'template':
+            yield template_report(probabilities, self.top_factors(user_data, ai_prediction))
+            return
+
+        if self.gateway.client() is None:
+            yield "La fonction est désactivée car la clé API est manquante."
+            return
+
+        factors = self.top_factors(user_data, ai_prediction)
+        similar = self.similar_profiles(user_data)
+        uncertain = decision == 'uncertain'
+        key = analysis_cache_key(user_data, ai_prediction, factors, uncertain, similar)
+        cached_report = self.cache.get(key)
+        call = self.cache.single_flight.begin(key) if cached_report is None else None
+        if call is None:
+            # déjà en cache, ou une autre session est en train de le générer : on attend son résultat
+            yield cached_report if cached_report is not None else self.call_gemini_analysis(user_data, ai_prediction)
+            return
+
+        # clé déclarée dans single_flight pendant tout le flux : les appels concurrents (call_gemini_analysis,
+        # autres flux) attendent ce rapport au lieu d'en demander un second à Gemini
+        start = time.perf_counter()
+        chunks = []
+        chunk = None
+        report, error = None, None
+        try:
+            data_text = build_analysis_request(user_data, ai_prediction, factors, probabilities if uncertain else None,
+                                               similar)
+            stream = self.gateway.stream(**analysis_request(data_text))
+            for chunk in stream:
+                if not chunk.text:
+                    continue
+                if not chunks:
+                    first_token = time.perf_counter() - start
+                    if telemetry.enabled():
+                        telemetry.observe("report.stream.first_token", first_token)
+                    if timings is not None:
+                        timings["time_to_first_token"] = first_token
+                chunks.append(chunk.text)
+                yield chunk.text
+            # le dernier morceau porte le décompte des tokens de toute la réponse
+            telemetry.record_usage("report", chunk)
+            if not chunks:
+                # comme generate_analysis : rien de mesuré ni mis en cache
+                raise ValueError("réponse vide du modèle")
+            report = "".join(chunks)
+            self.cache.set(key, report)
+
+        except Exception as e:
+            error = e
+
+        finally:
+            if report is None and error is None:
+                # flux abandonné par le lecteur (fermeture du générateur) : les appels en attente ne restent pas bloqués
+                error = RuntimeError("génération du rapport interrompue")
+            self.cache.single_flight.finish(key, call, report, error)
+
+        if isinstance(error, llm_gateway.LLMError):
+            if chunks:
+                yield f"\n\nErreur lors de l'analyse : {str(error)}"
+            else:
+                print(f"rapport de secours : {error}")
+                yield fallback_report(user_data, ai_prediction, factors, similar)
+            return
+
+        if error is not None:
+            yield f"Erreur lors de l'analyse : {str(error)}"
+            return
+
+        total_time = time.perf_counter() - start
+        if telemetry.enabled():
+            telemetry.observe("report.stream", total_time)
+        if timings is not None:
+            timings["total_time"] = total_time
@@ -0,0 +1,290 @@
+import argparse
+import collections
+import contextlib
+import os
+import time
+
+import dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import audit
+import caching
+import inference
+import llm_gateway
+import reporting
+import telemetry
+
+# service HTTP (ASGI) sans Streamlit : même modèle et même cache de rapports que l'application.
+# chaque worker uvicorn charge l'artefact une seule fois, au démarrage.
+#
+#   python service.py --workers 4
+#   curl -X POST localhost:8000/predict -d '{"user_data": {"Age": 43, "Stress Level": 8}}'
+#   curl -X POST localhost:8000/explain -d '{"user_data": {"Age": 43, "Stress Level": 8}}'
+#   SLEEPY_TELEMETRY=1 python service.py && curl localhost:8000/metrics
+
+dotenv.load_dotenv()
+
+MAX_BATCH_SIZE = int(os.environ.get("SLEEPY_MAX_BATCH_SIZE", "100000"))
+
+
+class Sleepy:
+    # état d'un worker : modèle, caches et client Gemini, créés une fois par processus
+
+    def __init__(self, client_source=None, report_cache_path=None):
+        self.brain = None
+        self.client = None
+        self.client_source = client_source or reporting.make_client
+        self.predictor = inference.Predictor(lambda: self.brain)
+        self.gateway = llm_gateway.LLMGateway(lambda: self.client)
+        self.reporter = reporting.ReportGenerator(
+            self.gateway,
+            caching.ReportCache(report_cache_path or os.environ.get("SLEEPY_REPORT_CACHE", ".cache/reports.sqlite")),
+            explain=self.predictor.explain, probabilities=self.predictor.predict_proba, similar=self.predictor.similar)
+        telemetry.register("prediction_cache", self.predictor.cache.stats)
+        telemetry.register("report_cache", self.reporter.cache.stats)
+        telemetry.register("llm_gateway", self.gateway.stats)
+        telemetry.register("reports", self.reporter.stats)
+        telemetry.register("drift", self.predictor.drift_stats)
+        # un journal par worker (audit.py) : None si SLEEPY_AUDIT_LOG=0
+        self.audit_log = audit.from_env(per_process=True)
+        if self.audit_log is not None:
+            telemetry.register("audit", self.audit_log.stats)
+
+    def load(self):
+        self.brain = inference.load_brain()
+        self.client = self.client_source()
+        if self.brain[0] is not None:
+            # import de xgboost et importance globale au démarrage plutôt qu'au premier rapport
+            self.predictor.explainer()
+        self.predictor.cohorts()
+        self.predictor.neighbors()
+        self.predictor.drift()
+
+    def audit(self, event, **fields):
+        if self.audit_log is not None:
+            self.audit_log.log(event, source="service", model_version=self.predictor.version(), **fields)
+
+
+async def read_json(request, *keys):
+    # le corps doit contenir au moins une des clés
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, JSONResponse({"error": "corps JSON invalide"}, status_code=400)
+    if not isinstance(body, dict) or not any(key in body for key in keys):
+        names = " ou ".join(f"'{key}'" for key in keys)
+        return None, JSONResponse({"error": f"champ {names} manquant"}, status_code=400)
+    return body, None
+
+
+def error_response(e):
+    if isinstance(e, inference.ModelMissing):
+        return JSONResponse({"error": str(e)}, status_code=503)
+    return JSONResponse({"error": f"Erreur technique : {str(e)}"}, status_code=422)
+
+
+def check_label(predictor, label):
+    # 'prediction' fourni par le client : un diagnostic du modèle, sinon 400 (il entre dans le prompt et
+    # dans la clé du cache des rapports)
+    if not label:
+        # absent ou vide : la prédiction du modèle est utilisée
+        return None
+    try:
+        classes = predictor.classes()
+    except Exception as e:
+        return error_response(e)
+    if label not in classes:
+        return JSONResponse({"error": f"'prediction' doit être l'un des diagnostics du modèle : {', '.join(classes)}"},
+                            status_code=400)
+    return None
+
+
+async def health(request):
+    sleepy = request.app.state.sleepy
+    return JSONResponse({
+        "model_loaded": sleepy.brain is not None and sleepy.brain[0] is not None,
+        "gemini_available": sleepy.client is not None,
+        "prediction_cache": sleepy.predictor.cache.stats(),
+        "llm_gateway": sleepy.gateway.stats(),
+        "reports": sleepy.reporter.stats(),
+    })
+
+
+async def metrics(request):
+    # format texte de Prometheus, propre à chaque worker (à agréger côté Prometheus)
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def drift(request):
+    # dérive des entrées reçues par ce worker depuis son démarrage (PSI / KS par feature)
+    monitor = request.app.state.sleepy.predictor.drift(wait=False)
+    if monitor is None:
+        return JSONResponse({"error": "statistiques de référence absentes (python drift.py reference)"},
+                            status_code=503)
+    return JSONResponse(await run_in_threadpool(monitor.scores))
+
+
+async def predict(request):
+    body, error = await read_json(request, "user_data")
+    if error:
+        return error
+
+    # une prédiction unitaire prend quelques dizaines de µs (chemin rapide, souvent en cache) :
+    # plus rapide directement dans la boucle qu'avec un aller-retour vers le pool de threads
+    sleepy = request.app.state.sleepy
+    predictor = sleepy.predictor
+    start = time.perf_counter()
+    try:
+        prediction = predictor.predict(body["user_data"])
+        predict_time = time.perf_counter() - start
+        probabilities = predictor.predict_proba(body["user_data"])
+        cohort = predictor.cohort(body["user_data"])
+        similar = predictor.similar(body["user_data"])
+    except Exception as e:
+        return error_response(e)
+    sleepy.audit("prediction", inputs=body["user_data"], label=prediction, probabilities=probabilities,
+                 timings={"predict_ms": predict_time * 1000, "total_ms": (time.perf_counter() - start) * 1000})
+    return JSONResponse({"prediction": prediction, "probabilities": probabilities,
+                         "triage": reporting.triage(prediction, probabilities), "cohort": cohort,
+                         "similar": similar})
+
+
+async def predict_batch(request):
+    body, error = await read_json(request, "records")
+    if error:
+        return error
+
+    records = body["records"]
+    if not isinstance(records, list) or len(records) > MAX_BATCH_SIZE:
+        return JSONResponse({"error": f"'records' doit être une liste d'au plus {MAX_BATCH_SIZE} profils"},
+                            status_code=400)
+
+    sleepy = request.app.state.sleepy
+    predictor = sleepy.predictor
+    # ?proba=1 : probabilités calibrées en plus, une passe vectorisée de plus sur le lot
+    with_probabilities = request.query_params.get("proba") == "1"
+    start = time.perf_counter()
+    try:
+        scored = await run_in_threadpool(predictor.score_batch, records, with_probabilities)
+    except Exception as e:
+        return error_response(e)
+    # lots jusqu'à MAX_BATCH_SIZE lignes : un seul événement (effectifs par diagnostic), pas une ligne par profil
+    sleepy.audit("prediction_batch", rows=len(records), errors=len(scored["errors"]),
+                 labels=dict(collections.Counter(label for label in scored["predictions"] if label is not None)),
+                 timings={"total_ms": (time.perf_counter() - start) * 1000})
+    # profils illisibles : prédiction null, message dans "errors" ({indice: erreur}), le reste du lot est prédit
+    return JSONResponse(scored)
+
+
+async def explain(request):
+    body, error = await read_json(request, "user_data", "records")
+    if error:
+        return error
+
+    predictor = request.app.state.sleepy.predictor
+    if "user_data" in body:
+        target = body.get("prediction") or None
+        error = check_label(predictor, target)
+        if error:
+            return error
+        # quelques millisecondes (pred_contribs) : hors de la boucle, comme les lots
+        try:
+            explanation = await run_in_threadpool(predictor.explain, body["user_data"], target,
+                                                  int(body.get("top", 3)))
+        except Exception as e:
+            return error_response(e)
+        return JSONResponse(explanation)
+
+    records = body["records"]
+    if not isinstance(records, list) or len(records) > MAX_BATCH_SIZE:
+        return JSONResponse({"error": f"'records' doit être une liste d'au plus {MAX_BATCH_SIZE} profils"},
+                            status_code=400)
+    try:
+        explanations = await run_in_threadpool(predictor.explain_batch, records)
+    except Exception as e:
+        return error_response(e)
+    return JSONResponse({"explanations": explanations})
+
+
+async def report(request):
+    body, error = await read_json(request, "user_data")
+    if error:
+        return error
+
+    sleepy = request.app.state.sleepy
+    user_data = body["user_data"]
+    error = check_label(sleepy.predictor, body.get("prediction"))
+    if error:
+        return error
+    try:
+        prediction = body.get("prediction") or sleepy.predictor.predict(user_data)
+    except Exception as e:
+        return error_response(e)
+
+    if request.query_params.get("stream") == "1":
+        # itérateur synchrone : Starlette le consomme dans son pool de threads
+        return StreamingResponse(audited_stream(sleepy, user_data, prediction), media_type="text/plain; charset=utf-8")
+
+    # appel Gemini bloquant : exécuté hors de la boucle pour ne pas bloquer les autres requêtes
+    start = time.perf_counter()
+    text = await run_in_threadpool(sleepy.reporter.call_gemini_analysis, user_data, prediction)
+    sleepy.audit("report", inputs=user_data, label=prediction, report=text,
+                 timings={"total_ms": (time.perf_counter() - start) * 1000})
+    return JSONResponse({"prediction": prediction, "report": text})
+
+
+def audited_stream(sleepy, user_data, prediction):
+    # journalisé une fois le rapport entièrement envoyé (pas d'événement si le client se déconnecte avant)
+    timings, chunks = {}, []
+    for chunk in sleepy.reporter.stream_gemini_analysis(user_data, prediction, timings):
+        chunks.append(chunk)
+        yield chunk
+    sleepy.audit("report", inputs=user_data, label=prediction, report="".join(chunks),
+                 timings={"first_token_ms": timings.get("time_to_first_token", 0) * 1000,
+                          "total_ms": timings.get("total_time", 0) * 1000} if timings else {})
+
+
+def create_app(client_source=None, report_cache_path=None):
+    sleepy = Sleepy(client_source, report_cache_path)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await run_in_threadpool(sleepy.load)
+        try:
+            yield
+        finally:
+            if sleepy.audit_log is not None:
+                await run_in_threadpool(sleepy.audit_log.close)
+
+    app = Starlette(routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/drift", drift, methods=["GET"]),
+        Route("/predict", predict, methods=["POST"]),
+        Route("/predict/batch", predict_batch, methods=["POST"]),
+        Route("/explain", explain, methods=["POST"]),
+        Route("/report", report, methods=["POST"]),
+    ], lifespan=lifespan)
+    app.state.sleepy = sleepy
+    return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Service HTTP de prédiction Sleepy")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processus uvicorn, chacun avec son propre modèle chargé au démarrage")
+    args = parser.parse_args(argv)
+
+    uvicorn.run("service:create_app", factory=True, host=args.host, port=args.port, workers=args.workers,
+                log_level="warning", access_log=False)
+
+
+if __name__ == '__main__':
+    main()
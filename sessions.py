@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+
+import chat_context
+
+# état des sessions Streamlit hors de st.session_state (qui ne garde que l'identifiant) :
+# - un seul transcript compact par session, d'où sont dérivés l'affichage et l'historique envoyé à Gemini
+#   (le texte de l'utilisateur n'est plus stocké deux fois) ;
+# - au-delà d'un budget en octets par session, les anciens messages puis le rapport sont déchargés sur disque ;
+# - les sessions inactives sont écrites sur disque et retirées de la mémoire, puis restaurées à la reprise.
+#
+#   python sessions.py stats      # octets par session, relevés par l'application
+
+SESSIONS_DIR = '.cache/sessions'
+DEFAULT_BUDGET = 32 * 1024
+# messages gardés en mémoire quand la session dépasse son budget (au moins ceux renvoyés à Gemini)
+DEFAULT_RESIDENT_TURNS = 2 * chat_context.DEFAULT_MAX_TURNS
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+# les fichiers contiennent des données de santé : supprimés au bout de 7 jours sans activité
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+HOUSEKEEPING_INTERVAL = 60
+STATS_FILE = 'stats.json'
+
+
+@dataclass(slots=True)
+class Turn:
+    role: str
+    text: str
+    # réponse du modèle : champs encore manquants (la réponse compacte envoyée à Gemini en est dérivée)
+    missing_fields: tuple = None
+    # False : message seulement affiché (appel à Gemini échoué, message final du diagnostic)
+    in_history: bool = False
+    # tokens et issue de la lecture de la réponse de Gemini
+    usage: dict = None
+
+
+def turn_from_dict(data) -> Turn:
+    turn = Turn(**data)
+    if turn.missing_fields is not None:
+        turn.missing_fields = tuple(turn.missing_fields)
+    return turn
+
+
+def _nbytes(value, seen) -> int:
+    # estimation de la mémoire occupée ; un objet référencé plusieurs fois n'est compté qu'une fois
+    if value is None or isinstance(value, bool) or id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        # clés non comptées : des constantes partagées (noms de champs, métriques)
+        size += sum(_nbytes(item, seen) for item in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_nbytes(item, seen) for item in value)
+    elif isinstance(value, Turn):
+        size += sum(_nbytes(getattr(value, name), seen) for name in Turn.__slots__)
+    return size
+
+
+@dataclass(slots=True)
+class Session:
+    id: str
+    directory: str
+    turns: list = field(default_factory=list)
+    archived_turns: int = 0
+    # messages archivés qui faisaient partie de l'historique envoyé à Gemini
+    archived_history: int = 0
+    report_text: str = ''
+    report_archived: bool = False
+    last_access: float = field(default_factory=time.time)
+    nbytes: int = 0
+    # taille des `measured` premiers messages, déjà mesurés (un message n'est plus modifié après son tour)
+    turns_nbytes: int = 0
+    measured: int = 0
+
+    def path(self, suffix) -> str:
+        return os.path.join(self.directory, self.id + suffix)
+
+    def append(self, role, text, missing_fields=None, in_history=False) -> Turn:
+        turn = Turn(role, text, None if missing_fields is None else tuple(missing_fields), in_history)
+        self.turns.append(turn)
+        return turn
+
+    def messages(self) -> list:
+        return [{"role": turn.role, "content": turn.text} for turn in self.turns]
+
+    def chat_history(self) -> list:
+        # format attendu par chat_context.build_chat_request ; réponses du modèle recompactées à la volée
+        history = []
+        for turn in self.turns:
+            if not turn.in_history:
+                continue
+            if turn.role == "user":
+                history.append({"role": "user", "content": turn.text})
+            else:
+                history.append({"role": "model", "content": chat_context.compact_model_reply({
+                    "user_interaction": {"message_to_user": turn.text,
+                                         "missing_fields": list(turn.missing_fields or ())}})})
+        return history
+
+    def token_usage(self) -> list:
+        return [turn.usage for turn in self.turns if turn.usage is not None]
+
+    def archived(self) -> list:
+        # anciens messages déchargés sur disque, relus à la demande (non gardés en mémoire)
+        if not self.archived_turns or not os.path.exists(self.path('.jsonl')):
+            return []
+        with open(self.path('.jsonl'), encoding='utf-8') as f:
+            return [turn_from_dict(json.loads(line)) for line in f]
+
+    def report(self) -> str:
+        if self.report_archived:
+            with open(self.path('.report.md'), encoding='utf-8') as f:
+                return f.read()
+        return self.report_text
+
+    def set_report(self, text):
+        # nouveau rapport ou remise à zéro : l'ancien rapport archivé ne doit plus être relu (restauration)
+        if os.path.exists(self.path('.report.md')):
+            os.remove(self.path('.report.md'))
+        self.report_text = text or ''
+        self.report_archived = False
+
+    def measure(self) -> int:
+        # incrémental : seuls les messages ajoutés depuis la dernière mesure sont parcourus
+        self.turns_nbytes += sum(_nbytes(turn, set()) for turn in self.turns[self.measured:])
+        self.measured = len(self.turns)
+        self.nbytes = (self.turns_nbytes + sys.getsizeof(self.turns) + _nbytes(self.report_text, set())
+                       + sys.getsizeof(self))
+        return self.nbytes
+
+    def archive_turns(self, keep):
+        # les plus anciens messages partent en fin de fichier JSON Lines, les `keep` derniers restent
+        old, self.turns = self.turns[:max(0, len(self.turns) - keep)], self.turns[max(0, len(self.turns) - keep):]
+        if not old:
+            return 0
+        with open(self.path('.jsonl'), 'a', encoding='utf-8') as f:
+            for turn in old:
+                f.write(json.dumps(asdict(turn), ensure_ascii=False) + '\n')
+        self.archived_turns += len(old)
+        self.archived_history += sum(turn.in_history for turn in old)
+        self.turns_nbytes, self.measured = 0, 0
+        return len(old)
+
+    def archive_report(self):
+        if self.report_archived or not self.report_text:
+            return False
+        tmp_path = self.path('.report.md.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.report_text)
+        os.replace(tmp_path, self.path('.report.md'))
+        self.report_text = ''
+        self.report_archived = True
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'turns': [asdict(turn) for turn in self.turns],
+            'archived_turns': self.archived_turns,
+            'archived_history': self.archived_history,
+            'report_text': self.report_text,
+            'report_archived': self.report_archived,
+        }
+
+    @classmethod
+    def from_dict(cls, data, directory):
+        session = cls(data['id'], directory, [turn_from_dict(turn) for turn in data['turns']],
+                      data['archived_turns'], data['archived_history'], data['report_text'], data['report_archived'])
+        session.measure()
+        return session
+
+
+class SessionStore:
+    # partagé entre les sessions Streamlit (st.cache_resource), donc protégé par un verrou
+
+    def __init__(self, directory=SESSIONS_DIR, budget=DEFAULT_BUDGET, resident_turns=DEFAULT_RESIDENT_TURNS,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.budget = budget
+        self.resident_turns = resident_turns
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_housekeeping = 0.0
+        self.created = 0
+        self.evictions = 0
+        self.restored = 0
+        self.archived_turns = 0
+        self.archived_reports = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def get(self, session_id) -> Session:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._restore(session_id)
+                self._sessions[session_id] = session
+            session.last_access = now
+        self.housekeeping(now)
+        return session
+
+    def _restore(self, session_id) -> Session:
+        state_path = os.path.join(self.directory, session_id + '.json')
+        if not os.path.exists(state_path):
+            self.created += 1
+            session = Session(session_id, self.directory)
+            session.measure()
+            return session
+        with open(state_path, encoding='utf-8') as f:
+            session = Session.from_dict(json.load(f), self.directory)
+        os.remove(state_path)
+        self.restored += 1
+        return session
+
+    def compact(self, session):
+        # après chaque tour : si la session dépasse le budget, anciens messages puis rapport sur disque
+        if session.measure() <= self.budget:
+            return session.nbytes
+        self.archived_turns += session.archive_turns(self.resident_turns)
+        if session.measure() > self.budget and session.archive_report():
+            self.archived_reports += 1
+            session.measure()
+        return session.nbytes
+
+    def evict(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        tmp_path = session.path('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, session.path('.json'))
+        self.evictions += 1
+
+    def housekeeping(self, now=None):
+        # au plus une fois par minute : sessions inactives sur disque, vieux fichiers supprimés, métriques écrites
+        now = now or time.time()
+        with self._lock:
+            if now - self._last_housekeeping < HOUSEKEEPING_INTERVAL:
+                return
+            self._last_housekeeping = now
+            idle = [session_id for session_id, session in self._sessions.items()
+                    if now - session.last_access > self.idle_timeout]
+        for session_id in idle:
+            self.evict(session_id)
+        self.purge(now)
+        self.write_stats()
+
+    def purge(self, now=None):
+        now = now or time.time()
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name != STATS_FILE and now - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def disk_usage(self) -> dict:
+        names = [name for name in os.listdir(self.directory) if name != STATS_FILE]
+        return {'files': len(names),
+                'bytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in names)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = sorted(session.nbytes for session in self._sessions.values())
+        return {
+            'sessions': len(sizes),
+            'bytes': sum(sizes),
+            'bytes_per_session': {
+                'mean': statistics.fmean(sizes) if sizes else 0.0,
+                'p50': sizes[len(sizes) // 2] if sizes else 0,
+                'p90': sizes[int(len(sizes) * 0.9)] if sizes else 0,
+                'max': sizes[-1] if sizes else 0,
+            },
+            'budget': self.budget,
+            'created': self.created,
+            'evictions': self.evictions,
+            'restored': self.restored,
+            'archived_turns': self.archived_turns,
+            'archived_reports': self.archived_reports,
+            'disk': self.disk_usage(),
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+
+    def write_stats(self):
+        path = os.path.join(self.directory, STATS_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.stats(), f, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mémoire des sessions de l'application")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stats_parser = subparsers.add_parser('stats', help="dernières métriques écrites par l'application")
+    stats_parser.add_argument('--dir', default=os.environ.get('SLEEPY_SESSION_DIR', SESSIONS_DIR))
+
+    args = parser.parse_args(argv)
+    if args.command == 'stats':
+        path = os.path.join(args.dir, STATS_FILE)
+        if not os.path.exists(path):
+            print(f"ERREUR : '{path}' introuvable (application pas encore lancée ?)", file=sys.stderr)
+            return 1
+        with open(path, encoding='utf-8') as f:
+            print(f.read())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,926 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+
+ARTIFACTS_PATH = 'sleep_model_artifacts.pkl'
+# format compact : booster XGBoost natif (UBJSON) + tableaux NumPy mappés en mémoire + JSON
+COMPACT_PATH = 'sleep_model_artifacts'
+COMPACT_FORMAT = 'sleepy-compact'
+COMPACT_FORMAT_VERSION = 1
+
+NUMERIC_FEATURES = ['Age', 'Sleep Duration', 'Quality of Sleep', 'Physical Activity Level',
+                    'Stress Level', 'Heart Rate', 'Daily Steps', 'Systolic', 'Diastolic']
+CATEGORICAL_FEATURES = ['Gender', 'Occupation', 'BMI Category']
+FEATURES = NUMERIC_FEATURES + CATEGORICAL_FEATURES
+
+# champs saisis par l'utilisateur (formulaire / conversation) : la tension arrive en "Sys/Dia"
+INPUT_FIELDS = ['Gender', 'Age', 'Occupation', 'Sleep Duration', 'Quality of Sleep', 'Physical Activity Level',
+                'Stress Level', 'BMI Category', 'Blood Pressure', 'Heart Rate', 'Daily Steps']
+
+# valeurs utilisées quand un champ est absent (les mêmes que predict_sleep_disorder)
+DEFAULTS = {
+    'Age': 30,
+    'Gender': 'Male',
+    'Occupation': 'Engineer',
+    'Sleep Duration': 7.0,
+    'Quality of Sleep': 7,
+    'Physical Activity Level': 40,
+    'Stress Level': 5,
+    'BMI Category': 'Normal',
+    'Heart Rate': 70,
+    'Daily Steps': 5000,
+    'Systolic': 120,
+    'Diastolic': 80,
+}
+
+PREDICTION_COLUMN = 'Predicted Sleep Disorder'
+ERROR_COLUMN = 'Error'
+PROBABILITY_PREFIX = 'P('
+DEFAULT_CHUNK_SIZE = 50_000
+DATASET_PATH = dataset.DATASET_PATH
+
+
+def load_artifacts(path=None):
+    # sans chemin explicite : artefact compact s'il existe, sinon le pickle historique
+    if path is None:
+        if os.path.isdir(COMPACT_PATH):
+            try:
+                return load_compact(COMPACT_PATH)
+            except (ValueError, OSError) as e:
+                print(f"artefact compact ignoré ({e}), chargement de '{ARTIFACTS_PATH}'", file=sys.stderr)
+        path = ARTIFACTS_PATH
+
+    if os.path.isdir(path):
+        return load_compact(path)
+
+    import joblib
+    try:
+        return joblib.load(path)
+    except FileNotFoundError:
+        return None
+
+
+BLOOD_PRESSURE_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+BLOOD_PRESSURE_ERROR = "Blood Pressure invalide : {!r} (format Sys/Dia attendu, ex : 120/80)"
+
+# conversion de chaque champ saisi (canonical_features)
+FIELD_TYPES = {
+    'Age': int,
+    'Sleep Duration': float,
+    'Quality of Sleep': int,
+    'Physical Activity Level': int,
+    'Stress Level': int,
+    'Heart Rate': int,
+    'Daily Steps': int,
+    'Systolic': int,
+    'Diastolic': int,
+    'Gender': str,
+    'Occupation': str,
+    'BMI Category': str,
+}
+
+
+def split_blood_pressure(blood_pressure: pd.Series) -> pd.DataFrame:
+    # découpage "120/80" -> Systolic / Diastolic sur toute la colonne d'un coup (dataset d'entraînement)
+    parts = blood_pressure.astype('string').str.extract(BLOOD_PRESSURE_PATTERN.pattern)
+    return pd.DataFrame({
+        'Systolic': pd.to_numeric(parts[0]).fillna(DEFAULTS['Systolic']).astype(int),
+        'Diastolic': pd.to_numeric(parts[1]).fillna(DEFAULTS['Diastolic']).astype(int),
+    }, index=blood_pressure.index)
+
+
+def prepare_features(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+
+    if 'Systolic' not in df.columns or 'Diastolic' not in df.columns:
+        if 'Blood Pressure' in df.columns:
+            df[['Systolic', 'Diastolic']] = split_blood_pressure(df['Blood Pressure'])
+
+    for column in FEATURES:
+        if column not in df.columns:
+            df[column] = DEFAULTS[column]
+        else:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                # colonnes "category" (lecture typée par morceaux) : la valeur par défaut ou "Normal"
+                # ne fait pas forcément partie des catégories du morceau
+                df[column] = df[column].astype(object)
+            df[column] = df[column].fillna(DEFAULTS[column])
+
+    # même fusion que lors de l'entraînement
+    df['BMI Category'] = df['BMI Category'].replace('Normal Weight', 'Normal')
+
+    for column in NUMERIC_FEATURES:
+        df[column] = pd.to_numeric(df[column])
+
+    return df[FEATURES]
+
+
+def _field(user_data, name):
+    # absent, None, NaN (cellule vide d'un CSV) ou chaîne vide : valeur par défaut ; valeur illisible : ValueError
+    value = user_data.get(name)
+    cast = FIELD_TYPES[name]
+    if type(value) is cast and value == value:
+        # cas courant (formulaire, JSON, colonnes d'un CSV) : rien à convertir ; NaN (float) passe par le défaut
+        return value
+    if value is None or value is pd.NA or value == '' or (isinstance(value, float) and value != value):
+        value = DEFAULTS[name]
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} invalide : {value!r}") from None
+
+
+def canonical_features(user_data) -> tuple:
+    # les 12 features du modèle, dans l'ordre de FEATURES, après valeurs par défaut et découpage de la tension.
+    # Un lot passe par canonical_frame (mêmes règles, colonne par colonne) ; une valeur illisible lève ValueError
+    if 'Systolic' in user_data and 'Diastolic' in user_data:
+        # lignes du magasin Parquet : tension déjà découpée
+        systolic, diastolic = _field(user_data, 'Systolic'), _field(user_data, 'Diastolic')
+    else:
+        bp = user_data.get('Blood Pressure')
+        if bp is None or bp is pd.NA or bp == '' or (isinstance(bp, float) and bp != bp):
+            systolic, diastolic = DEFAULTS['Systolic'], DEFAULTS['Diastolic']
+        else:
+            match = BLOOD_PRESSURE_PATTERN.match(str(bp))
+            if match is None:
+                raise ValueError(BLOOD_PRESSURE_ERROR.format(bp))
+            systolic, diastolic = int(match.group(1)), int(match.group(2))
+
+    bmi_category = _field(user_data, 'BMI Category')
+    if bmi_category == 'Normal Weight':
+        bmi_category = 'Normal'
+
+    return (
+        _field(user_data, 'Age'),
+        _field(user_data, 'Sleep Duration'),
+        _field(user_data, 'Quality of Sleep'),
+        _field(user_data, 'Physical Activity Level'),
+        _field(user_data, 'Stress Level'),
+        _field(user_data, 'Heart Rate'),
+        _field(user_data, 'Daily Steps'),
+        systolic,
+        diastolic,
+        _field(user_data, 'Gender'),
+        _field(user_data, 'Occupation'),
+        bmi_category,
+    )
+
+
+def _parse_blood_pressure(value):
+    # (systolique, diastolique) d'une valeur "Sys/Dia" ; valeur manquante : défaut ; illisible : None
+    if value == '':
+        return DEFAULTS['Systolic'], DEFAULTS['Diastolic']
+    match = BLOOD_PRESSURE_PATTERN.match(str(value))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def canonical_frame(df: pd.DataFrame):
+    # canonical_features pour un lot, colonne par colonne (mêmes valeurs par défaut, même découpage de la tension) :
+    # renvoie (features des lignes valides, {index: erreur} des autres). Tension et champs texte : une conversion
+    # par valeur distincte (pd.factorize), pas par ligne ; seules les lignes en erreur sont parcourues en Python
+    n = len(df)
+    columns, checks = {}, []
+
+    def read(name):
+        if name not in df.columns:
+            columns[name] = np.full(n, DEFAULTS[name], dtype=object if FIELD_TYPES[name] is str else None)
+            return
+        values = df[name]
+        if FIELD_TYPES[name] is str:
+            # code -1 (valeur manquante) : dernière case, la valeur par défaut
+            codes, uniques = pd.factorize(values)
+            converted = [str(value) if value != '' else DEFAULTS[name] for value in uniques]
+            columns[name] = np.array(converted + [DEFAULTS[name]], dtype=object)[codes]
+            return
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            missing = np.isnan(numbers)
+        else:
+            missing = (values.isna() | (values.astype(object) == '')).to_numpy()
+            numbers = pd.to_numeric(values.where(~missing), errors='coerce').to_numpy(dtype=np.float64,
+                                                                                      na_value=np.nan)
+        invalid = ~missing & ~np.isfinite(numbers)
+        checks.append((invalid, values, lambda value: f"{name} invalide : {value!r}"))
+        columns[name] = np.where(missing | invalid, DEFAULTS[name], numbers).astype(FIELD_TYPES[name])
+
+    if 'Systolic' in df.columns and 'Diastolic' in df.columns:
+        # lignes du magasin Parquet : tension déjà découpée
+        read('Systolic')
+        read('Diastolic')
+    elif 'Blood Pressure' in df.columns:
+        values = df['Blood Pressure']
+        codes, uniques = pd.factorize(values)
+        parsed = [_parse_blood_pressure(value) for value in uniques]
+        pairs = np.array([pair or (0, 0) for pair in parsed] + [(DEFAULTS['Systolic'], DEFAULTS['Diastolic'])],
+                         dtype=np.int64).reshape(-1, 2)[codes]
+        invalid = np.array([pair is None for pair in parsed] + [False])[codes]
+        checks.append((invalid, values, BLOOD_PRESSURE_ERROR.format))
+        columns['Systolic'], columns['Diastolic'] = pairs[:, 0], pairs[:, 1]
+    else:
+        columns['Systolic'] = np.full(n, DEFAULTS['Systolic'])
+        columns['Diastolic'] = np.full(n, DEFAULTS['Diastolic'])
+    for name in FEATURES:
+        if name not in columns:
+            read(name)
+
+    features = pd.DataFrame(columns, index=df.index)[FEATURES]
+    features['BMI Category'] = features['BMI Category'].replace('Normal Weight', 'Normal')
+
+    errors = {}
+    invalid = np.logical_or.reduce([check[0] for check in checks]) if checks else np.zeros(n, dtype=bool)
+    if invalid.any():
+        # première erreur de chaque ligne, dans l'ordre de canonical_features (tension d'abord)
+        for position in np.flatnonzero(invalid):
+            for bad, values, message in checks:
+                if bad[position]:
+                    errors[df.index[position]] = message(values.iloc[position])
+                    break
+        features = features[~invalid]
+    return features, errors
+
+
+TREE_ARRAYS = ['feature', 'threshold', 'children', 'value', 'roots', 'tree_class']
+
+
+def compile_trees(booster) -> dict:
+    model = json.loads(booster.save_raw('json'))['learner']['gradient_booster']['model']
+
+    # tous les arbres sont mis bout à bout ; chaque nœud occupe deux cases (slot = 2 * nœud)
+    # pour que le choix gauche/droite soit un simple "+ 0 / + 1" sur le slot
+    feature, threshold, children, value, roots = [], [], [], [], []
+    max_depth = 0
+    for tree in model['trees']:
+        offset = len(value)
+        roots.append(2 * offset)
+        left_children = tree['left_children']
+        depth = [0] * len(left_children)
+        for node, left_child in enumerate(left_children):
+            if left_child == -1:
+                # feuille : elle pointe sur elle-même, la descente peut donc continuer sans effet
+                feature += [0, 0]
+                threshold += [np.inf, np.inf]
+                children += [2 * (offset + node), 2 * (offset + node)]
+                value.append(tree['split_conditions'][node])
+            else:
+                right_child = tree['right_children'][node]
+                depth[left_child] = depth[right_child] = depth[node] + 1
+                feature += [tree['split_indices'][node]] * 2
+                threshold += [tree['split_conditions'][node]] * 2
+                children += [2 * (offset + left_child), 2 * (offset + right_child)]
+                value.append(0.0)
+        max_depth = max(max_depth, max(depth))
+
+    trees = {
+        'feature': np.asarray(feature, dtype=np.intp),
+        'threshold': np.asarray(threshold, dtype=np.float32),
+        'children': np.asarray(children, dtype=np.intp),
+        'value': np.repeat(np.asarray(value, dtype=np.float64), 2),
+        'roots': np.asarray(roots, dtype=np.intp),
+        'tree_class': np.asarray(model['tree_info'], dtype=np.intp),
+    }
+    return trees, max_depth
+
+
+def softmax(margin, temperature=1.0) -> np.ndarray:
+    # temperature : calibration (voir fit_calibration) ; 1.0 = probabilités brutes du booster
+    scaled = np.asarray(margin, dtype=np.float64) / temperature
+    exp = np.exp(scaled - scaled.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def calibration_temperature(artifacts) -> float:
+    return float((artifacts.get('calibration') or {}).get('temperature', 1.0))
+
+
+class Encoding:
+    # normalisation (StandardScaler) et one-hot (OneHotEncoder) du pipeline, recopiées dans des tableaux NumPy :
+    # base de FastPredictor, et utilisée seule par les index construits sur l'espace des features (cohorts.py,
+    # neighbors.py), qui en gardent une copie et restent ainsi utilisables tels quels après un réentraînement
+
+    def __init__(self, mean, scale, categories):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.categories = [list(values) for values in categories]
+        self.n_numeric = len(NUMERIC_FEATURES)
+
+        # index de colonne one-hot pour chaque (feature, catégorie) ; catégorie inconnue -> que des zéros
+        self.category_index = []
+        offset = self.n_numeric
+        for values in self.categories:
+            self.category_index.append({category: offset + i for i, category in enumerate(values)})
+            offset += len(values)
+        self.n_columns = offset
+
+    def encode(self, features) -> np.ndarray:
+        x = np.zeros(self.n_columns, dtype=np.float32)
+        numeric = np.asarray(features[:self.n_numeric], dtype=np.float64)
+        x[:self.n_numeric] = (numeric - self.mean) / self.scale
+        for index, category in zip(self.category_index, features[self.n_numeric:]):
+            column = index.get(category)
+            if column is not None:
+                x[column] = 1.0
+        return x
+
+    def encode_frame(self, df: pd.DataFrame) -> np.ndarray:
+        df = prepare_features(df)
+        x = np.zeros((len(df), self.n_columns), dtype=np.float32)
+        x[:, :self.n_numeric] = (df[NUMERIC_FEATURES].to_numpy(dtype=np.float64) - self.mean) / self.scale
+        rows = np.arange(len(df))
+        for index, column in zip(self.category_index, CATEGORICAL_FEATURES):
+            columns = df[column].map(index)
+            known = columns.notna().to_numpy()
+            x[rows[known], columns[known].to_numpy(dtype=np.intp)] = 1.0
+        return x
+
+    def encoding(self):
+        # copie de l'encodage seul (sans les arbres d'un FastPredictor), pour les index qui l'enregistrent
+        return Encoding(self.mean, self.scale, self.categories)
+
+
+class FastPredictor(Encoding):
+    # chemin rapide pour une seule prédiction : pas de DataFrame, pas de ColumnTransformer.
+    # l'encodage (Encoding) et les arbres XGBoost sont recopiés une fois pour toutes
+    # dans des tableaux NumPy au chargement.
+
+    def __init__(self, mean, scale, categories, classes, trees, max_depth, booster_loader, bias=None,
+                 temperature=1.0):
+        super().__init__(mean, scale, categories)
+        self.classes = np.asarray(classes, dtype=object)
+        self.temperature = float(temperature)
+
+        # np.asarray sur un np.memmap : même mémoire, sans le surcoût de la sous-classe à chaque take() ;
+        # index (stockés en int8 / int32 dans l'artefact compact) élargis une fois en np.intp, sinon take()
+        # les convertirait à chaque niveau de chaque prédiction (quelques centaines de Ko par processus)
+        for name in TREE_ARRAYS:
+            array = np.asarray(trees[name])
+            setattr(self, name, array.astype(np.intp, copy=False) if array.dtype.kind == 'i' else array)
+        self.max_depth = max_depth
+
+        # le booster XGBoost ne sert qu'aux prédictions par lot et aux valeurs manquantes :
+        # il est chargé à la première utilisation
+        self._booster_loader = booster_loader
+        self._booster = None
+        self._booster_lock = threading.Lock()
+
+        if bias is None:
+            # marge de départ (base_score) : on la déduit du booster plutôt que de la recalculer
+            zero = np.zeros(self.n_columns, dtype=np.float32)
+            bias = self.booster.inplace_predict(zero[None, :], predict_type='margin')[0] - self._tree_margin(zero)
+        self.bias = np.asarray(bias, dtype=np.float64)
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        if 'predictor' in artifacts:
+            return artifacts['predictor']
+
+        pipeline = artifacts['model']
+        preprocessor = pipeline.named_steps['preprocessor']
+        scaler = preprocessor.named_transformers_['num']
+        encoder = preprocessor.named_transformers_['cat']
+        booster = pipeline.named_steps['classifier'].get_booster()
+
+        trees, max_depth = compile_trees(booster)
+        return cls(scaler.mean_, scaler.scale_, encoder.categories_, artifacts['label_encoder'].classes_,
+                   trees, max_depth, lambda: booster, temperature=calibration_temperature(artifacts))
+
+    @property
+    def booster(self):
+        if self._booster is None:
+            with self._booster_lock:
+                if self._booster is None:
+                    self._booster = self._booster_loader()
+        return self._booster
+
+    def _tree_margin(self, x):
+        slots = self.roots
+        for _ in range(self.max_depth):
+            go_right = x.take(self.feature.take(slots)) >= self.threshold.take(slots)
+            slots = self.children.take(slots + go_right)
+        return np.bincount(self.tree_class, weights=self.value.take(slots), minlength=len(self.classes))
+
+    def margin(self, features) -> np.ndarray:
+        x = self.encode(features)
+        if np.isnan(x).any():
+            # valeur manquante : on laisse XGBoost appliquer ses directions par défaut
+            return self.booster.inplace_predict(x[None, :], predict_type='margin')[0]
+        return self._tree_margin(x) + self.bias
+
+    def predict_proba_features(self, features) -> np.ndarray:
+        return softmax(self.margin(features), self.temperature)
+
+    def predict_proba(self, user_data) -> np.ndarray:
+        # probabilités calibrées, dans l'ordre de self.classes
+        return self.predict_proba_features(canonical_features(user_data))
+
+    def predict_features(self, features) -> str:
+        # softmax est monotone : l'argmax de la marge suffit
+        return str(self.classes[np.argmax(self.margin(features))])
+
+    def predict(self, user_data) -> str:
+        return self.predict_features(canonical_features(user_data))
+
+    def predict_frame(self, df: pd.DataFrame) -> np.ndarray:
+        probabilities = self.booster.inplace_predict(self.encode_frame(df))
+        return self.classes[np.argmax(probabilities, axis=1)]
+
+    def predict_proba_frame(self, df: pd.DataFrame) -> np.ndarray:
+        margin = self.booster.inplace_predict(self.encode_frame(df), predict_type='margin')
+        return softmax(margin, self.temperature)
+
+
+class Explainer:
+    # contributions de chaque feature à la prédiction (TreeSHAP natif de XGBoost, pred_contribs),
+    # les colonnes one-hot étant regroupées sur leur feature d'origine : 12 valeurs par classe.
+    # approximate=True : méthode de Saabas (approx_contribs), environ 4 fois plus rapide.
+
+    def __init__(self, predictor, approximate=False):
+        self.predictor = predictor
+        self.approximate = approximate
+
+        # matrice (colonnes encodées + biais) -> features ; la colonne de biais n'est rattachée à aucune feature
+        groups = np.zeros((predictor.n_columns + 1, len(FEATURES)))
+        for i in range(predictor.n_numeric):
+            groups[i, i] = 1.0
+        for j, index in enumerate(predictor.category_index):
+            for column in index.values():
+                groups[column, predictor.n_numeric + j] = 1.0
+        self.groups = groups
+
+        # importance globale (gain total des splits), calculée une fois au chargement
+        gains = predictor.booster.get_score(importance_type='total_gain')
+        names = predictor.booster.feature_names or [f'f{i}' for i in range(predictor.n_columns)]
+        column_gain = np.zeros(predictor.n_columns + 1)
+        for i, name in enumerate(names):
+            column_gain[i] = gains.get(name, 0.0)
+        feature_gain = column_gain @ groups
+        order = np.argsort(-feature_gain)
+        self.global_importance = {FEATURES[i]: float(feature_gain[i] / feature_gain.sum()) for i in order}
+
+    def raw_contributions(self, x: np.ndarray) -> np.ndarray:
+        # (lignes, classes, colonnes encodées + biais) ; la somme sur le dernier axe est la marge
+        import xgboost
+
+        return self.predictor.booster.predict(xgboost.DMatrix(x), pred_contribs=True,
+                                              approx_contribs=self.approximate)
+
+    def explain_features(self, features, target=None, top=3) -> dict:
+        raw = self.raw_contributions(self.predictor.encode(features)[None, :])[0]
+        if target is None:
+            class_index = int(np.argmax(raw.sum(axis=-1)))
+        else:
+            matches = np.flatnonzero(self.predictor.classes == target)
+            if not len(matches):
+                raise ValueError(f"diagnostic '{target}' inconnu ({', '.join(map(str, self.predictor.classes))})")
+            class_index = int(matches[0])
+
+        contributions = raw[class_index] @ self.groups
+        # les facteurs qui poussent vers la classe prédite d'abord
+        order = np.argsort(-contributions)
+        return {
+            'prediction': str(self.predictor.classes[class_index]),
+            'contributions': {FEATURES[i]: float(contributions[i]) for i in order},
+            'top': [{'feature': FEATURES[i], 'value': features[i], 'contribution': float(contributions[i])}
+                    for i in order[:top]],
+        }
+
+    def explain(self, user_data, target=None, top=3) -> dict:
+        return self.explain_features(canonical_features(user_data), target, top)
+
+    def explain_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        # lot : une seule passe XGBoost pour toutes les lignes, contributions vers la classe prédite
+        raw = self.raw_contributions(self.predictor.encode_frame(df))
+        class_index = np.argmax(raw.sum(axis=-1), axis=1)
+        contributions = raw[np.arange(len(df)), class_index] @ self.groups
+        result = pd.DataFrame(contributions, index=df.index, columns=[f'contribution_{f}' for f in FEATURES])
+        result.insert(0, PREDICTION_COLUMN, self.predictor.classes[class_index])
+        return result
+
+
+def _sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _index_dtype(array):
+    largest = int(array.max()) if array.size else 0
+    for dtype in (np.int8, np.int16, np.int32):
+        if largest <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def export_compact(artifacts, directory=COMPACT_PATH) -> dict:
+    import xgboost
+
+    predictor = FastPredictor.from_artifacts(artifacts)
+    os.makedirs(directory, exist_ok=True)
+
+    predictor.booster.save_model(os.path.join(directory, 'booster.ubj'))
+    arrays = {name: getattr(predictor, name) for name in TREE_ARRAYS}
+    arrays['mean'] = predictor.mean
+    arrays['scale'] = predictor.scale
+    for name, array in arrays.items():
+        # index dans le plus petit entier signé qui les contient (int8 pour feature et tree_class, int32 pour
+        # children et roots), élargis au chargement ; XGBoost stocke seuils et feuilles en float32, on ne perd
+        # donc rien à les écrire ainsi (ils restent mappés en mémoire)
+        if array.dtype.kind == 'i':
+            array = array.astype(_index_dtype(array))
+        elif name in ('threshold', 'value'):
+            array = array.astype(np.float32)
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+    with open(os.path.join(directory, 'model.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'numeric_features': NUMERIC_FEATURES,
+            'categorical_features': CATEGORICAL_FEATURES,
+            'categories': predictor.categories,
+            'classes': [str(c) for c in predictor.classes],
+            'bias': predictor.bias.tolist(),
+            'max_depth': predictor.max_depth,
+            'version': artifacts.get('version'),
+            'calibration': artifacts.get('calibration'),
+        }, f, ensure_ascii=False, indent=2)
+
+    files = sorted(name for name in os.listdir(directory) if name != 'manifest.json')
+    manifest = {
+        'format': COMPACT_FORMAT,
+        'format_version': COMPACT_FORMAT_VERSION,
+        'xgboost_version': xgboost.__version__,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'files': {
+            name: {'sha256': _sha256(os.path.join(directory, name)),
+                   'size': os.path.getsize(os.path.join(directory, name))}
+            for name in files
+        },
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_compact(directory=COMPACT_PATH, verify=True) -> dict:
+    try:
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"'{directory}' : manifest.json manquant")
+
+    if manifest.get('format') != COMPACT_FORMAT or manifest.get('format_version') != COMPACT_FORMAT_VERSION:
+        raise ValueError(f"'{directory}' : format {manifest.get('format')} v{manifest.get('format_version')} "
+                         f"non supporté (attendu {COMPACT_FORMAT} v{COMPACT_FORMAT_VERSION})")
+
+    for name, entry in manifest['files'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+            raise ValueError(f"'{path}' manquant ou tronqué")
+        if verify and _sha256(path) != entry['sha256']:
+            raise ValueError(f"'{path}' corrompu (sha256 différent du manifest)")
+
+    with open(os.path.join(directory, 'model.json'), encoding='utf-8') as f:
+        model = json.load(f)
+    if model['numeric_features'] != NUMERIC_FEATURES or model['categorical_features'] != CATEGORICAL_FEATURES:
+        raise ValueError(f"'{directory}' : liste de features différente de celle du code")
+
+    # mmap_mode='r' : les pages sont partagées entre les workers qui chargent le même fichier
+    def array(name):
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+
+    def load_booster():
+        import xgboost
+        return xgboost.Booster(model_file=os.path.join(directory, 'booster.ubj'))
+
+    predictor = FastPredictor(array('mean'), array('scale'), model['categories'], model['classes'],
+                              {name: array(name) for name in TREE_ARRAYS}, model['max_depth'],
+                              load_booster, bias=model['bias'], temperature=calibration_temperature(model))
+    return {'predictor': predictor, 'manifest': manifest, 'calibration': model.get('calibration')}
+
+
+def iter_chunks(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+        return
+
+    # itérable de dictionnaires : on ne matérialise qu'un chunk à la fois
+    records = iter(data)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            return
+        yield pd.DataFrame.from_records(chunk)
+
+
+def predict_chunk(df: pd.DataFrame, artifacts) -> pd.Series:
+    if 'model' not in artifacts:
+        # artefact compact : pas de pipeline sklearn, on passe directement par le booster
+        return pd.Series(artifacts['predictor'].predict_frame(df), index=df.index, name=PREDICTION_COLUMN)
+
+    pipeline = artifacts['model']
+    le = artifacts['label_encoder']
+
+    pred_codes = pipeline.predict(prepare_features(df))
+    return pd.Series(le.inverse_transform(pred_codes), index=df.index, name=PREDICTION_COLUMN)
+
+
+def score_chunk(df: pd.DataFrame, artifacts, explainer=None, probabilities=False) -> pd.DataFrame:
+    # colonnes produites pour un morceau : prédiction (ou prédiction + contributions avec explainer),
+    # probabilités, et ERROR_COLUMN. Une ligne illisible n'arrête pas le lot : son erreur est renseignée,
+    # ses autres colonnes restent vides
+    features, errors = canonical_frame(df)
+    parts = []
+    if len(features):
+        parts.append(explainer.explain_frame(features) if explainer is not None
+                     else predict_chunk(features, artifacts).to_frame())
+        if probabilities:
+            parts.append(predict_proba_chunk(features, artifacts).add_prefix(PROBABILITY_PREFIX).add_suffix(')'))
+    else:
+        # morceau sans aucune ligne valide : mêmes colonnes que les autres (en-tête du CSV)
+        columns = [PREDICTION_COLUMN]
+        if explainer is not None:
+            columns += [f'contribution_{f}' for f in FEATURES]
+        if probabilities:
+            columns += [f'{PROBABILITY_PREFIX}{c})' for c in FastPredictor.from_artifacts(artifacts).classes]
+        parts.append(pd.DataFrame(columns=columns))
+    scored = pd.concat(parts, axis=1).reindex(df.index)
+    scored[PREDICTION_COLUMN] = scored[PREDICTION_COLUMN].astype(object).where(scored[PREDICTION_COLUMN].notna(),
+                                                                                 None)
+    scored[ERROR_COLUMN] = pd.Series(errors, index=list(errors), dtype=object).reindex(df.index)
+    return scored
+
+
+def score_batch(data, artifacts, chunk_size=DEFAULT_CHUNK_SIZE, explainer=None, probabilities=False) -> pd.DataFrame:
+    scored = [score_chunk(chunk, artifacts, explainer, probabilities) for chunk in iter_chunks(data, chunk_size)]
+    if not scored:
+        return score_chunk(pd.DataFrame(columns=INPUT_FIELDS), artifacts, explainer, probabilities)
+    return pd.concat(scored, ignore_index=not isinstance(data, pd.DataFrame))
+
+
+def predict_batch(data, artifacts, chunk_size=DEFAULT_CHUNK_SIZE) -> pd.Series:
+    # None pour les lignes illisibles (voir score_batch pour leur erreur)
+    return score_batch(data, artifacts, chunk_size)[PREDICTION_COLUMN]
+
+
+def predict_proba_chunk(df: pd.DataFrame, artifacts) -> pd.DataFrame:
+    if 'model' not in artifacts:
+        predictor = artifacts['predictor']
+        probabilities, classes = predictor.predict_proba_frame(df), predictor.classes
+    else:
+        pipeline = artifacts['model']
+        # marge brute du booster, puis la même calibration que le chemin rapide
+        margin = pipeline.named_steps['classifier'].predict(
+            pipeline.named_steps['preprocessor'].transform(prepare_features(df)), output_margin=True)
+        probabilities = softmax(margin, calibration_temperature(artifacts))
+        classes = artifacts['label_encoder'].classes_
+    return pd.DataFrame(probabilities, index=df.index, columns=[str(c) for c in classes])
+
+
+def predict_proba_batch(data, artifacts, chunk_size=DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    # une colonne par classe, probabilités calibrées ; NaN pour les lignes illisibles
+    scored = score_batch(data, artifacts, chunk_size, probabilities=True)
+    columns = [column for column in scored.columns if column.startswith(PROBABILITY_PREFIX)]
+    return scored[columns].rename(columns=lambda column: column[len(PROBABILITY_PREFIX):-1])
+
+
+def explain_batch(data, explainer, chunk_size=DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    return score_batch(data, None, chunk_size, explainer)
+
+
+def score_csv(input_file, output_file, artifacts, chunk_size=DEFAULT_CHUNK_SIZE, explainer=None,
+              probabilities=False):
+    # renvoie (lignes écrites, lignes en erreur) ; une ligne illisible est recopiée avec son erreur
+    # dans ERROR_COLUMN, sans prédiction
+    n_rows = n_errors = 0
+    # un magasin Parquet (dataset.py) se score comme un CSV ; un CSV est recopié tel quel, colonnes d'origine comprises
+    if dataset.file_format(input_file) == 'parquet':
+        chunks = dataset.iter_file(input_file, chunk_size)
+    else:
+        chunks = pd.read_csv(input_file, chunksize=chunk_size)
+    for i, chunk in enumerate(chunks):
+        scored = score_chunk(chunk, artifacts, explainer, probabilities)
+        chunk = chunk.drop(columns=scored.columns, errors='ignore').join(scored)
+        chunk.to_csv(output_file, header=(i == 0), index=False)
+        n_rows += len(chunk)
+        n_errors += int(scored[ERROR_COLUMN].notna().sum())
+    return n_rows, n_errors
+
+
+def calibration_metrics(probabilities, y, n_bins=15) -> dict:
+    # log-loss, score de Brier et erreur de calibration (ECE) sur la classe prédite
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    n = len(y)
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == y
+    bins = np.minimum((confidence * n_bins).astype(int), n_bins - 1)
+    ece = sum(abs(correct[bins == b].mean() - confidence[bins == b].mean()) * (bins == b).sum() / n
+              for b in np.unique(bins))
+    onehot = np.eye(probabilities.shape[1])[y]
+    return {
+        'log_loss': float(-np.log(np.clip(probabilities[np.arange(n), y], 1e-15, None)).mean()),
+        'brier': float(((probabilities - onehot) ** 2).sum(axis=1).mean()),
+        'ece': float(ece),
+        'accuracy': float(correct.mean()),
+    }
+
+
+def confidence_table(probabilities, y, classes, thresholds=(0.5, 0.6, 0.8, 0.9, 0.95, 0.98, 0.99)) -> dict:
+    # pour choisir les seuils de tri : part des prédictions au-dessus du seuil et taux d'erreur parmi elles
+    confidence = probabilities.max(axis=1)
+    predicted = probabilities.argmax(axis=1)
+    table = {}
+    for i, name in enumerate(classes):
+        rows = []
+        for threshold in thresholds:
+            selected = (predicted == i) & (confidence >= threshold)
+            rows.append({'threshold': threshold, 'coverage': float(selected.mean()),
+                         'error_rate': float((y[selected] != i).mean()) if selected.any() else None})
+        table[str(name)] = rows
+    return table
+
+
+def fit_temperature(margin, y) -> float:
+    # température qui minimise la log-loss des marges hors échantillon
+    from scipy.optimize import minimize_scalar
+
+    def log_loss(log_temperature):
+        probabilities = softmax(margin, np.exp(log_temperature))
+        return -np.log(np.clip(probabilities[np.arange(len(y)), y], 1e-15, None)).mean()
+
+    return float(np.exp(minimize_scalar(log_loss, bounds=(-3, 3), method='bounded').x))
+
+
+def temperature_calibration(margin, y, classes, **details) -> dict:
+    temperature = fit_temperature(margin, y)
+    probabilities = softmax(margin, temperature)
+    return {
+        'method': 'temperature',
+        'temperature': temperature,
+        **details,
+        'fitted_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'held_out_before': calibration_metrics(softmax(margin), y),
+        'held_out_after': calibration_metrics(probabilities, y),
+        'confidence_table': confidence_table(probabilities, y, classes),
+    }
+
+
+def fit_calibration(artifacts, csv_path=DATASET_PATH, folds=5, seed=42) -> dict:
+    # le modèle livré est entraîné sur tout le dataset : ses probabilités sur ces mêmes lignes sont
+    # trop optimistes. On ré-entraîne donc des copies du pipeline (mêmes hyperparamètres) sur
+    # folds - 1 parts, on prédit la part mise de côté, et on ajuste une température sur ces marges
+    # "hors échantillon". Diviser la marge par une température ne change jamais la classe prédite.
+    from sklearn.base import clone
+    from sklearn.model_selection import StratifiedKFold
+
+    df = dataset.load(csv_path)
+    y = artifacts['label_encoder'].transform(df['Sleep Disorder'])
+    x = prepare_features(df)
+
+    margin = np.zeros((len(df), len(artifacts['label_encoder'].classes_)))
+    for train, held_out in StratifiedKFold(folds, shuffle=True, random_state=seed).split(x, y):
+        pipeline = clone(artifacts['model']).fit(x.iloc[train], y[train])
+        margin[held_out] = pipeline.named_steps['classifier'].predict(
+            pipeline.named_steps['preprocessor'].transform(x.iloc[held_out]), output_margin=True)
+
+    return temperature_calibration(margin, y, artifacts['label_encoder'].classes_,
+                                   folds=folds, rows=len(df), dataset=os.path.basename(csv_path))
+
+
+def check_fast_path(artifacts, csv_path=DATASET_PATH, predictor=None):
+    # parité chemin rapide / pipeline sklearn sur tout le dataset (chemin CSV ou DataFrame), puis latence unitaire
+    df = csv_path if isinstance(csv_path, pd.DataFrame) else dataset.load(csv_path)
+    fast_predictor = predictor or FastPredictor.from_artifacts(artifacts)
+
+    expected = predict_batch(df, artifacts).to_numpy()
+    expected_proba = predict_proba_batch(df, artifacts).to_numpy()
+
+    latencies = []
+    mismatches = 0
+    max_proba_error = 0.0
+    for i, user_data in enumerate(df.to_dict('records')):
+        start = time.perf_counter()
+        label = fast_predictor.predict(user_data)
+        latencies.append(time.perf_counter() - start)
+
+        mismatches += label != expected[i]
+        max_proba_error = max(max_proba_error,
+                              float(np.abs(fast_predictor.predict_proba(user_data) - expected_proba[i]).max()))
+
+    batch_mismatches = int((fast_predictor.predict_frame(df) != expected).sum())
+
+    latencies_us = np.percentile(latencies, [50, 99]) * 1e6
+    return {
+        'rows': len(df),
+        'mismatches': int(mismatches),
+        'batch_mismatches': batch_mismatches,
+        'max_proba_error': max_proba_error,
+        'p50_us': float(latencies_us[0]),
+        'p99_us': float(latencies_us[1]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outils hors-ligne du modèle Sleepy")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    score_parser = subparsers.add_parser('score', help="prédire un fichier CSV complet, par chunks")
+    score_parser.add_argument('input', help="CSV d'entrée ('-' pour stdin)")
+    score_parser.add_argument('-o', '--output', default='-', help="CSV de sortie ('-' pour stdout)")
+    score_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    score_parser.add_argument('--proba', action='store_true', help="ajouter les probabilités calibrées de chaque classe")
+    score_parser.add_argument('--explain', action='store_true',
+                              help="ajouter la contribution de chaque feature à la prédiction")
+    score_parser.add_argument('--approximate', action='store_true',
+                              help="avec --explain : contributions approchées (Saabas), plus rapides")
+    score_parser.add_argument('--artifacts', default=None,
+                              help=f"par défaut '{COMPACT_PATH}' s'il existe, sinon '{ARTIFACTS_PATH}'")
+
+    check_parser = subparsers.add_parser('check', help="vérifier le chemin rapide contre le pipeline sklearn")
+    check_parser.add_argument('--data', default=DATASET_PATH)
+    check_parser.add_argument('--artifacts', default=ARTIFACTS_PATH)
+    check_parser.add_argument('--compact', default=COMPACT_PATH, help="artefact compact à vérifier aussi, s'il existe")
+
+    calibrate_parser = subparsers.add_parser(
+        'calibrate', help="ajuster la calibration des probabilités (validation croisée) et l'enregistrer dans l'artefact")
+    calibrate_parser.add_argument('--data', default=DATASET_PATH)
+    calibrate_parser.add_argument('--artifacts', default=ARTIFACTS_PATH)
+    calibrate_parser.add_argument('--folds', type=int, default=5)
+    calibrate_parser.add_argument('--compact', default=COMPACT_PATH, help="artefact compact à régénérer ('' pour aucun)")
+
+    export_parser = subparsers.add_parser('export', help="convertir le pickle en artefact compact (UBJSON + NumPy)")
+    export_parser.add_argument('--artifacts', default=ARTIFACTS_PATH)
+    export_parser.add_argument('-o', '--output', default=COMPACT_PATH)
+
+    args = parser.parse_args(argv)
+
+    artifacts = load_artifacts(args.artifacts)
+    if artifacts is None:
+        print(f"ERREUR : '{args.artifacts or ARTIFACTS_PATH}' introuvable.", file=sys.stderr)
+        return 1
+
+    if args.command == 'score':
+        input_file = sys.stdin if args.input == '-' else args.input
+        explainer = Explainer(FastPredictor.from_artifacts(artifacts), args.approximate) if args.explain else None
+        if args.output == '-':
+            n_rows, n_errors = score_csv(input_file, sys.stdout, artifacts, args.chunk_size, explainer, args.proba)
+        else:
+            with open(args.output, 'w', newline='') as output_file:
+                n_rows, n_errors = score_csv(input_file, output_file, artifacts, args.chunk_size, explainer,
+                                             args.proba)
+        print(f"{n_rows - n_errors} lignes prédites, {n_errors} en erreur (colonne '{ERROR_COLUMN}').",
+              file=sys.stderr)
+
+    elif args.command == 'check':
+        if 'model' not in artifacts:
+            print(f"ERREUR : '{args.artifacts}' ne contient pas le pipeline sklearn de référence.", file=sys.stderr)
+            return 1
+
+        results = {'pickle': check_fast_path(artifacts, args.data)}
+        if os.path.isdir(args.compact):
+            try:
+                compact = load_compact(args.compact)
+            except ValueError as e:
+                print(f"ERREUR : {e}", file=sys.stderr)
+                return 1
+            results['compact'] = check_fast_path(artifacts, args.data, compact['predictor'])
+        print(json.dumps(results, indent=2))
+
+        for name, result in results.items():
+            if result['mismatches'] or result['batch_mismatches'] or result['max_proba_error'] > 1e-4:
+                print(f"ERREUR : le chemin rapide ({name}) diverge du pipeline.", file=sys.stderr)
+                return 1
+
+    elif args.command == 'calibrate':
+        import joblib
+
+        if 'model' not in artifacts:
+            print(f"ERREUR : '{args.artifacts}' ne contient pas le pipeline sklearn à ré-entraîner.", file=sys.stderr)
+            return 1
+        artifacts['calibration'] = fit_calibration(artifacts, args.data, args.folds)
+        joblib.dump(artifacts, args.artifacts)
+        if args.compact:
+            export_compact(artifacts, args.compact)
+        print(json.dumps(artifacts['calibration'], indent=2))
+
+    elif args.command == 'export':
+        manifest = export_compact(artifacts, args.output)
+        size = sum(entry['size'] for entry in manifest['files'].values())
+        print(f"artefact compact écrit dans '{args.output}' ({size / 1024:.0f} Ko).", file=sys.stderr)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
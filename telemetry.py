@@ -0,0 +1,233 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# mesures légères agrégées dans le processus : durée de chaque phase (histogrammes), compteurs (tokens Gemini)
+# et valeurs lues à la demande sur les objets existants (taux de réussite des caches, passerelle, sessions).
+# Export au format texte de Prometheus (render), par /metrics du service, la page d'administration de
+# l'application ou SLEEPY_METRICS_PORT.
+#
+# SLEEPY_TELEMETRY=1 pour activer ; désactivé, span() renvoie un objet vide partagé (un test, pas d'horloge).
+
+PREFIX = 'sleepy'
+# bornes des histogrammes de durée, en secondes (de 50 µs pour le modèle à 30 s pour Gemini)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = os.environ.get('SLEEPY_TELEMETRY', '0') == '1'
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_collectors = {}
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q) -> float:
+        # estimation par interpolation linéaire dans le seau qui contient le quantile
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+def observe(phase, seconds):
+    with _lock:
+        histogram = _histograms.get(phase)
+        if histogram is None:
+            histogram = _histograms[phase] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class Span:
+    # durée d'une phase ; end() peut être appelé avant la sortie du bloc (st.rerun, st.stop)
+
+    __slots__ = ('phase', 'start')
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+
+    def end(self):
+        if self.start is not None:
+            observe(self.phase, time.perf_counter() - self.start)
+            self.start = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def end(self):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(phase):
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(phase)
+
+
+def record_tokens(call, prompt_tokens, response_tokens):
+    # tokens facturés par Gemini ; une valeur absente (réponse sans usage_metadata) n'est pas comptée
+    if prompt_tokens:
+        count('llm_tokens_total', prompt_tokens, call=call, kind='prompt')
+    if response_tokens:
+        count('llm_tokens_total', response_tokens, call=call, kind='response')
+
+
+def record_usage(call, response):
+    usage = getattr(response, 'usage_metadata', None)
+    record_tokens(call, getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None))
+
+
+def register(name, collector):
+    # collector : fonction sans argument renvoyant un dict (les stats() existantes), lue à chaque export ;
+    # les valeurs numériques deviennent des jauges sleepy_<name>_<clé>
+    with _lock:
+        _collectors[name] = collector
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _labels(items) -> str:
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+
+def _gauges():
+    with _lock:
+        collectors = list(_collectors.items())
+    for name, collector in collectors:
+        try:
+            values = collector()
+        except Exception as e:
+            print(f"mesures '{name}' indisponibles : {e}")
+            continue
+        for key, value in _flatten(values):
+            yield f'{name}_{key}', value
+
+
+def _flatten(values, prefix=''):
+    for key, value in (values or {}).items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}_')
+        elif isinstance(value, (int, float)):
+            yield f'{prefix}{key}', float(value)
+
+
+def render() -> str:
+    # format d'exposition texte de Prometheus
+    lines = [f'# TYPE {PREFIX}_telemetry_enabled gauge', f'{PREFIX}_telemetry_enabled {int(_enabled)}']
+    with _lock:
+        histograms = {phase: (list(h.buckets), h.sum, h.count) for phase, h in _histograms.items()}
+        counters = dict(_counters)
+
+    if histograms:
+        lines += [f'# HELP {PREFIX}_phase_seconds Durée de chaque phase', f'# TYPE {PREFIX}_phase_seconds histogram']
+    for phase, (buckets, total, n) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket
+            lines.append(f'{PREFIX}_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_phase_seconds_sum{{phase="{phase}"}} {total}')
+        lines.append(f'{PREFIX}_phase_seconds_count{{phase="{phase}"}} {n}')
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {PREFIX}_{name} counter')
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'{PREFIX}_{name}{_labels(labels)} {value}')
+
+    for name, value in _gauges():
+        lines += [f'# TYPE {PREFIX}_{name} gauge', f'{PREFIX}_{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot() -> dict:
+    # version lisible pour la page d'administration : quantiles estimés en millisecondes
+    with _lock:
+        phases = {phase: {'count': h.count, 'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                          **{f'p{int(q * 100)}_ms': h.quantile(q) * 1000 for q in (0.5, 0.9, 0.99)}}
+                  for phase, h in sorted(_histograms.items())}
+        counters = {name + _labels(labels): value for (name, labels), value in sorted(_counters.items())}
+    return {'enabled': _enabled, 'phases': phases, 'counters': counters, 'gauges': dict(_gauges())}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    # /metrics dans un thread, pour les processus sans serveur HTTP à eux (Streamlit)
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='sleepy-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,65 @@
+import os
+import threading
+
+import audit
+
+
+def test_group_commit_and_reader(tmp_path):
+    path = str(tmp_path / 'requests.jsonl')
+    log = audit.AuditLog(path)
+    for i in range(1000):
+        assert log.log('prediction', source='test', label='Insomnia' if i % 4 else 'Healthy',
+                       inputs={'Age': 30 + i % 40}, timings={'predict_ms': 0.1})
+    assert log.flush(5)
+    log.close()
+    stats = log.stats()
+    assert stats['written'] == 1000 and stats['dropped'] == 0
+    # quelques écritures pour tout le lot, pas une par événement
+    assert stats['batches'] < 20
+    assert stats['fsyncs'] >= 1
+
+    df = audit.read(path)
+    assert len(df) == 1000
+    assert {'ts', 'event', 'label', 'inputs.Age', 'timings.predict_ms'} <= set(df.columns)
+    summary = audit.summary(df)
+    assert summary['label'] == {'Insomnia': 750, 'Healthy': 250}
+    assert summary['event'] == {'prediction': 1000}
+
+
+def test_rotation(tmp_path):
+    path = str(tmp_path / 'requests.jsonl')
+    log = audit.AuditLog(path, max_bytes=4096, batch_size=16, compress=True)
+    for i in range(500):
+        log.log('prediction', label='Healthy', inputs={'Age': i})
+        if i % 50 == 0:
+            log.flush(5)
+    log.close()
+    assert log.stats()['rotations'] > 1
+    files = audit.log_files(path)
+    assert any(name.endswith('.jsonl.gz') for name in files)
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+    # anciens fichiers compressés et fichier courant : aucun événement perdu ni lu deux fois
+    assert sorted(record['inputs']['Age'] for record in audit.iter_records(path)) == list(range(500))
+
+
+def test_drop_policy_when_queue_is_full(tmp_path):
+    log = audit.AuditLog(str(tmp_path / 'requests.jsonl'), max_queue=4)
+    writing, release = threading.Event(), threading.Event()
+    write = log._write
+
+    def slow_write(batch):
+        # le thread d'écriture reste bloqué sur le premier lot : la file se remplit
+        writing.set()
+        release.wait(5)
+        write(batch)
+
+    log._write = slow_write
+    log.log('prediction')
+    assert writing.wait(5)
+    results = [log.log('prediction') for _ in range(10)]
+    assert results == [True] * 4 + [False] * 6
+    release.set()
+    assert log.flush(5)
+    log.close()
+    assert log.stats()['dropped'] == 6
+    assert log.stats()['written'] == 5
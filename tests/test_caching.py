@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+import caching
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # horloge manuelle : time.monotonic (LRUCache) et time.time (ReportCache)
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(caching.time, 'time', lambda: now[0])
+    return now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = caching.LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_ttl(clock):
+    cache = caching.LRUCache(ttl=60)
+    cache.set('a', 1)
+    clock[0] += 59
+    assert cache.get('a') == 1
+    clock[0] += 2
+    assert cache.get('a', 'absent') == 'absent'
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1
+
+
+def test_lru_counters():
+    cache = caching.LRUCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'valeur'
+
+    assert cache.get_or_compute(('features', 1), compute) == 'valeur'
+    assert cache.get_or_compute(('features', 1), compute) == 'valeur'
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+
+@pytest.fixture
+def report_cache(tmp_path):
+    def make(**options):
+        return caching.ReportCache(str(tmp_path / 'reports.db'), **options)
+    return make
+
+
+def test_report_cache_persists(report_cache):
+    report_cache().set('clé', 'rapport')
+    assert report_cache().get('clé') == 'rapport'
+
+
+def test_report_cache_evicts_by_age(report_cache, clock):
+    cache = report_cache(max_age=3600)
+    cache.set('ancien', 'rapport')
+    clock[0] += 3601
+    assert cache.get('ancien') is None
+    cache.set('récent', 'rapport')
+    assert len(cache) == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_report_cache_evicts_by_size(report_cache, clock):
+    # au-delà de max_entries : le moins récemment lu part
+    cache = report_cache(max_entries=2)
+    cache.set('a', 'A')
+    clock[0] += 1
+    cache.set('b', 'B')
+    clock[0] += 1
+    assert cache.get('a') == 'A'
+    clock[0] += 1
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+    assert cache.stats()['evictions'] == 1
+
+
+def test_single_flight_shares_one_computation(report_cache):
+    cache = report_cache()
+    n = 8
+    calls, results = [], []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'rapport'
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('clé', compute)))
+               for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    # le premier appel calcule, les autres attendent son résultat
+    deadline = time.monotonic() + 5
+    while cache.single_flight.shared < n - 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == ['rapport'] * n
+    assert cache.stats()['shared_in_flight'] == n - 1
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import chat_schema
+import local_extractor
+
+REPLY = {
+    "user_interaction": {"message_to_user": "Merci ! Combien d'heures dormez-vous ?", "missing_fields": []},
+    "data_extraction": {"Gender": "Male", "Age": 43},
+    "metadata": {"validity_check": {"is_valid": True, "errors": []}, "confidence_score": 0.9,
+                 "ready_for_analysis": False},
+}
+
+
+def test_code_fence_and_surrounding_text():
+    text = "Voici la réponse :\n```json\n" + json.dumps(REPLY) + "\n```\nBonne journée"
+    assert chat_schema.extract_json(text) == REPLY
+    reply, status = chat_schema.parse_chat_response(text, {})
+    assert status == 'repaired'
+    assert reply["data_extraction"] == {"Gender": "Male", "Age": 43}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"data_extraction": {"Age": 43, "Occupation": "Nur', {"data_extraction": {"Age": 43, "Occupation": "Nur"}}),
+    ('{"a": [1, 2,', {"a": [1, 2]}),
+    ('{"a": 1, "b": tr', {"a": 1, "b": None}),
+    ('{"a": 1, "b"', {"a": 1}),
+])
+def test_truncated_json_is_repaired(text, expected):
+    assert chat_schema.extract_json(text) == expected
+
+
+def test_python_literals_and_trailing_commas():
+    assert chat_schema.loads_lenient('{"a": None, "b": True, "c": [1, 2,],}') == {"a": None, "b": True, "c": [1, 2]}
+
+
+def test_nothing_to_recover():
+    assert chat_schema.extract_json("désolé, je n'ai pas compris") is None
+    reply, status = chat_schema.parse_chat_response("désolé, je n'ai pas compris", {"Gender": "Male"})
+    assert status == 'unparseable'
+    assert reply["metadata"]["ready_for_analysis"] is False
+    assert reply["user_interaction"]["missing_fields"][0] == 'Age'
+
+
+def test_fields_are_normalized_and_bounded():
+    clean, errors = chat_schema.validate_extraction({
+        "Gender": "femme", "Sleep Duration": "6,5 h", "Blood Pressure": "12/8", "BMI Category": "surpoids",
+        "Age": 300, "Heart Rate": True, "Stress Level": 7.5, "Quality of Sleep": None, "Inconnu": 1,
+    })
+    assert clean == {"Gender": "Female", "Sleep Duration": 6.5, "Blood Pressure": "120/80",
+                     "BMI Category": "Overweight"}
+    assert set(errors) == {"Age", "Heart Rate", "Stress Level"}
+
+
+def test_invalid_fields_are_asked_again():
+    # seules les valeurs refusées sont redemandées ; les autres champs de la réponse sont gardés
+    reply = dict(REPLY, data_extraction={"Age": 300, "Stress Level": 7},
+                 metadata=dict(REPLY["metadata"], ready_for_analysis=True))
+    result, status = chat_schema.parse_chat_response(json.dumps(reply), {"Gender": "Male"})
+    assert status == 'invalid_fields'
+    assert result["data_extraction"] == {"Stress Level": 7}
+    assert result["user_interaction"]["message_to_user"] == chat_schema.reask_message(["Age"])
+    assert local_extractor.FIELD_LABELS["Age"] in result["user_interaction"]["message_to_user"]
+    assert result["user_interaction"]["missing_fields"][0] == "Age"
+    assert result["metadata"]["validity_check"]["is_valid"] is False
+    assert result["metadata"]["ready_for_analysis"] is False
+
+
+def test_valid_reply_is_kept():
+    result, status = chat_schema.parse_chat_response(json.dumps(REPLY), {})
+    assert status == 'ok'
+    assert result["user_interaction"]["message_to_user"] == REPLY["user_interaction"]["message_to_user"]
+    assert "Gender" not in result["user_interaction"]["missing_fields"]
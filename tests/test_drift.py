@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+import dataset
+import drift
+import sleep_model
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), dataset.DATASET_PATH)
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return drift.reference(DATASET_PATH)
+
+
+@pytest.fixture(scope='module')
+def rows():
+    return dataset.load(DATASET_PATH).sample(2000, random_state=0).to_dict(orient='records')
+
+
+def shifted(rows):
+    # un profil sur trois déformé comme par des saisies du chat (âges hors plage, nuits très courtes, métiers inconnus)
+    rng = np.random.default_rng(0)
+    rows = [dict(row) for row in rows]
+    for row in rows[::3]:
+        row['Age'] = int(rng.integers(60, 90))
+        row['Sleep Duration'] = float(rng.choice([0.5, 2.0, 3.5, 11.0]))
+        row['Occupation'] = str(rng.choice(['Chef', 'Student', 'Retired', 'Developer', 'Pilot']))
+    return rows
+
+
+def monitor_scores(reference, rows):
+    monitor = drift.DriftMonitor(reference)
+    for row in rows:
+        monitor.observe(sleep_model.canonical_features(row))
+    return monitor.scores()
+
+
+def test_training_sample_does_not_drift(reference, rows):
+    scores = monitor_scores(reference, rows)
+    assert scores['samples'] == len(rows)
+    assert scores['status'] == 'ok'
+    assert scores['max_psi'] < drift.PSI_WARNING
+    for column in sleep_model.NUMERIC_FEATURES:
+        assert scores['features'][column]['ks'] < 0.05, column
+    assert scores['features']['Occupation']['unknown_rate'] == 0.0
+
+
+def test_shifted_sample_drifts(reference, rows):
+    scores = monitor_scores(reference, shifted(rows))
+    assert scores['status'] == 'alert'
+    for column in ('Age', 'Sleep Duration', 'Occupation'):
+        assert scores['features'][column]['psi'] > drift.PSI_ALERT, column
+    assert scores['features']['Age']['ks'] > 0.2
+    assert scores['features']['Age']['above_range_rate'] > 0.2
+    assert scores['features']['Occupation']['unknown_rate'] == pytest.approx(1 / 3, abs=0.01)
+    assert scores['features']['Stress Level']['psi'] < drift.PSI_WARNING
+
+
+def test_too_few_samples(reference, rows):
+    assert monitor_scores(reference, shifted(rows)[:drift.MIN_SAMPLES - 1])['status'] == 'insufficient'
+
+
+def test_reset(reference, rows):
+    monitor = drift.DriftMonitor(reference)
+    for row in rows[:drift.BUFFER_SIZE * 2 + 10]:
+        monitor.observe(sleep_model.canonical_features(row))
+    monitor.reset()
+    assert monitor.scores()['samples'] == 0
@@ -0,0 +1,92 @@
+import types
+
+import httpx
+import pytest
+
+import llm_gateway
+
+
+class APIError(Exception):
+    # comme google.genai.errors.APIError : code HTTP dans .code
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FailingModels:
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, **request):
+        self.calls += 1
+        raise self.error
+
+
+def gateway(error, failure_threshold=3):
+    client = types.SimpleNamespace(models=FailingModels(error))
+    return client, llm_gateway.LLMGateway(lambda: client, max_retries=2, backoff=0.001,
+                                          breaker=llm_gateway.CircuitBreaker(failure_threshold=failure_threshold))
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (httpx.ConnectError("refusée"), True),
+    (httpx.ReadTimeout("délai"), True),
+    (httpx.RemoteProtocolError("coupée"), True),
+    (ConnectionResetError(), True),
+    (APIError(429), True),
+    (APIError(503), True),
+    (APIError(400), False),
+    (APIError(403), False),
+    (ValueError("bug"), False),
+])
+def test_is_retryable(error, retryable):
+    assert llm_gateway.is_retryable(error) is retryable
+
+
+def test_network_errors_are_retried_and_open_the_circuit():
+    client, gw = gateway(httpx.ConnectError("refusée"))
+    for _ in range(3):
+        with pytest.raises(llm_gateway.LLMError):
+            gw.generate(model="m", contents=[])
+    assert gw.stats()['retries'] > 0
+    assert gw.breaker.state == "open"
+    calls = client.models.calls
+    with pytest.raises(llm_gateway.LLMUnavailable):
+        gw.generate(model="m", contents=[])
+    assert client.models.calls == calls
+
+
+def test_client_errors_keep_the_circuit_closed():
+    # 400 : le service a répondu, la requête est fautive ; ni nouvel essai ni ouverture du circuit
+    client, gw = gateway(APIError(400))
+    for _ in range(5):
+        with pytest.raises(llm_gateway.LLMError):
+            gw.generate(model="m", contents=[])
+    assert client.models.calls == 5
+    assert gw.breaker.state == "closed"
+
+
+def test_errors_without_status_open_the_circuit():
+    # pas de code HTTP : rien ne prouve que le service répond
+    client, gw = gateway(ValueError("réponse illisible"))
+    for _ in range(3):
+        with pytest.raises(llm_gateway.LLMError):
+            gw.generate(model="m", contents=[])
+    assert client.models.calls == 3
+    assert gw.breaker.state == "open"
+
+
+def test_breaker_half_open_probe():
+    now = [0.0]
+    breaker = llm_gateway.CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 10.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+import local_extractor
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'benchmarks', 'extractor_corpus.jsonl')
+
+
+def corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize('case', corpus(), ids=lambda case: case['text'][:40])
+def test_never_wrong_on_corpus(case):
+    # un champ extrait doit être celui attendu : le reste est laissé à Gemini
+    fields, _ = local_extractor.extract(case['text'])
+    for field, value in fields.items():
+        assert case['fields'].get(field) == value, field
+
+
+@pytest.mark.parametrize('text', [
+    "mon fils a 12 ans",
+    "il y a 3 ans je dormais 9h",
+    "mon médecin dit 120/80",
+    "le 12/05 je dormais mal",
+    "ma femme a 40 ans",
+])
+def test_third_party_and_dates_are_not_extracted(text):
+    fields, fully_parsed = local_extractor.extract(text)
+    assert not {'Age', 'Gender', 'Blood Pressure'} & set(fields)
+    assert not fully_parsed
+
+
+@pytest.mark.parametrize('text, wrong_fields', [
+    ("stress au travail depuis 2 ans", {'Stress Level'}),
+    ("je suis prof de sport depuis 12 ans", {'Physical Activity Level'}),
+    ("je dors pas 8h", {'Sleep Duration'}),
+    ("qualité moyenne depuis 3 mois", {'Quality of Sleep'}),
+    ("je fais jamais 30 minutes de sport", {'Physical Activity Level'}),
+])
+def test_elapsed_and_negated_numbers_are_not_extracted(text, wrong_fields):
+    # les mots entre le mot-clé et le nombre ne sont pas effacés : le message part chez Gemini
+    fields, fully_parsed = local_extractor.extract(text)
+    assert not wrong_fields & set(fields)
+    assert not fully_parsed
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("j'ai 43 ans", {'Age': 43}),
+    ("je suis un homme", {'Gender': 'Male'}),
+    ("je suis une femme de 29 ans", {'Gender': 'Female', 'Age': 29}),
+    ("tension 12/8", {'Blood Pressure': '120/80'}),
+    ("je dors 6h30 par nuit", {'Sleep Duration': 6.5}),
+    ("mon stress est à 7", {'Stress Level': 7}),
+    ("mon rythme cardiaque au repos est de 58", {'Heart Rate': 58}),
+    ("je dors 7h, stress 6, tension 120/80", {'Sleep Duration': 7.0, 'Stress Level': 6, 'Blood Pressure': '120/80'}),
+])
+def test_fully_parsed(text, expected):
+    fields, fully_parsed = local_extractor.extract(text)
+    assert fields == expected
+    assert fully_parsed
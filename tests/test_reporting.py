@@ -0,0 +1,87 @@
+import types
+
+import pytest
+
+import caching
+import llm_gateway
+import reporting
+
+USER_DATA = {'Gender': 'Male', 'Age': 43, 'Occupation': 'Doctor', 'Sleep Duration': 6.0, 'Quality of Sleep': 5,
+             'Physical Activity Level': 30, 'Stress Level': 7, 'BMI Category': 'Overweight',
+             'Blood Pressure': '130/85', 'Heart Rate': 75, 'Daily Steps': 4000}
+
+
+class FakeGateway:
+    # rejoue des morceaux de texte ; une exception dans la liste est levée à son tour
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.streams = 0
+
+    def client(self):
+        return object()
+
+    def stream(self, **request):
+        self.streams += 1
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield types.SimpleNamespace(text=chunk, usage_metadata=None)
+
+    def generate(self, **request):
+        return types.SimpleNamespace(text="rapport", usage_metadata=None)
+
+
+@pytest.fixture
+def generator(tmp_path):
+    def make(chunks):
+        return reporting.ReportGenerator(FakeGateway(chunks), caching.ReportCache(str(tmp_path / 'reports.db')))
+    return make
+
+
+def stream(generator):
+    timings = {}
+    return list(generator.stream_gemini_analysis(USER_DATA, 'Insomnia', timings)), timings
+
+
+def test_stream_is_cached(generator):
+    report = generator(["Bonjour", " !"])
+    chunks, timings = stream(report)
+    assert chunks == ["Bonjour", " !"]
+    assert {'time_to_first_token', 'total_time'} <= set(timings)
+    assert stream(report)[0] == ["Bonjour !"]
+    assert report.gateway.streams == 1
+
+
+@pytest.mark.parametrize('chunks', [[], [""]])
+def test_empty_stream(generator, chunks):
+    report = generator(chunks)
+    result, timings = stream(report)
+    assert result == ["Erreur lors de l'analyse : réponse vide du modèle"]
+    assert 'time_to_first_token' not in timings
+    assert len(report.cache) == 0
+    assert not report.cache.single_flight._calls
+
+
+def test_gateway_error_before_first_chunk_gives_fallback(generator):
+    report = generator([llm_gateway.LLMUnavailable("circuit ouvert")])
+    result, _ = stream(report)
+    assert len(result) == 1
+    assert "momentanément indisponible" in result[0]
+    assert len(report.cache) == 0
+
+
+def test_gateway_error_mid_stream(generator):
+    report = generator(["Bonjour", llm_gateway.LLMTimeout("échéance dépassée")])
+    result, _ = stream(report)
+    assert result == ["Bonjour", "\n\nErreur lors de l'analyse : échéance dépassée"]
+    assert len(report.cache) == 0
+    assert not report.cache.single_flight._calls
+
+
+def test_abandoned_stream_releases_single_flight(generator):
+    report = generator(["Bonjour", " !"])
+    chunks = report.stream_gemini_analysis(USER_DATA, 'Insomnia')
+    next(chunks)
+    chunks.close()
+    assert not report.cache.single_flight._calls
@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+import sessions
+
+
+@pytest.fixture
+def store(tmp_path):
+    return sessions.SessionStore(str(tmp_path), budget=20_000, resident_turns=4, max_age=3600)
+
+
+def fill(session, n=20):
+    for i in range(n):
+        session.append("user" if i % 2 == 0 else "assistant", f"message {i} " + "x" * 1000, in_history=True)
+
+
+def test_compact_archives_over_budget(store):
+    session = store.get(store.new_id())
+    fill(session)
+    session.set_report("rapport " + "y" * 20_000)
+    store.compact(session)
+    assert len(session.turns) == 4
+    assert session.archived_turns == 16
+    assert session.report_archived and session.report_text == ''
+    assert session.nbytes <= store.budget
+    assert [turn.text for turn in session.archived()] == [f"message {i} " + "x" * 1000 for i in range(16)]
+    assert session.report().startswith("rapport ")
+
+
+def test_small_session_stays_in_memory(store):
+    session = store.get(store.new_id())
+    fill(session, 4)
+    store.compact(session)
+    assert session.archived_turns == 0 and len(session.turns) == 4
+
+
+def test_evict_and_restore(store):
+    session_id = store.new_id()
+    session = store.get(session_id)
+    fill(session)
+    session.set_report("rapport " + "y" * 20_000)
+    store.compact(session)
+    history = session.chat_history()
+
+    store.evict(session_id)
+    assert store.stats()['sessions'] == 0
+    restored = store.get(session_id)
+    assert restored is not session
+    assert store.restored == 1
+    assert [turn.text for turn in restored.turns] == [turn.text for turn in session.turns]
+    assert len(restored.archived()) == 16
+    assert restored.archived_history == session.archived_history
+    assert restored.chat_history() == history
+    assert restored.report().startswith("rapport ")
+
+
+def test_reset_report_is_not_restored(store):
+    session_id = store.new_id()
+    session = store.get(session_id)
+    session.set_report("ancien rapport")
+    session.archive_report()
+    session.set_report("")
+    store.evict(session_id)
+    assert store.get(session_id).report() == ''
+
+
+def test_purge_by_age(store):
+    session_id = store.new_id()
+    store.get(session_id).set_report("rapport")
+    store.evict(session_id)
+    now = time.time()
+    assert store.purge(now) == 0
+    old = now - store.max_age - 1
+    for name in os.listdir(store.directory):
+        os.utime(os.path.join(store.directory, name), (old, old))
+    assert store.purge(now) == 1
+    assert store.get(session_id).report() == ''
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+import pytest
+
+import dataset
+import sleep_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_PATH = os.path.join(ROOT, dataset.DATASET_PATH)
+
+
+@pytest.fixture(scope='module')
+def artifacts():
+    path = os.path.join(ROOT, sleep_model.ARTIFACTS_PATH)
+    artifacts = sleep_model.load_artifacts(path) if os.path.exists(path) else None
+    if artifacts is None or 'model' not in artifacts:
+        pytest.skip("pipeline sklearn de référence absent (python train.py)")
+    return artifacts
+
+
+@pytest.fixture(scope='module')
+def full_dataset():
+    # parité sur tout le dataset, comme python sleep_model.py check
+    return dataset.load(DATASET_PATH)
+
+
+def assert_parity(result, rows):
+    assert result['rows'] == rows
+    assert result['mismatches'] == 0
+    assert result['batch_mismatches'] == 0
+    assert result['max_proba_error'] <= 1e-4
+
+
+def test_fast_path_matches_pipeline(artifacts, full_dataset):
+    assert_parity(sleep_model.check_fast_path(artifacts, full_dataset), len(full_dataset))
+
+
+def test_compact_matches_pipeline(artifacts, full_dataset):
+    directory = os.path.join(ROOT, sleep_model.COMPACT_PATH)
+    if not os.path.isdir(directory):
+        pytest.skip("artefact compact absent (python sleep_model.py export)")
+    predictor = sleep_model.load_compact(directory)['predictor']
+    assert_parity(sleep_model.check_fast_path(artifacts, full_dataset, predictor), len(full_dataset))
+
+
+RECORDS = [
+    {'Age': 43, 'Blood Pressure': '130/85', 'BMI Category': 'Normal Weight'},
+    {'Age': 'quarante'},
+    {'Blood Pressure': '130'},
+    {'Age': None, 'Blood Pressure': '', 'Sleep Duration': float('nan')},
+    {'Age': '52', 'Sleep Duration': '6.5', 'Gender': 'Female', 'Occupation': None},
+    {'Heart Rate': 'x', 'Blood Pressure': 'illisible'},
+]
+
+
+def test_canonical_frame_matches_canonical_features(full_dataset):
+    # lot vectorisé et prédiction unitaire : mêmes valeurs par défaut, même découpage, mêmes erreurs
+    for df in (pd.DataFrame.from_records(RECORDS), full_dataset.head(2000)):
+        features, errors = sleep_model.canonical_frame(df)
+        expected, expected_errors = {}, {}
+        for label, user_data in zip(df.index, df.to_dict('records')):
+            try:
+                expected[label] = sleep_model.canonical_features(user_data)
+            except ValueError as e:
+                expected_errors[label] = str(e)
+        assert errors == expected_errors
+        assert list(features.index) == list(expected)
+        assert [tuple(row) for row in features.itertuples(index=False)] == list(expected.values())
+
+
+def test_score_batch_reports_invalid_rows(artifacts):
+    scored = sleep_model.score_batch(RECORDS, artifacts)
+    assert scored[sleep_model.PREDICTION_COLUMN].notna().tolist() == [True, False, False, True, True, False]
+    assert scored[sleep_model.ERROR_COLUMN].tolist()[1:3] == [
+        "Age invalide : 'quarante'",
+        "Blood Pressure invalide : '130' (format Sys/Dia attendu, ex : 120/80)",
+    ]
+    assert scored[sleep_model.ERROR_COLUMN].iloc[5].startswith("Blood Pressure invalide")
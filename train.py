@@ -0,0 +1,518 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import sleep_model
+
+# entraînement reproductible du modèle (remplace les cellules GridSearchCV + joblib.dump du notebook) :
+#
+#   python train.py                         # Sleep_Data_Sampled.csv -> models/<version>/
+#   python train.py --data big.csv --promote  # et remplace les artefacts utilisés par l'application
+#
+# 1. même préparation que l'application (sleep_model.prepare_features : tension découpée,
+#    "Normal Weight" -> "Normal") et découpage stratifié entraînement / validation / test
+# 2. recherche aléatoire par divisions successives (HalvingRandomSearchCV) : beaucoup de candidats
+#    évalués sur peu de lignes, seuls les meilleurs ont droit à plus de données
+# 3. nombre d'arbres choisi par arrêt précoce sur la validation, calibration des probabilités sur la validation
+# 4. ré-entraînement sur entraînement + validation, évaluation sur le test jamais vu
+# 5. artefact versionné (pickle + format compact) et metrics.json
+#
+# --streaming : même chaîne pour les fichiers plus gros que la mémoire (CSV ou Parquet lus par morceaux),
+# voir train_streaming()
+
+MODELS_DIR = 'models'
+TARGET = 'Sleep Disorder'
+
+# espace de recherche ; n_estimators est fixé par l'arrêt précoce, pas par la recherche
+SEARCH_SPACE = {
+    'learning_rate': ('loguniform', 0.02, 0.3),
+    'max_depth': ('randint', 3, 9),
+    'min_child_weight': ('loguniform', 0.5, 10),
+    'subsample': ('uniform', 0.6, 1.0),
+    'colsample_bytree': ('uniform', 0.5, 1.0),
+    'reg_lambda': ('loguniform', 0.1, 10),
+}
+SEARCH_ESTIMATORS = 200
+
+
+def param_distributions(space=SEARCH_SPACE):
+    from scipy import stats
+
+    distributions = {}
+    for name, (kind, low, high) in space.items():
+        if kind == 'loguniform':
+            distributions[name] = stats.loguniform(low, high)
+        elif kind == 'uniform':
+            distributions[name] = stats.uniform(low, high - low)
+        elif kind == 'randint':
+            distributions[name] = stats.randint(low, high)
+        else:
+            raise ValueError(f"distribution inconnue : {kind}")
+    return distributions
+
+
+def load_dataset(path):
+    # renvoie (lignes brutes, features préparées, cible)
+    df = dataset.load(path)
+    if TARGET not in df.columns:
+        raise ValueError(f"'{path}' : colonne '{TARGET}' manquante")
+    df = df[df[TARGET].notna()].reset_index(drop=True)
+    return df, sleep_model.prepare_features(df), df[TARGET].to_numpy()
+
+
+def make_preprocessor():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    # identique au pipeline du notebook : FastPredictor et l'artefact compact en dépendent
+    return ColumnTransformer(transformers=[
+        ('num', StandardScaler(), sleep_model.NUMERIC_FEATURES),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), sleep_model.CATEGORICAL_FEATURES),
+    ])
+
+
+def make_classifier(seed, n_jobs, **params):
+    from xgboost import XGBClassifier
+
+    return XGBClassifier(eval_metric='mlogloss', tree_method='hist', random_state=seed, n_jobs=n_jobs, **params)
+
+
+def sha256_file(path):
+    return sleep_model._sha256(path)
+
+
+def search(x_train, y_train, args):
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV
+
+    # les candidats tournent en parallèle (n_jobs de la recherche), chaque XGBoost sur un seul thread
+    searcher = HalvingRandomSearchCV(
+        make_classifier(args.seed, 1, n_estimators=SEARCH_ESTIMATORS),
+        param_distributions(), n_candidates=args.candidates, factor=args.factor, resource='n_samples',
+        min_resources=args.min_resources, cv=args.cv, scoring='neg_log_loss', n_jobs=args.n_jobs,
+        random_state=args.seed, refit=False)
+    start = time.perf_counter()
+    searcher.fit(x_train, y_train)
+    results = searcher.cv_results_
+    return searcher.best_params_, {
+        'method': 'HalvingRandomSearchCV',
+        'candidates': int(searcher.n_candidates_[0]),
+        'iterations': int(searcher.n_iterations_),
+        'resources_per_iteration': [int(n) for n in searcher.n_resources_],
+        'fits': int(len(results['params']) * args.cv),
+        'best_params': {name: (value.item() if hasattr(value, 'item') else value)
+                        for name, value in searcher.best_params_.items()},
+        'best_cv_log_loss': float(-searcher.best_score_),
+        'duration_s': time.perf_counter() - start,
+    }
+
+
+class Evaluation:
+    # métriques cumulées morceau par morceau : matrice de confusion et somme des log-loss suffisent
+
+    def __init__(self, classes):
+        self.classes = classes
+        self.confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+        self.log_loss_sum = 0.0
+
+    def update(self, probabilities, y):
+        np.add.at(self.confusion, (y, probabilities.argmax(axis=1)), 1)
+        self.log_loss_sum -= np.log(np.clip(probabilities[np.arange(len(y)), y], 1e-15, None)).sum()
+
+    def metrics(self) -> dict:
+        rows = int(self.confusion.sum())
+        true_positives = np.diag(self.confusion)
+        predicted = self.confusion.sum(axis=0)
+        actual = self.confusion.sum(axis=1)
+        f1 = np.divide(2 * true_positives, predicted + actual, out=np.zeros(len(self.classes)),
+                       where=(predicted + actual) > 0)
+        return {
+            'rows': rows,
+            'accuracy': float(true_positives.sum() / rows),
+            'macro_f1': float(f1.mean()),
+            'log_loss': float(self.log_loss_sum / rows),
+            'f1_by_class': {str(c): float(f) for c, f in zip(self.classes, f1)},
+            'confusion_matrix': self.confusion.tolist(),
+        }
+
+
+def evaluate(pipeline, x, y, classes):
+    evaluation = Evaluation(classes)
+    evaluation.update(pipeline.predict_proba(x), y)
+    return evaluation.metrics()
+
+
+def train(args):
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import LabelEncoder
+
+    timings = {}
+    start = time.perf_counter()
+    raw, x, labels = load_dataset(args.data)
+    le = LabelEncoder()
+    y = le.fit_transform(labels)
+    timings['load_s'] = time.perf_counter() - start
+
+    # test : jamais vu avant l'évaluation finale ; validation : arrêt précoce et calibration
+    x_rest, x_test, y_rest, y_test = train_test_split(x, y, test_size=args.test_size, stratify=y,
+                                                      random_state=args.seed)
+    x_train, x_val, y_train, y_val = train_test_split(x_rest, y_rest, test_size=args.val_size, stratify=y_rest,
+                                                      random_state=args.seed)
+
+    # préparation ajustée une fois sur l'entraînement puis partagée par tous les candidats
+    # (moyenne / écart-type et catégories : pas de quoi fausser la comparaison entre candidats)
+    preprocessor = make_preprocessor().fit(x_train)
+    xt_train, xt_val = preprocessor.transform(x_train), preprocessor.transform(x_val)
+
+    best_params, search_metrics = search(xt_train, y_train, args)
+    timings['search_s'] = search_metrics['duration_s']
+
+    start = time.perf_counter()
+    classifier = make_classifier(args.seed, args.n_jobs, n_estimators=args.max_estimators,
+                                 early_stopping_rounds=args.early_stopping_rounds, **best_params)
+    classifier.fit(xt_train, y_train, eval_set=[(xt_val, y_val)], verbose=False)
+    n_estimators = int(classifier.best_iteration) + 1
+    timings['early_stopping_s'] = time.perf_counter() - start
+
+    # calibration sur la validation, que ce modèle n'a pas vue
+    calibration = sleep_model.temperature_calibration(
+        classifier.predict(xt_val, output_margin=True, iteration_range=(0, n_estimators)), y_val, le.classes_,
+        split='validation', rows=int(len(y_val)), dataset=os.path.basename(args.data))
+
+    # modèle final : entraînement + validation, même nombre d'arbres
+    start = time.perf_counter()
+    pipeline = Pipeline(steps=[
+        ('preprocessor', make_preprocessor()),
+        ('classifier', make_classifier(args.seed, args.n_jobs, n_estimators=n_estimators, **best_params)),
+    ])
+    pipeline.fit(x_rest, y_rest)
+    timings['final_fit_s'] = time.perf_counter() - start
+
+    test_metrics = evaluate(pipeline, x_test, y_test, le.classes_)
+    if args.refit_full:
+        # comme le notebook : modèle livré entraîné sur toutes les lignes (métriques de test estimées avant)
+        start = time.perf_counter()
+        pipeline.fit(x, y)
+        timings['full_refit_s'] = time.perf_counter() - start
+
+    artifacts = {'model': pipeline, 'label_encoder': le, 'calibration': calibration}
+    metrics = {
+        'dataset': {'path': os.path.abspath(args.data), 'sha256': sha256_file(args.data), 'rows': int(len(y)),
+                    'classes': {str(c): int(n) for c, n in zip(le.classes_, np.bincount(y))}},
+        'splits': {'train': int(len(y_train)), 'validation': int(len(y_val)), 'test': int(len(y_test)),
+                   'final_fit': int(len(y) if args.refit_full else len(y_rest))},
+        'search': search_metrics,
+        'early_stopping': {'max_estimators': args.max_estimators, 'rounds': args.early_stopping_rounds,
+                           'n_estimators': n_estimators},
+        'test': test_metrics,
+        'calibration': {key: calibration[key] for key in ('temperature', 'held_out_before', 'held_out_after')},
+        'timings': timings,
+        'seed': args.seed,
+        'versions': versions(),
+    }
+    # lignes brutes du test (tension en "Sys/Dia") : la vérification de l'artefact passe par canonical_features
+    return artifacts, metrics, raw.loc[x_test.index]
+
+
+# ---------- entraînement hors mémoire ----------
+
+def split_of(n_rows, chunk_index, args):
+    # 0 = entraînement, 1 = validation, 2 = test ; tirage fixé par (graine, numéro du morceau) :
+    # chaque passe sur le fichier retrouve le même découpage sans rien garder en mémoire
+    draw = np.random.default_rng([args.seed, chunk_index]).random(n_rows)
+    split = np.zeros(n_rows, dtype=np.int8)
+    split[draw < args.test_size + (1 - args.test_size) * args.val_size] = 1
+    split[draw < args.test_size] = 2
+    return split
+
+
+def iter_prepared(args):
+    # (numéro, lignes brutes, features préparées, cible texte, découpage) pour chaque morceau du fichier
+    for chunk_index, chunk in enumerate(dataset.iter_file(args.data, args.chunk_size)):
+        chunk = chunk[chunk[dataset.TARGET].notna()]
+        if len(chunk):
+            labels = chunk[dataset.TARGET].astype(str).to_numpy()
+            yield chunk_index, chunk, sleep_model.prepare_features(chunk), labels, split_of(len(chunk), chunk_index, args)
+
+
+class StreamingScan:
+    # première passe : statistiques du StandardScaler (partial_fit), vocabulaire de chaque catégorie,
+    # classes, et échantillon aléatoire borné des lignes d'entraînement pour la recherche d'hyperparamètres
+
+    def __init__(self, sample_size, seed):
+        from sklearn.preprocessing import StandardScaler
+
+        self.scaler = StandardScaler()
+        self.vocabularies = {column: set() for column in sleep_model.CATEGORICAL_FEATURES}
+        self.class_counts = {}
+        self.split_counts = np.zeros(3, dtype=np.int64)
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(seed)
+        self.sample = None
+        self.sample_keys = np.empty(0)
+
+    def update(self, x, labels, split):
+        for name, count in zip(*np.unique(labels, return_counts=True)):
+            self.class_counts[name] = self.class_counts.get(name, 0) + int(count)
+        self.split_counts += np.bincount(split, minlength=3)
+
+        train = split == 0
+        if not train.any():
+            return
+        x_train = x[train]
+        self.scaler.partial_fit(x_train[sleep_model.NUMERIC_FEATURES].to_numpy(dtype=np.float64))
+        for column, vocabulary in self.vocabularies.items():
+            vocabulary.update(x_train[column].unique())
+
+        # échantillon uniforme de taille fixe : on garde les lignes aux plus petites clés aléatoires
+        keys = np.concatenate([self.sample_keys, self.rng.random(int(train.sum()))])
+        candidates = x_train.assign(**{dataset.TARGET: labels[train]})
+        if self.sample is not None:
+            candidates = pd.concat([self.sample, candidates], ignore_index=True)
+        keep = np.argsort(keys)[:self.sample_size]
+        self.sample, self.sample_keys = candidates.iloc[keep].reset_index(drop=True), keys[keep]
+
+    def preprocessor(self, classes):
+        from sklearn.preprocessing import OneHotEncoder
+
+        # même ColumnTransformer que le mode en mémoire ; catégories imposées (triées, comme OneHotEncoder),
+        # puis moyenne / écart-type remplacés par ceux calculés sur toutes les lignes d'entraînement
+        preprocessor = make_preprocessor()
+        preprocessor.set_params(cat=OneHotEncoder(
+            categories=[sorted(self.vocabularies[column]) for column in sleep_model.CATEGORICAL_FEATURES],
+            handle_unknown='ignore'))
+        preprocessor.fit(self.sample[sleep_model.FEATURES])
+        scaler = preprocessor.named_transformers_['num']
+        for attribute in ('mean_', 'var_', 'scale_', 'n_samples_seen_'):
+            setattr(scaler, attribute, getattr(self.scaler, attribute))
+        return preprocessor
+
+
+def chunk_iterator(args, split, preprocessor, le, cache_dir):
+    import xgboost
+
+    class ChunkIterator(xgboost.DataIter):
+        # alimente un ExtMemQuantileDMatrix : un morceau encodé à la fois, pages quantifiées sur disque
+
+        def __init__(self):
+            super().__init__(cache_prefix=os.path.join(cache_dir, f'split{split}'))
+            self.chunks = None
+
+        def reset(self):
+            self.chunks = iter_prepared(args)
+
+        def next(self, input_data):
+            for _, _, x, labels, splits in self.chunks:
+                rows = splits == split
+                if rows.any():
+                    input_data(data=preprocessor.transform(x[rows]), label=le.transform(labels[rows]))
+                    return True
+            return False
+
+    return ChunkIterator()
+
+
+def peak_rss_mb():
+    import resource
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def train_streaming(args):
+    import tempfile
+
+    import xgboost
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import LabelEncoder
+
+    timings = {}
+    start = time.perf_counter()
+    scan = StreamingScan(args.search_rows, args.seed)
+    for _, _, x, labels, split in iter_prepared(args):
+        scan.update(x, labels, split)
+    le = LabelEncoder().fit(sorted(scan.class_counts))
+    preprocessor = scan.preprocessor(le.classes_)
+    timings['scan_s'] = time.perf_counter() - start
+
+    sample_y = le.transform(scan.sample[dataset.TARGET].to_numpy())
+    best_params, search_metrics = search(preprocessor.transform(scan.sample[sleep_model.FEATURES]), sample_y, args)
+    search_metrics['sample_rows'] = int(len(sample_y))
+    timings['search_s'] = search_metrics['duration_s']
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='sleepy-train-') as cache_dir:
+        train_matrix = xgboost.ExtMemQuantileDMatrix(chunk_iterator(args, 0, preprocessor, le, cache_dir),
+                                                     max_bin=args.max_bin)
+        val_matrix = xgboost.ExtMemQuantileDMatrix(chunk_iterator(args, 1, preprocessor, le, cache_dir),
+                                                   max_bin=args.max_bin, ref=train_matrix)
+        params = {'objective': 'multi:softprob', 'num_class': len(le.classes_), 'eval_metric': 'mlogloss',
+                  'tree_method': 'hist', 'max_bin': args.max_bin, 'seed': args.seed, **best_params}
+        if args.n_jobs > 0:
+            params['nthread'] = args.n_jobs
+        booster = xgboost.train(params, train_matrix, num_boost_round=args.max_estimators,
+                                evals=[(val_matrix, 'validation')], early_stopping_rounds=args.early_stopping_rounds,
+                                verbose_eval=False)
+        n_estimators = int(booster.best_iteration) + 1
+        booster = booster[:n_estimators]
+
+        # même objet que le mode en mémoire : XGBClassifier dans un Pipeline sklearn
+        booster_path = os.path.join(cache_dir, 'booster.ubj')
+        booster.save_model(booster_path)
+        classifier = make_classifier(args.seed, args.n_jobs)
+        classifier.load_model(booster_path)
+    timings['training_s'] = time.perf_counter() - start
+    pipeline = Pipeline(steps=[('preprocessor', preprocessor), ('classifier', classifier)])
+
+    # dernière passe : test évalué morceau par morceau, marges de validation pour la calibration
+    start = time.perf_counter()
+    evaluation = Evaluation(le.classes_)
+    val_margins, val_labels, test_rows = [], [], []
+    n_val_margins = n_test_rows = 0
+    for _, chunk, x, labels, split in iter_prepared(args):
+        test, val = split == 2, split == 1
+        if test.any():
+            evaluation.update(pipeline.predict_proba(x[test]), le.transform(labels[test]))
+            if n_test_rows < args.parity_rows:
+                test_rows.append(chunk[test].head(args.parity_rows - n_test_rows))
+                n_test_rows += len(test_rows[-1])
+        if val.any() and n_val_margins < args.calibration_rows:
+            rows = x[val].head(args.calibration_rows - n_val_margins)
+            val_margins.append(classifier.predict(preprocessor.transform(rows), output_margin=True))
+            val_labels.append(le.transform(labels[val][:len(rows)]))
+            n_val_margins += len(rows)
+    timings['evaluation_s'] = time.perf_counter() - start
+
+    calibration = sleep_model.temperature_calibration(
+        np.concatenate(val_margins), np.concatenate(val_labels), le.classes_,
+        split='validation', rows=n_val_margins, dataset=os.path.basename(args.data))
+
+    artifacts = {'model': pipeline, 'label_encoder': le, 'calibration': calibration}
+    metrics = {
+        'mode': 'streaming',
+        'dataset': {'path': os.path.abspath(args.data), 'sha256': sha256_file(args.data),
+                    'rows': int(scan.split_counts.sum()), 'classes': scan.class_counts},
+        'splits': {'train': int(scan.split_counts[0]), 'validation': int(scan.split_counts[1]),
+                   'test': int(scan.split_counts[2]), 'final_fit': int(scan.split_counts[0])},
+        'search': search_metrics,
+        'early_stopping': {'max_estimators': args.max_estimators, 'rounds': args.early_stopping_rounds,
+                           'n_estimators': n_estimators},
+        'test': evaluation.metrics(),
+        'calibration': {key: calibration[key] for key in ('temperature', 'held_out_before', 'held_out_after')},
+        'timings': timings,
+        'chunk_size': args.chunk_size,
+        'seed': args.seed,
+        'versions': versions(),
+    }
+    return artifacts, metrics, pd.concat(test_rows)
+
+
+def versions():
+    import sklearn
+    import xgboost
+
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'scikit-learn': sklearn.__version__, 'xgboost': xgboost.__version__}
+
+
+def save(artifacts, metrics, test_rows, args):
+    import joblib
+
+    directory = os.path.join(args.output, artifacts['version'])
+    if os.path.exists(directory):
+        raise FileExistsError(f"'{directory}' existe déjà")
+    os.makedirs(directory)
+
+    pickle_path = os.path.join(directory, sleep_model.ARTIFACTS_PATH)
+    compact_path = os.path.join(directory, sleep_model.COMPACT_PATH)
+    joblib.dump(artifacts, pickle_path)
+    sleep_model.export_compact(artifacts, compact_path)
+
+    # l'artefact compact doit donner exactement les mêmes prédictions que le pipeline
+    parity = sleep_model.check_fast_path(artifacts, test_rows.dropna().head(args.parity_rows),
+                                         sleep_model.load_compact(compact_path)['predictor'])
+    metrics['compact_parity'] = {key: parity[key] for key in ('rows', 'mismatches', 'batch_mismatches',
+                                                              'max_proba_error')}
+    with open(os.path.join(directory, 'metrics.json'), 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2, ensure_ascii=False)
+
+    if parity['mismatches'] or parity['batch_mismatches'] or parity['max_proba_error'] > 1e-4:
+        raise RuntimeError(f"l'artefact compact de '{directory}' diverge du pipeline")
+    return directory
+
+
+def promote(directory):
+    # remplace les artefacts chargés par l'application et le service
+    shutil.copyfile(os.path.join(directory, sleep_model.ARTIFACTS_PATH), sleep_model.ARTIFACTS_PATH)
+    staging = sleep_model.COMPACT_PATH + '.new'
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree(os.path.join(directory, sleep_model.COMPACT_PATH), staging)
+    shutil.rmtree(sleep_model.COMPACT_PATH, ignore_errors=True)
+    os.replace(staging, sleep_model.COMPACT_PATH)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entraînement du modèle Sleepy")
+    parser.add_argument('--data', default=sleep_model.DATASET_PATH)
+    parser.add_argument('-o', '--output', default=MODELS_DIR, help="dossier des versions")
+    parser.add_argument('--version', default=None, help="nom de la version (par défaut : date et heure UTC)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--val-size', type=float, default=0.15, help="part de la validation hors test")
+    parser.add_argument('--candidates', type=int, default=64, help="combinaisons tirées au départ")
+    parser.add_argument('--factor', type=int, default=3, help="à chaque tour : 1/factor des candidats, factor fois plus de lignes")
+    parser.add_argument('--min-resources', type=int, default=1000, help="lignes par candidat au premier tour")
+    parser.add_argument('--cv', type=int, default=3)
+    parser.add_argument('--max-estimators', type=int, default=1000)
+    parser.add_argument('--early-stopping-rounds', type=int, default=30)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--refit-full', action='store_true',
+                        help="modèle livré ré-entraîné sur tout le dataset, test compris (comme le notebook)")
+    parser.add_argument('--parity-rows', type=int, default=2000)
+    parser.add_argument('--streaming', action='store_true',
+                        help="fichier lu par morceaux (CSV ou Parquet) : mémoire bornée quelle que soit sa taille")
+    parser.add_argument('--chunk-size', type=int, default=dataset.DEFAULT_CHUNK_SIZE, help="avec --streaming")
+    parser.add_argument('--search-rows', type=int, default=50_000,
+                        help="avec --streaming : échantillon de lignes d'entraînement pour la recherche")
+    parser.add_argument('--calibration-rows', type=int, default=200_000, help="avec --streaming")
+    parser.add_argument('--max-bin', type=int, default=256, help="avec --streaming : quantiles par feature")
+    parser.add_argument('--promote', action='store_true', help=f"copier la version dans '{sleep_model.ARTIFACTS_PATH}' "
+                                                               f"et '{sleep_model.COMPACT_PATH}'")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.streaming and args.refit_full:
+        print("ERREUR : --refit-full n'est pas disponible avec --streaming.", file=sys.stderr)
+        return 1
+    artifacts, metrics, test_rows = train_streaming(args) if args.streaming else train(args)
+    artifacts['version'] = args.version or time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+    metrics['version'] = artifacts['version']
+    metrics['timings']['total_s'] = time.perf_counter() - start
+    metrics['peak_rss_mb'] = peak_rss_mb()
+
+    try:
+        directory = save(artifacts, metrics, test_rows, args)
+    except (FileExistsError, RuntimeError) as e:
+        print(f"ERREUR : {e}", file=sys.stderr)
+        return 1
+
+    if args.promote:
+        promote(directory)
+
+    print(json.dumps({key: metrics[key] for key in ('version', 'test', 'search', 'early_stopping', 'timings')},
+                     indent=2), file=sys.stderr)
+    print(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())